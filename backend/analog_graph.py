@@ -0,0 +1,116 @@
+"""
+In-memory cross-reference graph for interchangeable part lookups
+"""
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+class AnalogGraph:
+    """
+    Undirected graph of normalized part numbers.
+    
+    Every product links its article_key with each of its cross_keys, so
+    analogs are found transitively: A replaces B and B replaces C puts
+    A, B and C in one interchangeable group. Edges are reference counted
+    per product, which lets a single product be updated or removed
+    without rebuilding the whole graph.
+    """
+    
+    def __init__(self):
+        self._products = {}      # product_id -> (article_key, cross_keys)
+        self._edges = {}         # key -> {neighbour_key: refcount}
+        self._key_products = {}  # article_key -> set of product ids
+        self.ready = False
+        self.last_rebuild_ms = 0.0
+        self.last_rebuild_at = None
+    
+    def _link(self, a: str, b: str, delta: int):
+        for x, y in ((a, b), (b, a)):
+            neighbours = self._edges.setdefault(x, {})
+            count = neighbours.get(y, 0) + delta
+            if count > 0:
+                neighbours[y] = count
+            else:
+                neighbours.pop(y, None)
+                if not neighbours:
+                    del self._edges[x]
+    
+    def upsert_product(self, product_id: str, article_key: Optional[str], cross_keys: Optional[List[str]]):
+        """Add a product or replace its previous links"""
+        self.remove_product(product_id)
+        if not article_key:
+            return
+        
+        cross_keys = tuple(k for k in (cross_keys or []) if k and k != article_key)
+        self._products[product_id] = (article_key, cross_keys)
+        self._key_products.setdefault(article_key, set()).add(product_id)
+        for key in cross_keys:
+            self._link(article_key, key, 1)
+    
+    def remove_product(self, product_id: str):
+        """Drop a product and the links it contributed"""
+        entry = self._products.pop(product_id, None)
+        if not entry:
+            return
+        
+        article_key, cross_keys = entry
+        for key in cross_keys:
+            self._link(article_key, key, -1)
+        ids = self._key_products.get(article_key)
+        if ids:
+            ids.discard(product_id)
+            if not ids:
+                del self._key_products[article_key]
+    
+    def group(self, key: str, max_depth: Optional[int] = None, max_nodes: int = 10000) -> Dict[str, int]:
+        """Breadth-first walk from key, returns {key: depth} of the reachable group"""
+        if not key:
+            return {}
+        
+        depths = {key: 0}
+        queue = deque([key])
+        while queue and len(depths) < max_nodes:
+            current = queue.popleft()
+            depth = depths[current]
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for neighbour in self._edges.get(current, ()):
+                if neighbour not in depths:
+                    depths[neighbour] = depth + 1
+                    queue.append(neighbour)
+        return depths
+    
+    def analog_product_ids(self, key: str, max_depth: Optional[int] = None) -> List[str]:
+        """Ids of products interchangeable with key, nearest first (key's own products excluded)"""
+        depths = self.group(key, max_depth)
+        result = []
+        for analog_key, depth in sorted(depths.items(), key=lambda x: x[1]):
+            if depth == 0:
+                continue
+            result.extend(sorted(self._key_products.get(analog_key, ())))
+        return result
+    
+    def rebuild(self, products: Iterable[dict]):
+        """Replace the graph with links from products (dicts with id, article_key, cross_keys)"""
+        started = time.perf_counter()
+        self._products = {}
+        self._edges = {}
+        self._key_products = {}
+        for product in products:
+            self.upsert_product(product["id"], product.get("article_key"), product.get("cross_keys"))
+        
+        self.ready = True
+        self.last_rebuild_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.last_rebuild_at = datetime.now(timezone.utc).isoformat()
+    
+    def stats(self) -> dict:
+        """Graph size and last rebuild timing"""
+        return {
+            "ready": self.ready,
+            "products": len(self._products),
+            "keys": len(set(self._edges) | set(self._key_products)),
+            "edges": sum(len(n) for n in self._edges.values()) // 2,
+            "last_rebuild_ms": self.last_rebuild_ms,
+            "last_rebuild_at": self.last_rebuild_at
+        }
@@ -0,0 +1,233 @@
+"""
+Publish/subscribe hub for pushing live events to open connections.
+
+EventBus delivers within the current process (single worker);
+MongoEventBus relays every event through MongoDB so that all workers see it.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+EVENTS_COLLECTION_SIZE = 16 * 1024 * 1024  # bytes; the capped collection keeps the newest events
+RECONNECT_DELAY = 1  # seconds
+START_TIMEOUT = 10  # seconds start() waits for the first connection
+TAIL_LOOKBACK = 5  # seconds re-read on reconnect: ObjectIds of different workers are only ordered to the second
+CHANGE_STREAMS_UNSUPPORTED = 40573  # "$changeStream is only supported on replica sets"
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+class Subscription:
+    """
+    Events published to any of `topics` since subscribing, in publish order.
+
+    A subscriber that falls more than SUBSCRIPTION_QUEUE_SIZE events behind
+    has its backlog replaced by a single {"type": "resync"} event, telling
+    the client to refetch instead of blocking the publisher.
+    """
+
+    def __init__(self, bus: "EventBus", topics: Set[str]):
+        self.bus = bus
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(SUBSCRIPTION_QUEUE_SIZE)
+
+    def deliver(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.resync()
+
+    def resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait({"type": "resync"})
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    """Topic-based fan-out to every subscription of the current process"""
+
+    mode = "local"
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.delivered = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def subscribe(self, *topics: str) -> Subscription:
+        subscription = Subscription(self, set(topics))
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    async def publish(self, topic: str, event: dict):
+        self._deliver(topic, event)
+
+    def _deliver(self, topic: str, event: dict):
+        self.delivered += 1
+        for subscription in list(self._subscribers.get(topic, ())):
+            subscription.deliver(event)
+
+    def _resync_all(self):
+        """Tell every subscriber that events may have been missed"""
+        for subscription in {s for subs in self._subscribers.values() for s in subs}:
+            subscription.resync()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "topics": len(self._subscribers),
+            "subscriptions": len({s for subs in self._subscribers.values() for s in subs}),
+            "delivered": self.delivered,
+        }
+
+
+class MongoEventBus(EventBus):
+    """
+    Cross-worker fan-out: publish() inserts the event into a capped collection
+    and every worker follows that collection, delivering to its own
+    subscriptions (the publisher's included, so all workers see one order).
+
+    Following uses a change stream, or a tailable cursor where change streams
+    are unavailable (standalone mongod). The position - the change stream
+    resume token or the last seen _id - survives reconnects, so a dropped
+    connection does not lose events. If the position has aged out, all
+    subscribers get a resync event. The tailable cursor re-reads the last
+    TAIL_LOOKBACK seconds on reconnect and skips ids it already delivered.
+    """
+
+    def __init__(self, db, collection: str = "events", size: int = EVENTS_COLLECTION_SIZE):
+        super().__init__()
+        self.db = db
+        self.collection_name = collection
+        self.size = size
+        self.collection = db[collection]
+        self.mode = "changestream"
+        self.origin = f"{os.getpid()}"
+        self._resume_token = None
+        self._last_id = None
+        self._recent_ids = deque(maxlen=SUBSCRIPTION_QUEUE_SIZE * 10)
+        self._task: Optional[asyncio.Task] = None
+        self._started = None
+
+    async def start(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size)
+        except CollectionInvalid:
+            pass  # already exists
+        self._started = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._follow())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._started), START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Event bus could not connect, still retrying in the background")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def publish(self, topic: str, event: dict):
+        await self.collection.insert_one({
+            "topic": topic,
+            "event": event,
+            "origin": self.origin,
+            "created_at": datetime.now(timezone.utc)
+        })
+
+    def _mark_started(self):
+        if self._started and not self._started.done():
+            self._started.set_result(None)
+
+    async def _follow(self):
+        while True:
+            try:
+                if self.mode == "changestream":
+                    await self._watch()
+                else:
+                    await self._tail()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable, following events with a tailable cursor")
+                    self.mode = "tail"
+                    continue
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Event bus resume token expired, subscribers resync")
+                    self._resume_token = None
+                    self._resync_all()
+                    continue
+                logger.error(f"Event bus follow failed: {e}")
+            except Exception as e:
+                logger.error(f"Event bus follow failed: {e}")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        async with self.collection.watch(pipeline, resume_after=self._resume_token) as stream:
+            self._mark_started()
+            while True:
+                change = await stream.try_next()  # None after an empty await period
+                if change is not None:
+                    document = change["fullDocument"]
+                    self._deliver(document["topic"], document["event"])
+                # Also advances on empty batches (post-batch resume token)
+                self._resume_token = stream.resume_token
+
+    async def _tail(self):
+        if self._last_id is None:
+            newest = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+            self._last_id = newest["_id"] if newest else ObjectId.from_datetime(datetime.now(timezone.utc))
+            self._recent_ids.append(self._last_id)
+            self._mark_started()
+        else:
+            oldest = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", 1)])
+            if oldest and oldest["_id"] > self._last_id:
+                # Everything up to our position was overwritten: events may be missing
+                self._resync_all()
+
+        since = self._last_id.generation_time - timedelta(seconds=TAIL_LOOKBACK)
+        query = {"_id": {"$gt": ObjectId.from_datetime(since)}}
+        cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for document in cursor:
+                if document["_id"] in self._recent_ids:
+                    continue
+                self._last_id = document["_id"]
+                self._recent_ids.append(document["_id"])
+                self._deliver(document["topic"], document["event"])
+            await asyncio.sleep(0.1)
@@ -0,0 +1,39 @@
+"""
+Part number normalization for indexed article and cross-reference lookups
+"""
+import re
+from typing import List, Optional
+
+# Cyrillic letters that look like Latin ones - suppliers mix them freely
+LOOKALIKE_LETTERS = str.maketrans({
+    'А': 'A', 'В': 'B', 'Е': 'E', 'Ё': 'E', 'К': 'K', 'М': 'M', 'Н': 'H',
+    'О': 'O', 'Р': 'P', 'С': 'C', 'Т': 'T', 'У': 'Y', 'Х': 'X',
+})
+
+# Characters that are only formatting: spaces, dashes, dots, slashes
+SEPARATORS_RE = re.compile(r"[\s\-‐‑‒–—./\\]+")
+
+# Separators between articles in the free-text cross_articles field
+CROSS_SPLIT_RE = re.compile(r"[,;|\n\r\t]+")
+
+def normalize_article(article: Optional[str]) -> str:
+    """Normalize article to its lookup key: 'man-pg 001' and 'MAN/PG.001' -> 'MANPG001'"""
+    if not article:
+        return ""
+    key = article.upper().translate(LOOKALIKE_LETTERS)
+    return SEPARATORS_RE.sub("", key)
+
+def split_cross_articles(cross_articles: Optional[str]) -> List[str]:
+    """Split free-text cross_articles into a list of unique normalized keys"""
+    if not cross_articles:
+        return []
+    keys = []
+    for part in CROSS_SPLIT_RE.split(cross_articles):
+        key = normalize_article(part)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def article_prefix_query(key: str) -> dict:
+    """Anchored, case-sensitive prefix match that can be served by an index"""
+    return {"$regex": f"^{re.escape(key)}"}
@@ -0,0 +1,325 @@
+"""
+Streaming product import: rows are parsed incrementally and written as
+chunked bulk_write upserts keyed on article
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import itertools
+import json
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from openpyxl import load_workbook
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from part_numbers import normalize_article, split_cross_articles
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 10
+MAX_DIFF_SAMPLES = 10
+HEADER_SCAN_ROWS = 20  # supplier workbooks often have a title block above the header
+PARSE_BATCH_SIZE = 500  # rows read per worker-thread call
+
+ARTICLE_HEADERS = ("article", "Артикул")
+NAME_HEADERS = ("name", "Название")
+MANUFACTURER_HEADERS = ("manufacturer", "Производитель")
+CROSS_ARTICLES_HEADERS = ("cross_articles", "Кросс-артикулы")
+IMAGES_HEADERS = ("images", "Изображения")
+IMAGES_SEPARATOR = "|"
+
+# Column order of the product export; every column is accepted by the import
+EXPORT_FIELDS = ["article", "name", "price", "stock", "delivery_days", "description",
+                 "category_id", "image_url", "manufacturer", "cross_articles", "images"]
+
+NumberedRow = Tuple[int, dict]
+
+
+def iter_csv_rows(binary_file) -> Iterator[NumberedRow]:
+    """Yield (row number, row) of a ';'-separated UTF-8 CSV without reading the whole file into memory"""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    return enumerate(csv.DictReader(text, delimiter=";"), start=2)
+
+
+def iter_xlsx_rows(path) -> Iterator[NumberedRow]:
+    """
+    Yield (row number, row) from the first sheet of a workbook using the
+    read-only reader, which parses the sheet lazily in constant memory.
+    The header is the first of the top HEADER_SCAN_ROWS rows that names
+    both the article and the name column; blank rows are skipped.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = None
+        for row_num, values in enumerate(rows, start=1):
+            cells = [str(v).strip() if v is not None else "" for v in values]
+            if any(h in cells for h in ARTICLE_HEADERS) and any(h in cells for h in NAME_HEADERS):
+                header = cells
+                break
+            if row_num >= HEADER_SCAN_ROWS:
+                break
+        if header is None:
+            raise ValueError("не найдена строка заголовков (Артикул, Название)")
+
+        for row_num, values in enumerate(rows, start=row_num + 1):
+            if all(v is None or v == "" for v in values):
+                continue
+            yield row_num, {h: v for h, v in zip(header, values) if h}
+    finally:
+        workbook.close()
+
+
+def _has_column(row: dict, names: Tuple[str, ...]) -> bool:
+    return any(name in row for name in names)
+
+
+def _cell(row: dict, *names: str, default: str = "") -> str:
+    for name in names:
+        value = row.get(name)
+        if value is not None:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)  # spreadsheet numbers: 12345.0 -> "12345"
+            return str(value).strip()
+    return default
+
+
+def parse_product_row(row: dict) -> dict:
+    """
+    Convert an import row (English or Russian headers) into product fields.
+    Manufacturer, cross-articles and images are only set when the file has
+    those columns, so older price lists do not clear them.
+    """
+    article = _cell(row, *ARTICLE_HEADERS)
+    name = _cell(row, *NAME_HEADERS)
+    if not article or not name:
+        raise ValueError("отсутствует артикул или название")
+
+    price_str = _cell(row, "price", "Цена", default="0").replace(" ", "").replace(",", ".")
+    stock_str = _cell(row, "stock", "Остаток", default="0").replace(" ", "")
+    delivery_str = _cell(row, "delivery_days", "Доставка", default="3").replace(" ", "")
+
+    product_data = {
+        "name": name,
+        "article": article,
+        "article_key": normalize_article(article),
+        "price": float(price_str) if price_str else 0,
+        "stock": int(stock_str) if stock_str else 0,
+        "delivery_days": int(delivery_str) if delivery_str else 3,
+        "description": _cell(row, "description", "Описание"),
+        "category_id": _cell(row, "category_id", "Категория") or None,
+        "image_url": _cell(row, "image_url", "Изображение") or None,
+    }
+    if _has_column(row, MANUFACTURER_HEADERS):
+        product_data["manufacturer"] = _cell(row, *MANUFACTURER_HEADERS) or None
+    if _has_column(row, CROSS_ARTICLES_HEADERS):
+        cross_articles = _cell(row, *CROSS_ARTICLES_HEADERS) or None
+        product_data["cross_articles"] = cross_articles
+        product_data["cross_keys"] = split_cross_articles(cross_articles)
+    if _has_column(row, IMAGES_HEADERS):
+        images = _cell(row, *IMAGES_HEADERS).split(IMAGES_SEPARATOR)
+        product_data["images"] = [url.strip() for url in images if url.strip()]
+    return product_data
+
+
+def export_row(product: dict) -> dict:
+    """Product document -> export CSV row (the inverse of parse_product_row)"""
+    return {
+        "article": product.get("article", ""),
+        "name": product.get("name", ""),
+        "price": product.get("price", 0),
+        "stock": product.get("stock", 0),
+        "delivery_days": product.get("delivery_days", 3),
+        "description": product.get("description") or "",
+        "category_id": product.get("category_id") or "",
+        "image_url": product.get("image_url") or "",
+        "manufacturer": product.get("manufacturer") or "",
+        "cross_articles": product.get("cross_articles") or "",
+        "images": IMAGES_SEPARATOR.join(product.get("images") or []),
+    }
+
+
+def import_hash(product_data: dict) -> str:
+    """Content hash of a parsed row, stored on the product to detect unchanged rows"""
+    payload = json.dumps(product_data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ProductImporter:
+    """
+    Accumulates parsed rows and upserts them in chunks of chunk_size.
+
+    A row whose article already sits in the pending chunk flushes the chunk
+    first, so a repeated article is inserted once and then updated, exactly
+    as if rows were written one by one.
+
+    When on_chunk runs, `rows` counts exactly the rows whose writes are
+    committed, so an interrupted import can resume after that many rows
+    with the counters passed back in as `state`.
+
+    Each chunk first fetches the stored import_hash of its articles in one
+    query; rows whose hash matches are counted as unchanged and not written.
+    With dry_run nothing is written and imported/updated count the rows
+    that would be new/changed.
+    """
+
+    def __init__(self, collection, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 on_chunk: Optional[Callable[[List[str], "ProductImporter"], Awaitable[None]]] = None,
+                 state: Optional[dict] = None, dry_run: bool = False):
+        state = state or {}
+        self.collection = collection
+        self.chunk_size = max(1, chunk_size)
+        self.on_chunk = on_chunk
+        self.dry_run = dry_run
+        self.imported = state.get("imported", 0)
+        self.updated = state.get("updated", 0)
+        self.unchanged = state.get("unchanged", 0)
+        self.rows = state.get("rows", 0)
+        self.chunks = state.get("chunks", 0)
+        self.failed = state.get("total_errors", 0)
+        self.errors: List[str] = list(state.get("errors", []))
+        self.samples: Dict[str, List[str]] = {"new": [], "changed": [], **state.get("samples", {})}
+        # Distinct catalog articles seen in this file and articles this file adds;
+        # not persisted, so unknown after a resume
+        self.existing_articles = None if self.rows else set()
+        self.new_articles = set()
+        self._dry_run_hashes: Dict[str, str] = {}  # what a dry run would have written
+        self._pending: Dict[str, dict] = {}
+        self._pending_rows: Dict[str, int] = {}
+
+    def error(self, row_num: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Строка {row_num}: {message}")
+
+    async def add_row(self, row_num: int, row: dict):
+        try:
+            product_data = parse_product_row(row)
+        except Exception as e:
+            self.rows += 1
+            self.error(row_num, str(e))
+            return
+
+        article = product_data["article"]
+        if article in self._pending:
+            await self.flush()
+        self.rows += 1
+        self._pending[article] = product_data
+        self._pending_rows[article] = row_num
+        if len(self._pending) >= self.chunk_size:
+            await self.flush()
+
+    def _sample(self, kind: str, article: str):
+        if len(self.samples[kind]) < MAX_DIFF_SAMPLES and article not in self.samples[kind]:
+            self.samples[kind].append(article)
+
+    async def flush(self):
+        """Write the new and changed rows of the pending chunk with one unordered bulk_write"""
+        if not self._pending:
+            return
+        stored = {
+            p["article"]: p.get("import_hash")
+            async for p in self.collection.find(
+                {"article": {"$in": list(self._pending)}}, {"_id": 0, "article": 1, "import_hash": 1}
+            )
+        }
+        if self.existing_articles is not None:
+            self.existing_articles.update(a for a in stored if a not in self.new_articles)
+        stored.update(self._dry_run_hashes)
+
+        articles = []
+        ops = []
+        for article, data in self._pending.items():
+            row_hash = import_hash(data)
+            if article not in stored:
+                self._sample("new", article)
+                if self.existing_articles is not None:
+                    self.new_articles.add(article)
+            elif stored[article] == row_hash:
+                self.unchanged += 1
+                continue
+            else:
+                self._sample("changed", article)
+            if self.dry_run:
+                if article in stored:
+                    self.updated += 1
+                else:
+                    self.imported += 1
+                self._dry_run_hashes[article] = row_hash
+                continue
+            articles.append(article)
+            ops.append(UpdateOne(
+                {"article": article},
+                {"$set": {**data, "import_hash": row_hash},
+                 "$setOnInsert": {"id": str(uuid.uuid4()), "units_sold": 0}},
+                upsert=True
+            ))
+
+        if ops:
+            try:
+                result = await self.collection.bulk_write(ops, ordered=False)
+                self.imported += result.upserted_count
+                self.updated += result.matched_count
+            except BulkWriteError as e:
+                details = e.details
+                self.imported += details.get("nUpserted", 0)
+                self.updated += details.get("nMatched", 0)
+                for write_error in details.get("writeErrors", []):
+                    article = articles[write_error["index"]]
+                    self.error(self._pending_rows[article], write_error.get("errmsg", "write failed"))
+
+        self.chunks += 1
+        self._pending.clear()
+        self._pending_rows.clear()
+        if self.on_chunk:
+            await self.on_chunk(articles, self)
+
+    def progress(self) -> dict:
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "imported": self.imported,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+        }
+
+    def result(self) -> dict:
+        """Response in the shape the admin import page expects"""
+        return {
+            "imported": self.imported,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "errors": self.errors,
+            "total_errors": self.failed,
+            "samples": self.samples,
+        }
+
+
+def _read_batch(rows: Iterator[NumberedRow], size: int) -> List[NumberedRow]:
+    return list(itertools.islice(rows, size))
+
+
+async def import_product_rows(collection, rows: Iterable[NumberedRow], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                              on_chunk=None, state: Optional[dict] = None,
+                              dry_run: bool = False) -> ProductImporter:
+    """
+    Stream (row number, row) pairs into the products collection; returns the
+    finished importer. With a saved state the first state["rows"] rows are skipped.
+
+    The row source is read in a worker thread, PARSE_BATCH_SIZE rows at a
+    time (opening and parsing a workbook is blocking), so only the writes
+    run on the event loop.
+    """
+    importer = ProductImporter(collection, chunk_size, on_chunk, state, dry_run)
+    rows = itertools.islice(rows, importer.rows, None)
+    while True:
+        batch = await asyncio.to_thread(_read_batch, rows, PARSE_BATCH_SIZE)
+        if not batch:
+            break
+        for row_num, row in batch:
+            await importer.add_row(row_num, row)
+    await importer.flush()
+    return importer
@@ -0,0 +1,102 @@
+"""
+Ranked product search: Mongo text index with Russian stemming plus boosted article matches
+"""
+import re
+import logging
+from typing import List, Optional
+from pymongo import IndexModel, TEXT
+from pymongo.errors import OperationFailure
+
+from part_numbers import normalize_article, article_prefix_query
+
+# Weighted text index; Mongo applies Russian stemming ("масляный" ~ "масляного")
+TEXT_INDEX = IndexModel(
+    [("name", TEXT), ("article", TEXT), ("manufacturer", TEXT), ("description", TEXT)],
+    name="products_text",
+    weights={"name": 10, "article": 8, "manufacturer": 5, "description": 1},
+    default_language="russian"
+)
+
+logger = logging.getLogger(__name__)
+
+# Article / cross-reference hits ranked above every text hit
+MAX_ARTICLE_HITS = 50
+
+async def find_article_hits(db, key: str, base_query: dict, projection: dict) -> List[dict]:
+    """Exact article match first, then article and cross-reference prefix matches"""
+    query = {**base_query, "$or": [
+        {"article_key": article_prefix_query(key)},
+        {"cross_keys": article_prefix_query(key)}
+    ]}
+    hits = await db.products.find(query, projection).limit(MAX_ARTICLE_HITS).to_list(MAX_ARTICLE_HITS)
+    
+    # exact article, exact cross reference, then prefixes - shortest key first
+    def rank(p):
+        article_key = p.get("article_key", "")
+        return (
+            article_key != key,
+            key not in p.get("cross_keys", []),
+            len(article_key)
+        )
+    hits.sort(key=rank)
+    return hits
+
+def search_filter(search: str) -> dict:
+    """Unranked filter for the same matches search_products returns (for sorted / cursor pages)"""
+    clauses = [{"$text": {"$search": search}}]
+    key = normalize_article(search)
+    if key:
+        clauses += [{"article_key": article_prefix_query(key)}, {"cross_keys": article_prefix_query(key)}]
+    return {"$or": clauses}
+
+async def search_products(
+    db,
+    search: str,
+    category_id: Optional[str] = None,
+    limit: int = 20,
+    skip: int = 0,
+    projection: Optional[dict] = None
+) -> List[dict]:
+    """
+    Search products ranked by relevance
+    
+    Article matches come first, then text index matches ordered by
+    textScore. If the text index finds nothing (e.g. a half-typed word)
+    falls back to a case-insensitive name match.
+    
+    Returns:
+        Page of product documents (without _id)
+    """
+    projection = projection or {"_id": 0}
+    base_query = {"category_id": category_id} if category_id else {}
+    
+    key = normalize_article(search)
+    article_hits = await find_article_hits(db, key, base_query, projection) if key else []
+    page = article_hits[skip:skip + limit]
+    
+    remaining = limit - len(page)
+    if remaining <= 0:
+        return page
+    
+    text_skip = max(0, skip - len(article_hits))
+    text_query = {**base_query, "$text": {"$search": search}}
+    if article_hits:
+        text_query["id"] = {"$nin": [p["id"] for p in article_hits]}
+    text_projection = {**projection, "score": {"$meta": "textScore"}}
+    
+    try:
+        text_hits = await db.products.find(text_query, text_projection) \
+            .sort([("score", {"$meta": "textScore"}), ("id", 1)]) \
+            .skip(text_skip).limit(remaining).to_list(remaining)
+    except OperationFailure as e:
+        # Text index missing or still building
+        logger.warning(f"Text search unavailable: {e}")
+        text_hits = []
+    for p in text_hits:
+        p.pop("score", None)
+    
+    if not text_hits and not article_hits and skip == 0:
+        name_query = {**base_query, "name": {"$regex": re.escape(search), "$options": "i"}}
+        return await db.products.find(name_query, projection).limit(limit).to_list(limit)
+    
+    return page + text_hits
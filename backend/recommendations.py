@@ -0,0 +1,60 @@
+"""
+Frequently-bought-together recommendations built from order history
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+TOP_K = 20
+MAX_ITEMS_PER_ORDER = 50  # bounds the pair count of a single huge order
+
+
+def build_co_purchase(order_ids: Sequence[str], product_ids: Sequence[str],
+                      top_k: int = TOP_K,
+                      max_items_per_order: int = MAX_ITEMS_PER_ORDER) -> Dict[str, List[dict]]:
+    """
+    Count how often every pair of products appears in the same order.
+
+    order_ids and product_ids are parallel arrays, one entry per order line.
+    Returns {product_id: [{"product_id", "count"}, ...]} with at most top_k
+    neighbours per product, most frequent first. All counting is done with
+    vectorized pandas/numpy operations on integer codes.
+    """
+    if len(order_ids) == 0:
+        return {}
+
+    order_codes, _ = pd.factorize(pd.Series(order_ids, dtype=object))
+    product_codes, products = pd.factorize(pd.Series(product_ids, dtype=object))
+
+    lines = pd.DataFrame({"order": order_codes, "product": product_codes}).drop_duplicates()
+    lines = lines[lines.groupby("order").cumcount() < max_items_per_order]
+    lines = lines[lines.groupby("order")["product"].transform("size") > 1]
+    if lines.empty:
+        return {}
+
+    pairs = lines.merge(lines, on="order", suffixes=("", "_other"))
+    pairs = pairs[pairs["product"] != pairs["product_other"]]
+
+    n = np.int64(len(products))
+    keys = pairs["product"].to_numpy(np.int64) * n + pairs["product_other"].to_numpy(np.int64)
+    keys, counts = np.unique(keys, return_counts=True)
+    src, dst = keys // n, keys % n
+
+    # Most frequent neighbours first, then keep the first top_k of each product
+    order = np.lexsort((dst, -counts, src))
+    src, dst, counts = src[order], dst[order], counts[order]
+    rank = np.arange(len(src)) - np.searchsorted(src, src, side="left")
+    keep = rank < top_k
+    src, dst, counts = src[keep], dst[keep], counts[keep]
+
+    boundaries = np.flatnonzero(np.diff(src)) + 1
+    result = {}
+    for group_src, group_dst, group_counts in zip(np.split(src, boundaries),
+                                                   np.split(dst, boundaries),
+                                                   np.split(counts, boundaries)):
+        result[products[group_src[0]]] = [
+            {"product_id": products[d], "count": int(c)}
+            for d, c in zip(group_dst, group_counts)
+        ]
+    return result
@@ -1,29 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, Request, Header, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ASCENDING, DESCENDING, UpdateOne, ReplaceOne
+from pymongo.errors import OperationFailure, DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 import shutil
-import httpx
 import csv
 import io
 import json
+import re
+import time
+import base64
+import zlib
+import secrets
+import tempfile
+from openpyxl import Workbook
 from cloudinary_service import upload_to_cloudinary, is_image, is_video
+from part_numbers import normalize_article, split_cross_articles, article_prefix_query
+from analog_graph import AnalogGraph
+from product_search import TEXT_INDEX, search_products, search_filter
+from suggest_index import SuggestBase, SuggestIndex, product_entries
+from recommendations import build_co_purchase
+from telegram_gateway import TelegramGateway, TelegramError
+from event_bus import EventBus, MongoEventBus
+from product_import import DEFAULT_CHUNK_SIZE, EXPORT_FIELDS, export_row, import_product_rows, iter_csv_rows, iter_xlsx_rows
 
 ROOT_DIR = Path(__file__).parent
 UPLOADS_DIR = ROOT_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
+IMPORT_STAGING_DIR = ROOT_DIR / "import_staging"
+IMPORT_STAGING_DIR.mkdir(exist_ok=True)
 
 load_dotenv(ROOT_DIR / '.env')
 
@@ -58,6 +77,65 @@ app.mount("/api/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Strong references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
+def _background_task_done(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background task failed: {task.exception()!r}")
+
+def run_in_background(coro):
+    """Schedule a coroutine on the event loop without awaiting it"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+# ==================== EVENT BUS ====================
+
+# Live events for open connections and per-worker cache invalidation: chat
+# ("chat_user:<id>"), "orders", "settings" and "products". The in-process bus only
+# reaches the current worker; with several uvicorn workers set EVENT_BUS=mongo.
+EVENT_BUS = os.environ.get('EVENT_BUS', 'local')
+event_bus = MongoEventBus(db) if EVENT_BUS == "mongo" else EventBus()
+WORKER_ID = str(uuid.uuid4())  # lets a worker skip its own events where it applied the change already
+
+# Settings read on hot paths (promo banner on every page, Telegram on every
+# notification), cached per worker until a settings.updated event for the key
+settings_cache: Dict[str, Any] = {}
+settings_generation = 0  # bumped on invalidation so a load racing an update is not cached
+
+async def get_setting(key: str) -> Optional[dict]:
+    """Value of a settings document (None if missing)"""
+    if key in settings_cache:
+        return settings_cache[key]
+    generation = settings_generation
+    doc = await db.settings.find_one({"key": key}, {"_id": 0, "value": 1})
+    value = doc.get("value") if doc else None
+    if generation == settings_generation:
+        settings_cache[key] = value
+    return value
+
+def invalidate_setting(key: Optional[str] = None):
+    global settings_generation
+    settings_generation += 1
+    if key is None:
+        settings_cache.clear()
+    else:
+        settings_cache.pop(key, None)
+
+async def settings_changed(key: str):
+    """Call after writing a settings document: every worker drops its cached copy"""
+    invalidate_setting(key)
+    await event_bus.publish("settings", {"type": "settings.updated", "key": key})
+
+async def follow_settings_events():
+    async with event_bus.subscribe("settings") as subscription:
+        while True:
+            event = await subscription.get()
+            invalidate_setting(event.get("key"))  # a resync carries no key and clears everything
+
 # ==================== MODELS ====================
 
 class UserRegister(BaseModel):
@@ -192,6 +270,15 @@ class ProductUpdate(BaseModel):
     stock: Optional[int] = None
     delivery_days: Optional[int] = None
 
+class ProductBulkUpdateItem(BaseModel):
+    article: str
+    price: Optional[float] = None
+    stock: Optional[int] = None
+    delivery_days: Optional[int] = None
+
+class ProductBulkUpdate(BaseModel):
+    items: List[ProductBulkUpdateItem] = Field(..., max_length=10000)
+
 class ProductResponse(BaseModel):
     id: str
     name: str
@@ -206,6 +293,12 @@ class ProductResponse(BaseModel):
     stock: int
     delivery_days: int = 3
 
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    facets: Optional[Dict[str, Any]] = None
+
 class CartItem(BaseModel):
     product_id: str
     quantity: int
@@ -278,8 +371,11 @@ def create_token(user_id: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+async def user_from_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id = payload.get("user_id")
         user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
         if not user:
@@ -472,16 +568,18 @@ async def delete_category(category_id: str, user=Depends(get_current_user)):
     
     # Remove category from products
     await db.products.update_many({"category_id": category_id}, {"$set": {"category_id": None}})
+    invalidate_catalog_caches()
+    await publish_product_change("catalog.changed")
     return {"message": "Category deleted"}
 
 # ==================== PROMO BANNER ROUTES ====================
 
 @api_router.get("/promo-banner")
 async def get_promo_banner():
-    banner = await db.settings.find_one({"key": "promo_banner"}, {"_id": 0})
+    banner = await get_setting("promo_banner")
     if not banner:
         return {"enabled": False, "text": "", "link": None, "bg_color": "#f97316", "height": 40, "left_image": None, "right_image": None}
-    return banner.get("value", {"enabled": False, "text": "", "link": None, "bg_color": "#f97316", "height": 40, "left_image": None, "right_image": None})
+    return banner
 
 @api_router.put("/promo-banner")
 async def update_promo_banner(data: PromoBannerUpdate, user=Depends(get_current_user)):
@@ -493,6 +591,7 @@ async def update_promo_banner(data: PromoBannerUpdate, user=Depends(get_current_
         {"$set": {"key": "promo_banner", "value": data.model_dump()}},
         upsert=True
     )
+    await settings_changed("promo_banner")
     return data.model_dump()
 
 # ==================== FILE UPLOAD ====================
@@ -528,43 +627,370 @@ async def upload_file(file: UploadFile = File(...), user=Depends(get_current_use
 
 # ==================== PRODUCTS ROUTES ====================
 
-@api_router.get("/products/popular", response_model=List[ProductResponse])
-async def get_popular_products(limit: int = 6):
-    """Get popular products based on order count"""
-    # Aggregate order items to find most ordered products
+# Derived lookup fields are internal - hide them where no response_model filters them
+PRODUCT_PROJECTION = {"_id": 0, "article_key": 0, "cross_keys": 0, "import_hash": 0}
+
+# Process-wide cross-reference graph, built on startup and kept in sync on writes
+analog_graph = AnalogGraph()
+
+async def rebuild_analog_graph():
+    """Load article/cross keys of all products and rebuild the analog graph"""
+    products = await db.products.find({}, {"_id": 0, "id": 1, "article_key": 1, "cross_keys": 1}).to_list(None)
+    analog_graph.rebuild(products)
+    logger.info(f"Analog graph rebuilt: {analog_graph.stats()}")
+
+# Typeahead prefix index over articles, cross-articles, manufacturers and name words
+suggest_index = SuggestIndex()
+
+SUGGEST_FIELDS = {"_id": 0, "id": 1, "name": 1, "article": 1, "article_key": 1, "cross_keys": 1, "cross_articles": 1, "manufacturer": 1}
+
+async def rebuild_suggest_index():
+    """Rebuild the suggestion arrays from all products (sorting runs in a worker thread)"""
+    products = await db.products.find({}, SUGGEST_FIELDS).to_list(None)
+    base = await asyncio.to_thread(lambda: SuggestBase(e for p in products for e in product_entries(p)))
+    suggest_index.install_base(base)
+    logger.info(f"Suggest index rebuilt: {suggest_index.stats()}")
+
+# Cached catalog counts: filter -> (count, expires_at), in insertion (= expiry) order
+CATALOG_COUNT_TTL = 60
+CATALOG_COUNT_CACHE_MAX = 1000  # distinct search/filter queries kept
+catalog_count_cache = {}
+
+# Cached facet counts of unfiltered category pages: category_id -> (facets, total, expires_at)
+CATALOG_FACETS_TTL = 300
+catalog_facets_cache = {}
+
+def invalidate_catalog_caches():
+    catalog_count_cache.clear()
+    catalog_facets_cache.clear()
+
+async def compact_suggest_index():
+    """Merge the suggest delta into a new base in a worker thread"""
+    build = suggest_index.begin_compaction()
+    try:
+        base = await asyncio.to_thread(build)
+    except Exception:
+        suggest_index.abort_compaction()
+        raise
+    suggest_index.finish_compaction(base)
+
+def index_product_in_memory(product: dict):
+    """Refresh a created/updated product in the analog graph, suggest index and catalog caches"""
+    analog_graph.upsert_product(product["id"], product.get("article_key"), product.get("cross_keys"))
+    suggest_index.upsert_product(product)
+    invalidate_catalog_caches()
+    if suggest_index.compaction_due():
+        run_in_background(compact_suggest_index())
+
+def drop_product_from_memory(product_id: str):
+    analog_graph.remove_product(product_id)
+    suggest_index.remove_product(product_id)
+    invalidate_catalog_caches()
+
+# The worker that writes products updates its own indexes and caches, then tells
+# the others on topic "products":
+#   products.changed - reload these ids (missing ones were deleted)
+#   catalog.changed  - only prices/stock/popularity changed: drop catalog caches
+#   products.rebuilt - rebuild the analog graph and suggest index from scratch
+async def publish_product_change(event_type: str, product_ids: Optional[List[str]] = None):
+    await event_bus.publish("products", {"type": event_type, "ids": product_ids, "origin": WORKER_ID})
+
+async def reload_products_in_memory(product_ids: List[str]):
+    found = set()
+    async for product in db.products.find({"id": {"$in": product_ids}}, SUGGEST_FIELDS):
+        index_product_in_memory(product)
+        found.add(product["id"])
+    for product_id in set(product_ids) - found:
+        drop_product_from_memory(product_id)
+
+async def follow_product_events():
+    async with event_bus.subscribe("products") as subscription:
+        while True:
+            event = await subscription.get()
+            if event.get("origin") == WORKER_ID:
+                continue
+            try:
+                if event["type"] == "products.changed":
+                    await reload_products_in_memory(event["ids"])
+                elif event["type"] == "catalog.changed":
+                    invalidate_catalog_caches()
+                else:  # products.rebuilt, or a resync after missed events
+                    await rebuild_analog_graph()
+                    await rebuild_suggest_index()
+                    invalidate_catalog_caches()
+            except Exception as e:
+                logger.error(f"Applying product event {event.get('type')} failed: {e}")
+
+async def count_catalog(query: dict) -> int:
+    """Product count for a catalog filter, cached instead of counted on every request"""
+    cache_key = json.dumps(query, sort_keys=True, default=str)
+    cached = catalog_count_cache.get(cache_key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    
+    if query:
+        count = await db.products.count_documents(query)
+    else:
+        count = await db.products.estimated_document_count()
+    
+    now = time.monotonic()
+    catalog_count_cache.pop(cache_key, None)  # re-inserted at the end, keeping expiry order
+    if len(catalog_count_cache) >= CATALOG_COUNT_CACHE_MAX:
+        for key in [k for k, (_, expires_at) in catalog_count_cache.items() if expires_at <= now]:
+            del catalog_count_cache[key]
+        while len(catalog_count_cache) >= CATALOG_COUNT_CACHE_MAX:
+            del catalog_count_cache[next(iter(catalog_count_cache))]  # soonest to expire
+    catalog_count_cache[cache_key] = (count, now + CATALOG_COUNT_TTL)
+    return count
+
+# Catalog sorts: name -> (field, direction). Ties are broken by id in the same
+# direction, so a single (field, id) index serves both directions.
+CATALOG_SORTS = {
+    "name": ("name", 1),
+    "price": ("price", 1),
+    "price_desc": ("price", -1),
+    "stock": ("stock", -1),
+    "popularity": ("units_sold", -1),
+}
+
+def catalog_sort_keys(sort: str) -> list:
+    if sort not in CATALOG_SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort. Allowed: {', '.join(CATALOG_SORTS)}")
+    field, direction = CATALOG_SORTS[sort]
+    return [(field, direction), ("id", direction)]
+
+def encode_catalog_cursor(sort: str, product: dict) -> str:
+    field, _ = CATALOG_SORTS[sort]
+    raw = json.dumps([sort, product.get(field), product["id"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def catalog_cursor_query(sort: str, after: str) -> dict:
+    """Filter for products that come after the cursor position"""
+    try:
+        raw = base64.urlsafe_b64decode(after + "=" * (-len(after) % 4))
+        cursor_sort, value, last_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    
+    field, direction = CATALOG_SORTS[sort]
+    op = "$gt" if direction == 1 else "$lt"
+    return {"$or": [{field: {op: value}}, {field: value, "id": {op: last_id}}]}
+
+def catalog_filter_clauses(
+    manufacturer: Optional[List[str]],
+    price_min: Optional[float],
+    price_max: Optional[float],
+    in_stock: Optional[bool],
+    max_delivery_days: Optional[int]
+) -> Dict[str, dict]:
+    """Catalog filters keyed by the facet they belong to"""
+    clauses = {}
+    if manufacturer:
+        clauses["manufacturer"] = {"manufacturer": {"$in": manufacturer}}
+    if price_min is not None or price_max is not None:
+        price = {}
+        if price_min is not None:
+            price["$gte"] = price_min
+        if price_max is not None:
+            price["$lte"] = price_max
+        clauses["price"] = {"price": price}
+    if in_stock is not None:
+        clauses["in_stock"] = {"stock": {"$gt": 0}} if in_stock else {"stock": {"$lte": 0}}
+    if max_delivery_days is not None:
+        clauses["delivery_days"] = {"delivery_days": {"$lte": max_delivery_days}}
+    return clauses
+
+def and_query(clauses: List[dict]) -> dict:
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+# Price facet buckets (lower bounds, RUB)
+PRICE_BUCKETS = [0, 1000, 5000, 10000, 50000, 100000]
+
+def facet_match(filters: Dict[str, dict], exclude: str) -> dict:
+    """$match stage with every filter except the facet's own, so its other values keep counts"""
+    return {"$match": and_query([c for name, c in filters.items() if name != exclude])}
+
+async def compute_catalog_facets(base_query: dict, filters: Dict[str, dict]):
+    """Facet counts and total for the filtered catalog in a single $facet aggregation"""
     pipeline = [
-        {"$unwind": "$items"},
-        {"$group": {"_id": "$items.product_id", "order_count": {"$sum": "$items.quantity"}}},
-        {"$sort": {"order_count": -1}},
-        {"$limit": limit}
+        {"$match": base_query},
+        {"$facet": {
+            "total": [{"$match": and_query(list(filters.values()))}, {"$count": "count"}],
+            "manufacturer": [
+                facet_match(filters, "manufacturer"),
+                {"$group": {"_id": "$manufacturer", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": 50}
+            ],
+            "price": [
+                facet_match(filters, "price"),
+                {"$bucket": {
+                    "groupBy": "$price",
+                    "boundaries": PRICE_BUCKETS + [float("inf")],
+                    "default": "other",
+                    "output": {"count": {"$sum": 1}}
+                }}
+            ],
+            "price_range": [
+                facet_match(filters, "price"),
+                {"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}}
+            ],
+            "in_stock": [
+                facet_match(filters, "in_stock"),
+                {"$group": {"_id": {"$gt": ["$stock", 0]}, "count": {"$sum": 1}}}
+            ],
+            "delivery_days": [
+                facet_match(filters, "delivery_days"),
+                {"$group": {"_id": "$delivery_days", "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}
+            ]
+        }}
     ]
-    popular_ids = await db.orders.aggregate(pipeline).to_list(limit)
-    
-    if popular_ids:
-        product_ids = [p["_id"] for p in popular_ids]
-        products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(limit)
-        # Sort by order count
-        id_to_count = {p["_id"]: p["order_count"] for p in popular_ids}
-        products.sort(key=lambda x: id_to_count.get(x["id"], 0), reverse=True)
+    result = (await db.products.aggregate(pipeline, allowDiskUse=True).to_list(1))[0]
+    
+    bounds = PRICE_BUCKETS + [None]
+    price_buckets = []
+    for bucket in result["price"]:
+        if bucket["_id"] == "other":
+            continue
+        i = PRICE_BUCKETS.index(bucket["_id"])
+        price_buckets.append({"min": bounds[i], "max": bounds[i + 1], "count": bucket["count"]})
+    price_range = result["price_range"][0] if result["price_range"] else {}
+    in_stock = {str(g["_id"]).lower(): g["count"] for g in result["in_stock"]}
+    
+    facets = {
+        "manufacturer": [{"value": g["_id"], "count": g["count"]} for g in result["manufacturer"]],
+        "price": price_buckets,
+        "price_range": {"min": price_range.get("min"), "max": price_range.get("max")},
+        "in_stock": {"in_stock": in_stock.get("true", 0), "out_of_stock": in_stock.get("false", 0)},
+        "delivery_days": [{"value": g["_id"], "count": g["count"]} for g in result["delivery_days"]]
+    }
+    total = result["total"][0]["count"] if result["total"] else 0
+    return facets, total
+
+async def get_catalog_facets(base_query: dict, filters: Dict[str, dict], category_id: Optional[str], cacheable: bool):
+    """Facets for a catalog page; unfiltered category pages are served from cache"""
+    if not cacheable:
+        return await compute_catalog_facets(base_query, filters)
+    
+    cache_key = category_id or ""
+    cached = catalog_facets_cache.get(cache_key)
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
+    
+    facets, total = await compute_catalog_facets(base_query, filters)
+    catalog_facets_cache[cache_key] = (facets, total, time.monotonic() + CATALOG_FACETS_TTL)
+    return facets, total
+
+async def get_products_page(
+    search: Optional[str],
+    category_id: Optional[str],
+    filters: Dict[str, dict],
+    sort: str,
+    after: Optional[str],
+    limit: int,
+    with_total: bool,
+    with_facets: bool
+) -> dict:
+    """Keyset-paginated catalog page, optionally with facet counts"""
+    sort_keys = catalog_sort_keys(sort)
+    
+    base_clauses = []
+    if category_id:
+        base_clauses.append({"category_id": category_id})
+    if search and search.strip():
+        base_clauses.append(search_filter(search.strip()))
+    base_query = and_query(base_clauses)
+    filtered_clauses = base_clauses + list(filters.values())
+    
+    query = and_query(filtered_clauses)
+    if after:
+        query = and_query(filtered_clauses + [catalog_cursor_query(sort, after)])
+    
+    items_future = db.products.find(query, {"_id": 0}).sort(sort_keys).limit(limit + 1).to_list(limit + 1)
+    facets = total = None
+    if with_facets:
+        cacheable = not search and not filters
+        items, (facets, total) = await asyncio.gather(
+            items_future,
+            get_catalog_facets(base_query, filters, category_id, cacheable)
+        )
     else:
+        items = await items_future
+        if with_total:
+            total = await count_catalog(and_query(filtered_clauses))
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_catalog_cursor(sort, items[-1])
+    
+    return {"items": items, "next_cursor": next_cursor, "total": total, "facets": facets}
+
+def product_search_keys(data: dict) -> dict:
+    """Build normalized lookup keys for the article / cross_articles present in data"""
+    keys = {}
+    if "article" in data:
+        keys["article_key"] = normalize_article(data["article"])
+    if "cross_articles" in data:
+        keys["cross_keys"] = split_cross_articles(data["cross_articles"])
+    return keys
+
+@api_router.get("/products/popular", response_model=List[ProductResponse])
+async def get_popular_products(limit: int = 6):
+    """Get popular products based on units sold (maintained by the product_stats rollup)"""
+    products = await db.products.find({"units_sold": {"$gt": 0}}, {"_id": 0}) \
+        .sort(catalog_sort_keys("popularity")).limit(limit).to_list(limit)
+    
+    if not products:
         # Fallback: return random products if no orders
         products = await db.products.find({}, {"_id": 0}).limit(limit).to_list(limit)
     
     return products
 
-@api_router.get("/products", response_model=List[ProductResponse])
-async def get_products(search: Optional[str] = None, category_id: Optional[str] = None, limit: int = 100, skip: int = 0):
-    query = {}
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"article": {"$regex": search, "$options": "i"}},
-            {"cross_articles": {"$regex": search, "$options": "i"}}  # Search in cross-articles too
-        ]
-    if category_id:
-        query["category_id"] = category_id
+@api_router.get("/products", response_model=Union[List[ProductResponse], ProductPage])
+async def get_products(
+    search: Optional[str] = None,
+    category_id: Optional[str] = None,
+    limit: int = 100,
+    skip: int = 0,
+    sort: Optional[str] = None,
+    paging: str = Query("offset", description="offset or cursor"),
+    after: Optional[str] = None,
+    with_total: bool = False,
+    manufacturer: Optional[List[str]] = Query(None),
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    in_stock: Optional[bool] = None,
+    max_delivery_days: Optional[int] = None,
+    facets: bool = False
+):
+    limit = min(limit, 100)
+    filters = catalog_filter_clauses(manufacturer, price_min, price_max, in_stock, max_delivery_days)
+    
+    # Page mode: {items, next_cursor, total, facets}, pass next_cursor back as ?after=
+    if paging == "cursor" or after or facets:
+        return await get_products_page(search, category_id, filters, sort or "name", after, limit, with_total, facets)
     
-    products = await db.products.find(query, {"_id": 0}).skip(skip).limit(min(limit, 100)).to_list(100)
+    if search and search.strip() and not sort and not filters:
+        # Ranked: article / cross-reference matches first, then full-text relevance
+        return await search_products(db, search.strip(), category_id, limit, skip)
+    
+    clauses = list(filters.values())
+    if category_id:
+        clauses.append({"category_id": category_id})
+    if search and search.strip():
+        clauses.append(search_filter(search.strip()))
+    query = and_query(clauses)
+    
+    cursor = db.products.find(query, {"_id": 0})
+    if sort:
+        cursor = cursor.sort(catalog_sort_keys(sort))
+    products = await cursor.skip(skip).limit(limit).to_list(limit)
     return products
 
 @api_router.get("/products/search-with-alternatives")
@@ -573,37 +999,45 @@ async def search_products_with_alternatives(search: str, limit: int = 50):
     if not search:
         return {"exact": [], "alternatives": []}
     
-    search_upper = search.upper().strip()
+    key = normalize_article(search)
     
     # Find exact article match first
-    exact_match = await db.products.find_one(
-        {"article": {"$regex": f"^{search}$", "$options": "i"}},
-        {"_id": 0}
-    )
+    exact_match = None
+    if key:
+        exact_match = await db.products.find_one({"article_key": key}, PRODUCT_PROJECTION)
     
-    # Find alternatives from cross_articles
+    # Find alternatives: the whole interchangeable group from the analog graph
     alternatives = []
-    if search_upper:
-        # Find products where cross_articles contains the search term
+    analog_ids = analog_graph.analog_product_ids(key)[:limit] if key else []
+    if analog_ids:
+        products = await db.products.find({"id": {"$in": analog_ids}}, PRODUCT_PROJECTION).to_list(limit)
+        products_map = {p["id"]: p for p in products}
+        alternatives = [products_map[pid] for pid in analog_ids if pid in products_map]
+    elif key:
+        # Unknown key (or graph not built yet) - products whose cross-reference keys start with it
         alt_query = {
-            "$and": [
-                {"cross_articles": {"$regex": search, "$options": "i"}},
-                {"article": {"$not": {"$regex": f"^{search}$", "$options": "i"}}}  # Exclude exact match
-            ]
+            "cross_keys": article_prefix_query(key),
+            "article_key": {"$ne": key}  # Exclude exact match
         }
-        alternatives = await db.products.find(alt_query, {"_id": 0}).limit(limit).to_list(limit)
+        alternatives = await db.products.find(alt_query, PRODUCT_PROJECTION).limit(limit).to_list(limit)
     
     # Also search by name if no exact article match
     name_matches = []
     if not exact_match:
-        name_query = {"name": {"$regex": search, "$options": "i"}}
-        name_matches = await db.products.find(name_query, {"_id": 0}).limit(limit).to_list(limit)
+        name_matches = await search_products(db, search, limit=limit, projection=PRODUCT_PROJECTION)
     
     return {
         "exact": [exact_match] if exact_match else name_matches,
         "alternatives": alternatives
     }
 
+@api_router.get("/products/suggest")
+async def suggest_products(q: str = "", limit: int = Query(10, ge=1, le=20)):
+    """Typeahead suggestions for the search box (articles, cross-articles, manufacturers, names)"""
+    if not q.strip():
+        return {"suggestions": []}
+    return {"suggestions": suggest_index.suggest(q, limit)}
+
 @api_router.get("/products/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str):
     product = await db.products.find_one({"id": product_id}, {"_id": 0})
@@ -619,9 +1053,13 @@ async def create_product(data: ProductCreate, user=Depends(get_current_user)):
     product_id = str(uuid.uuid4())
     product = {
         "id": product_id,
-        **data.model_dump()
+        **data.model_dump(),
+        "units_sold": 0
     }
+    product.update(product_search_keys(product))
     await db.products.insert_one(product)
+    index_product_in_memory(product)
+    await publish_product_change("products.changed", [product_id])
     return product
 
 @api_router.put("/products/{product_id}", response_model=ProductResponse)
@@ -632,14 +1070,68 @@ async def update_product(product_id: str, data: ProductUpdate, user=Depends(get_
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
+    update_data.update(product_search_keys(update_data))
     
-    result = await db.products.update_one({"id": product_id}, {"$set": update_data})
+    # A manual edit makes the next import rewrite this product even if its row is unchanged
+    result = await db.products.update_one({"id": product_id}, {"$set": update_data, "$unset": {"import_hash": ""}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     
     product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    index_product_in_memory(product)
+    await publish_product_change("products.changed", [product_id])
     return product
 
+@api_router.post("/admin/products/bulk-update")
+async def bulk_update_products(data: ProductBulkUpdate, user=Depends(get_current_user)):
+    """Apply price / stock / delivery changes keyed by article in a single bulk_write"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Merge repeated articles in request order, later values win
+    changes = {}
+    for item in data.items:
+        fields = {k: v for k, v in item.model_dump(exclude={"article"}).items() if v is not None}
+        article = item.article.strip()
+        if article and fields:
+            changes.setdefault(article, {}).update(fields)
+    
+    existing = set()
+    if changes:
+        async for product in db.products.find({"article": {"$in": list(changes)}}, {"_id": 0, "article": 1}):
+            existing.add(product["article"])
+    
+    # A manual change makes the next import rewrite the product even if its row is unchanged
+    ops = [
+        UpdateOne({"article": article}, {"$set": fields, "$unset": {"import_hash": ""}})
+        for article, fields in changes.items() if article in existing
+    ]
+    modified = 0
+    if ops:
+        result = await db.products.bulk_write(ops, ordered=False)
+        modified = result.modified_count
+        invalidate_catalog_caches()
+        await publish_product_change("catalog.changed")
+    
+    results = []
+    for item in data.items:
+        article = item.article.strip()
+        if article not in changes:
+            status = "invalid"
+        elif article in existing:
+            status = "matched"
+        else:
+            status = "missing"
+        results.append({"article": item.article, "status": status})
+    
+    return {
+        "matched": sum(1 for r in results if r["status"] == "matched"),
+        "missing": sum(1 for r in results if r["status"] == "missing"),
+        "invalid": sum(1 for r in results if r["status"] == "invalid"),
+        "modified": modified,
+        "results": results
+    }
+
 @api_router.delete("/products/{product_id}")
 async def delete_product(product_id: str, user=Depends(get_current_user)):
     if user.get("role") != "admin":
@@ -648,6 +1140,8 @@ async def delete_product(product_id: str, user=Depends(get_current_user)):
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    drop_product_from_memory(product_id)
+    await publish_product_change("products.changed", [product_id])
     return {"message": "Product deleted"}
 
 @api_router.get("/categories")
@@ -656,63 +1150,103 @@ async def get_categories():
 
 # ==================== CART ROUTES ====================
 
+# Product fields the cart view needs (CartItemResponse + stock)
+CART_PRODUCT_FIELDS = {"_id": 0, "name": 1, "article": 1, "manufacturer": 1, "price": 1, "image_url": 1, "stock": 1}
+
+def cart_view_pipeline(user_id: str) -> list:
+    """
+    Cart with product details, line totals, cart total and stock warnings in one aggregation.
+    Items whose product was deleted are dropped from items and reported as "removed".
+    """
+    stock = {"$ifNull": ["$product.stock", 0]}
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$unwind": "$items"},
+        {"$lookup": {
+            "from": "products",
+            "localField": "items.product_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": CART_PRODUCT_FIELDS}, {"$limit": 1}],
+            "as": "product"
+        }},
+        {"$set": {"product": {"$first": "$product"}}},
+        {"$project": {"_id": 0, "line": {
+            "product_id": "$items.product_id",
+            "quantity": "$items.quantity",
+            "name": "$product.name",
+            "article": "$product.article",
+            "manufacturer": "$product.manufacturer",
+            "price": "$product.price",
+            "image_url": "$product.image_url",
+            "stock": stock,
+            "line_total": {"$multiply": [{"$ifNull": ["$product.price", 0]}, "$items.quantity"]},
+            "availability": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": [{"$type": "$product"}, "missing"]}, "then": "removed"},
+                    {"case": {"$lte": [stock, 0]}, "then": "out_of_stock"},
+                    {"case": {"$gt": ["$items.quantity", stock]}, "then": "insufficient_stock"}
+                ],
+                "default": "in_stock"
+            }}
+        }}},
+        {"$group": {"_id": None, "lines": {"$push": "$line"}}},
+        {"$project": {
+            "_id": 0,
+            "items": {"$filter": {"input": "$lines", "cond": {"$ne": ["$$this.availability", "removed"]}}},
+            "warnings": {"$map": {
+                "input": {"$filter": {"input": "$lines", "cond": {"$ne": ["$$this.availability", "in_stock"]}}},
+                "in": {
+                    "product_id": "$$this.product_id",
+                    "name": "$$this.name",
+                    "type": "$$this.availability",
+                    "available": "$$this.stock"
+                }
+            }}
+        }},
+        {"$set": {"total": {"$sum": "$items.line_total"}}}
+    ]
+
 @api_router.get("/cart")
 async def get_cart(user=Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]}, {"_id": 0})
-    if not cart:
-        cart = {"user_id": user["id"], "items": []}
-        await db.carts.insert_one(cart)
-    
-    # Batch fetch all products
-    product_ids = [item["product_id"] for item in cart.get("items", [])]
-    if not product_ids:
-        return {"items": []}
-    
-    products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(100)
-    products_map = {p["id"]: p for p in products}
-    
-    items_with_details = []
-    for item in cart.get("items", []):
-        product = products_map.get(item["product_id"])
-        if product:
-            items_with_details.append({
-                "product_id": item["product_id"],
-                "name": product["name"],
-                "article": product["article"],
-                "manufacturer": product.get("manufacturer"),
-                "price": product["price"],
-                "quantity": item["quantity"],
-                "image_url": product.get("image_url")
-            })
-    
-    return {"items": items_with_details}
+    """Cart items with product details, totals and stock warnings (one aggregation, no write)"""
+    carts = await db.carts.aggregate(cart_view_pipeline(user["id"])).to_list(1)
+    if not carts:
+        return {"items": [], "total": 0, "warnings": []}
+    return carts[0]
+
+def cart_add_pipeline(product_id: str, quantity: int) -> list:
+    """
+    Update pipeline that increments the item if it is in the cart and appends it otherwise.
+    Runs atomically on the server, and with upsert it also creates a missing cart.
+    """
+    product_id = {"$literal": product_id}  # never read as a field path
+    items = {"$ifNull": ["$items", []]}
+    return [{"$set": {"items": {"$cond": [
+        {"$in": [product_id, {"$map": {"input": items, "in": "$$this.product_id"}}]},
+        {"$map": {"input": items, "in": {"$cond": [
+            {"$eq": ["$$this.product_id", product_id]},
+            {"$mergeObjects": ["$$this", {"quantity": {"$add": ["$$this.quantity", quantity]}}]},
+            "$$this"
+        ]}}},
+        {"$concatArrays": [items, [{"product_id": product_id, "quantity": quantity}]]}
+    ]}}}]
 
 @api_router.post("/cart/add")
 async def add_to_cart(item: CartItem, user=Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]})
-    if not cart:
-        await db.carts.insert_one({"user_id": user["id"], "items": [item.model_dump()]})
-    else:
-        items = cart.get("items", [])
-        existing = next((i for i in items if i["product_id"] == item.product_id), None)
-        if existing:
-            existing["quantity"] += item.quantity
-        else:
-            items.append(item.model_dump())
-        await db.carts.update_one({"user_id": user["id"]}, {"$set": {"items": items}})
-    
+    await db.carts.update_one(
+        {"user_id": user["id"]},
+        cart_add_pipeline(item.product_id, item.quantity),
+        upsert=True
+    )
     return {"message": "Added to cart"}
 
 @api_router.post("/cart/update")
 async def update_cart_item(item: CartItem, user=Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]})
-    if cart:
-        items = cart.get("items", [])
-        for i in items:
-            if i["product_id"] == item.product_id:
-                i["quantity"] = item.quantity
-                break
-        await db.carts.update_one({"user_id": user["id"]}, {"$set": {"items": items}})
+    await db.carts.update_one(
+        {"user_id": user["id"]},
+        {"$set": {"items.$[item].quantity": item.quantity}},
+        array_filters=[{"item.product_id": item.product_id}]
+    )
     return {"message": "Cart updated"}
 
 @api_router.delete("/cart/{product_id}")
@@ -730,56 +1264,266 @@ async def clear_cart(user=Depends(get_current_user)):
 
 # ==================== ORDERS ROUTES ====================
 
-@api_router.post("/orders", response_model=OrderResponse)
-async def create_order(data: OrderCreate, user=Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]})
-    if not cart or not cart.get("items"):
-        raise HTTPException(status_code=400, detail="Cart is empty")
-    
-    # Batch fetch all products
-    product_ids = [item["product_id"] for item in cart["items"]]
-    products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(100)
-    products_map = {p["id"]: p for p in products}
-    
-    # Build order items
-    items = []
-    total = 0
-    for cart_item in cart["items"]:
-        product = products_map.get(cart_item["product_id"])
-        if product:
-            item_data = {
-                "product_id": cart_item["product_id"],
-                "name": product["name"],
-                "article": product["article"],
-                "manufacturer": product.get("manufacturer"),
-                "price": product["price"],
-                "quantity": cart_item["quantity"],
-                "image_url": product.get("image_url")
-            }
-            items.append(item_data)
-            total += product["price"] * cart_item["quantity"]
+async def apply_order_to_product_stats(order: dict, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) an order's items in the product_stats rollup
+    and the units_sold field used for popularity sorting.
+    Cancelled orders are not counted as sales.
+    """
+    per_product = {}
+    for item in order.get("items", []):
+        pid = item.get("product_id")
+        if not pid:
+            continue
+        qty = item.get("quantity", 0)
+        stats = per_product.setdefault(pid, {"units_sold": 0, "revenue": 0})
+        stats["units_sold"] += qty
+        stats["revenue"] += item.get("price", 0) * qty
+    if not per_product:
+        return
     
-    order_id = str(uuid.uuid4())
-    order = {
-        "id": order_id,
-        "user_id": user["id"],
-        "items": items,
-        "total": total,
-        "status": "pending",
-        "full_name": data.full_name,
-        "address": data.address,
-        "phone": data.phone,
-        "comment": data.comment,
-        "payment_method": "cash",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.orders.insert_one(order)
+    stats_ops = []
+    product_ops = []
+    for pid, stats in per_product.items():
+        update = {"$inc": {
+            "units_sold": sign * stats["units_sold"],
+            "revenue": sign * stats["revenue"],
+            "order_count": sign
+        }}
+        if sign > 0:
+            update["$max"] = {"last_sold_at": order.get("created_at")}
+        stats_ops.append(UpdateOne({"product_id": pid}, update, upsert=True))
+        product_ops.append(UpdateOne({"id": pid}, {"$inc": {"units_sold": sign * stats["units_sold"]}}))
+    
+    await db.product_stats.bulk_write(stats_ops, ordered=False)
+    await db.products.bulk_write(product_ops, ordered=False)
+
+async def update_product_stats_on_change(previous: dict, current: Optional[dict]):
+    """Keep product_stats in sync when an order is edited, changes status or is deleted (current=None)"""
+    was_counted = previous.get("status") != "cancelled"
+    is_counted = current is not None and current.get("status") != "cancelled"
+    items_changed = current is not None and current.get("items") != previous.get("items")
+    
+    if was_counted and (not is_counted or items_changed):
+        await apply_order_to_product_stats(previous, -1)
+    if is_counted and (not was_counted or items_changed):
+        await apply_order_to_product_stats(current, 1)
+
+# Order board events on topic "orders" carry this summary, not the item arrays
+ORDER_SUMMARY_FIELDS = ("id", "user_id", "full_name", "phone", "address", "comment", "total", "status", "created_at")
+
+def order_summary(order: dict) -> dict:
+    return {**{f: order.get(f) for f in ORDER_SUMMARY_FIELDS}, "items_count": len(order.get("items") or [])}
+
+async def publish_order_event(event_type: str, order: dict):
+    await event_bus.publish("orders", {"type": event_type, "order": order_summary(order)})
+
+# Stock held by an order: taken at checkout, returned when it is cancelled or
+# deleted, adjusted when its items are edited. Orders placed before checkout
+# reserved stock have no stock_reserved flag and are left alone. Every stock
+# change clears import_hash so the next feed import writes its stock again.
+def reserved_quantities(order: Optional[dict]) -> Dict[str, int]:
+    if not order or not order.get("stock_reserved") or order.get("status") == "cancelled":
+        return {}
+    quantities = {}
+    for item in order.get("items", []):
+        pid = item.get("product_id")
+        if pid:
+            quantities[pid] = quantities.get(pid, 0) + item.get("quantity", 0)
+    return quantities
+
+async def update_reserved_stock_on_change(previous: Optional[dict], current: Optional[dict]):
+    """
+    Return or take stock for the difference between two versions of an order
+    (None = no order). Stock is only taken where enough is left, as at checkout;
+    otherwise nothing changes and 409 is raised.
+    """
+    before, after = reserved_quantities(previous), reserved_quantities(current)
+    taken = []
+    for pid, quantity in after.items():
+        needed = quantity - before.get(pid, 0)
+        if needed <= 0:
+            continue
+        result = await db.products.update_one(
+            {"id": pid, "stock": {"$gte": needed}}, {"$inc": {"stock": -needed}, "$unset": {"import_hash": ""}}
+        )
+        if result.matched_count == 0:
+            if taken:
+                await db.products.bulk_write([
+                    UpdateOne({"id": p}, {"$inc": {"stock": q}, "$unset": {"import_hash": ""}})
+                    for p, q in taken
+                ], ordered=False)
+            name = next((i.get("name") for i in current["items"] if i.get("product_id") == pid), pid)
+            raise HTTPException(status_code=409, detail=f"Недостаточно товара на складе: {name}")
+        taken.append((pid, needed))
+    
+    ops = [
+        UpdateOne({"id": pid}, {"$inc": {"stock": quantity - after.get(pid, 0)}, "$unset": {"import_hash": ""}})
+        for pid, quantity in before.items()
+        if quantity > after.get(pid, 0)
+    ]
+    if ops:
+        await db.products.bulk_write(ops, ordered=False)
+
+IDEMPOTENCY_KEY_TTL = 24 * 3600  # seconds a retried checkout returns the original order
+IDEMPOTENT_CHECKOUT_POLLS = 20  # a retry racing the original checkout waits up to 20 * 0.1 s for its order
+IDEMPOTENT_CHECKOUT_POLL_INTERVAL = 0.1
+
+# Multi-document transactions need a replica set or sharded cluster; checked at startup
+transactions_supported = True
+
+async def detect_transaction_support():
+    global transactions_supported
+    hello = await client.admin.command("hello")
+    transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    if not transactions_supported:
+        logger.warning("MongoDB is a standalone server: checkout runs without transactions, "
+                       "undoing its writes if a step fails")
+
+async def find_idempotent_order(user_id: str, key: str) -> Optional[dict]:
+    record = await db.idempotency_keys.find_one({"user_id": user_id, "key": key}, {"_id": 0, "order_id": 1})
+    if not record:
+        return None
+    return await db.orders.find_one({"id": record["order_id"]}, {"_id": 0})
+
+@api_router.post("/orders", response_model=OrderResponse)
+async def create_order(data: OrderCreate, user=Depends(get_current_user),
+                       idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=200)):
+    """
+    Checkout in one transaction: claim the Idempotency-Key, decrement the stock of
+    every cart line (only if enough is left), insert the order and clear the cart.
+    A retry with the same key returns the original order.
+    
+    Without transaction support the same steps run one by one: the cart is
+    emptied first so a concurrent checkout of it finds nothing, and each
+    write is undone in reverse order if a later step fails.
+    """
+    if idempotency_key:
+        existing = await find_idempotent_order(user["id"], idempotency_key)
+        if existing:
+            return existing
+    
+    async def place_order(session, undo: Optional[list] = None):
+        order_id = str(uuid.uuid4())
+        if idempotency_key:
+            # Inserted first so a concurrent retry with the same key conflicts right away
+            await db.idempotency_keys.insert_one({
+                "user_id": user["id"],
+                "key": idempotency_key,
+                "order_id": order_id,
+                "created_at": datetime.now(timezone.utc)
+            }, session=session)
+            if undo is not None:
+                undo.append(lambda: db.idempotency_keys.delete_one({"user_id": user["id"], "key": idempotency_key}))
+        
+        if undo is None:
+            cart = await db.carts.find_one({"user_id": user["id"]}, session=session)
+        else:
+            cart = await db.carts.find_one_and_update({"user_id": user["id"]}, {"$set": {"items": []}})
+            if cart and cart.get("items"):
+                undo.append(lambda items=cart["items"]: db.carts.update_one(
+                    {"user_id": user["id"]}, {"$set": {"items": items}}
+                ))
+        if not cart or not cart.get("items"):
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        
+        # Batch fetch all products
+        product_ids = [item["product_id"] for item in cart["items"]]
+        products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}, session=session).to_list(100)
+        products_map = {p["id"]: p for p in products}
+        
+        # Build order items
+        items = []
+        total = 0
+        for cart_item in cart["items"]:
+            product = products_map.get(cart_item["product_id"])
+            if product:
+                item_data = {
+                    "product_id": cart_item["product_id"],
+                    "name": product["name"],
+                    "article": product["article"],
+                    "manufacturer": product.get("manufacturer"),
+                    "price": product["price"],
+                    "quantity": cart_item["quantity"],
+                    "image_url": product.get("image_url")
+                }
+                items.append(item_data)
+                total += product["price"] * cart_item["quantity"]
+        if not items:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        
+        # Reserve stock; a line that no longer fits aborts the whole checkout
+        for item in items:
+            result = await db.products.update_one(
+                {"id": item["product_id"], "stock": {"$gte": item["quantity"]}},
+                {"$inc": {"stock": -item["quantity"]}, "$unset": {"import_hash": ""}},
+                session=session
+            )
+            if result.matched_count == 0:
+                raise HTTPException(status_code=409, detail=f"Недостаточно товара на складе: {item['name']}")
+            if undo is not None:
+                undo.append(lambda item=item: db.products.update_one(
+                    {"id": item["product_id"]}, {"$inc": {"stock": item["quantity"]}, "$unset": {"import_hash": ""}}
+                ))
+        
+        order = {
+            "id": order_id,
+            "user_id": user["id"],
+            "items": items,
+            "total": total,
+            "status": "pending",
+            "full_name": data.full_name,
+            "address": data.address,
+            "phone": data.phone,
+            "comment": data.comment,
+            "payment_method": "cash",
+            "stock_reserved": True,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        await db.orders.insert_one(order, session=session)
+        if undo is not None:
+            undo.append(lambda: db.orders.delete_one({"id": order_id}))
+        await enqueue_order_notification(order, session)
+        
+        # Clear cart (also makes a concurrent checkout of the same cart conflict and retry)
+        if undo is None:
+            await db.carts.update_one({"user_id": user["id"]}, {"$set": {"items": []}}, session=session)
+        return order
     
-    # Clear cart
-    await db.carts.update_one({"user_id": user["id"]}, {"$set": {"items": []}})
+    async def place_order_without_transaction():
+        undo = []
+        try:
+            return await place_order(None, undo)
+        except BaseException:
+            for step in reversed(undo):
+                try:
+                    await step()
+                except Exception as e:
+                    logger.error(f"Checkout rollback step failed: {e}")
+            raise
     
-    # Send Telegram notification
-    await send_telegram_order_notification(order, user)
+    try:
+        if transactions_supported:
+            async with await client.start_session() as session:
+                order = await session.with_transaction(place_order)
+        else:
+            order = await place_order_without_transaction()
+    except DuplicateKeyError:
+        if not idempotency_key:
+            raise
+        # A concurrent request with the same key got there first. Without a
+        # transaction its order may not be inserted yet (or it is being undone),
+        # so wait briefly for it before telling the client to retry.
+        for _ in range(IDEMPOTENT_CHECKOUT_POLLS):
+            existing = await find_idempotent_order(user["id"], idempotency_key)
+            if existing:
+                return existing
+            await asyncio.sleep(IDEMPOTENT_CHECKOUT_POLL_INTERVAL)
+        raise HTTPException(status_code=409, detail="Заказ с этим ключом уже оформляется, повторите запрос")
+    
+    await apply_order_to_product_stats(order)
+    await publish_order_event("order.created", order)
+    outbox_wakeup.set()  # deliver the Telegram notification now rather than at the next poll
     
     # Note: Bonus progress is updated only when order status changes to "delivered"
     # See update_order_status endpoint
@@ -900,7 +1644,7 @@ async def get_favorites(user=Depends(get_current_user)):
     if not product_ids:
         return {"items": []}
     
-    products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(100)
+    products = await db.products.find({"id": {"$in": product_ids}}, PRODUCT_PROJECTION).to_list(100)
     return {"items": products}
 
 @api_router.post("/favorites/add")
@@ -932,70 +1676,174 @@ async def check_favorite(product_id: str, user=Depends(get_current_user)):
 
 # ==================== RELATED PRODUCTS ====================
 
+RECOMMENDATIONS_REFRESH_SECONDS = int(os.environ.get('RECOMMENDATIONS_REFRESH_SECONDS', 6 * 3600))
+recommendations_status = {"last_build_at": None, "last_build_ms": 0.0, "products": 0, "order_lines": 0}
+
+async def rebuild_recommendations():
+    """Rebuild product_recommendations from the co-purchase counts of all non-cancelled orders"""
+    started = time.perf_counter()
+    built_at = datetime.now(timezone.utc).isoformat()
+    
+    order_ids, product_ids = [], []
+    cursor = db.orders.find({"status": {"$ne": "cancelled"}}, {"_id": 0, "id": 1, "items.product_id": 1})
+    async for order in cursor:
+        for item in order.get("items", []):
+            if item.get("product_id"):
+                order_ids.append(order["id"])
+                product_ids.append(item["product_id"])
+    
+    neighbours = await asyncio.to_thread(build_co_purchase, order_ids, product_ids)
+    
+    ops = [
+        ReplaceOne({"product_id": pid}, {"product_id": pid, "related": related, "built_at": built_at}, upsert=True)
+        for pid, related in neighbours.items()
+    ]
+    for i in range(0, len(ops), 1000):
+        await db.product_recommendations.bulk_write(ops[i:i + 1000], ordered=False)
+    await db.product_recommendations.delete_many({"built_at": {"$lt": built_at}})
+    
+    recommendations_status.update({
+        "last_build_at": built_at,
+        "last_build_ms": round((time.perf_counter() - started) * 1000, 1),
+        "products": len(neighbours),
+        "order_lines": len(order_ids)
+    })
+    logger.info(f"Recommendations rebuilt: {recommendations_status}")
+
+async def refresh_recommendations_periodically():
+    """Background loop rebuilding recommendations every RECOMMENDATIONS_REFRESH_SECONDS"""
+    while True:
+        try:
+            await rebuild_recommendations()
+        except Exception as e:
+            logger.error(f"Recommendations rebuild failed: {e}")
+        await asyncio.sleep(RECOMMENDATIONS_REFRESH_SECONDS)
+
 @api_router.get("/products/{product_id}/related", response_model=List[ProductResponse])
 async def get_related_products(product_id: str, limit: int = 4):
-    """Get related products from same category"""
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    """Get products frequently bought together, filled up from the same category"""
+    recommendations = await db.product_recommendations.find_one({"product_id": product_id}, {"_id": 0, "related": 1})
+    
+    related = []
+    if recommendations:
+        ranked_ids = [r["product_id"] for r in recommendations["related"]]
+        found = await db.products.find({"id": {"$in": ranked_ids}}, PRODUCT_PROJECTION).to_list(len(ranked_ids))
+        rank = {pid: i for i, pid in enumerate(ranked_ids)}
+        related = sorted(found, key=lambda p: rank[p["id"]])[:limit]
+        if len(related) == limit:
+            return related
+    
+    product = await db.products.find_one({"id": product_id}, {"_id": 0, "category_id": 1})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    query = {"id": {"$ne": product_id}}
+    query = {"id": {"$nin": [product_id] + [r["id"] for r in related]}}
     
     # If product has category, find from same category
     if product.get("category_id"):
         query["category_id"] = product["category_id"]
     
-    related = await db.products.find(query, {"_id": 0}).limit(limit).to_list(limit)
+    related.extend(await db.products.find(query, PRODUCT_PROJECTION).limit(limit - len(related)).to_list(limit))
     
     # If not enough products from same category, add random ones
     if len(related) < limit:
         additional_query = {"id": {"$nin": [product_id] + [r["id"] for r in related]}}
-        additional = await db.products.find(additional_query, {"_id": 0}).limit(limit - len(related)).to_list(limit)
+        additional = await db.products.find(additional_query, PRODUCT_PROJECTION).limit(limit - len(related)).to_list(limit)
         related.extend(additional)
     
     return related
 
+@api_router.post("/admin/recommendations/rebuild")
+async def rebuild_recommendations_admin(user=Depends(get_current_user)):
+    """Rebuild frequently-bought-together recommendations now (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await rebuild_recommendations()
+    return recommendations_status
+
+# ==================== ANALOG GRAPH ====================
+
+@api_router.get("/products/{product_id}/analogs", response_model=List[ProductResponse])
+async def get_product_analogs(product_id: str, depth: Optional[int] = Query(None, ge=1, le=10), limit: int = 50):
+    """Get interchangeable products via cross references (depth=1 - direct references only)"""
+    product = await db.products.find_one({"id": product_id}, {"_id": 0, "article_key": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    analog_ids = [pid for pid in analog_graph.analog_product_ids(product.get("article_key"), depth) if pid != product_id]
+    analog_ids = analog_ids[:min(limit, 100)]
+    if not analog_ids:
+        return []
+    
+    products = await db.products.find({"id": {"$in": analog_ids}}, {"_id": 0}).to_list(len(analog_ids))
+    products_map = {p["id"]: p for p in products}
+    return [products_map[pid] for pid in analog_ids if pid in products_map]
+
+@api_router.get("/admin/analog-graph")
+async def get_analog_graph_stats(user=Depends(get_current_user)):
+    """Analog graph size and rebuild time (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return analog_graph.stats()
+
+@api_router.post("/admin/analog-graph/rebuild")
+async def rebuild_analog_graph_admin(user=Depends(get_current_user)):
+    """Rebuild analog graph from the products collection (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await rebuild_analog_graph()
+    await publish_product_change("products.rebuilt")
+    return analog_graph.stats()
+
 # ==================== TELEGRAM NOTIFICATIONS ====================
 
-async def send_telegram_order_notification(order: dict, user: dict):
-    """Send order notification to Telegram with full product details"""
-    try:
-        settings = await db.settings.find_one({"key": "telegram"}, {"_id": 0})
-        if not settings or not settings.get("value", {}).get("enabled"):
-            return
-        
-        bot_token = settings["value"].get("bot_token", "")
-        chat_id = settings["value"].get("chat_id", "")
-        
-        if not bot_token or not chat_id:
-            return
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+
+# Every Bot API call goes through this gateway (pooled client, rate limits); started on startup
+telegram = TelegramGateway(TELEGRAM_API_URL)
+
+# Order notifications go through a durable outbox: the message is written in the
+# checkout transaction and delivered by dispatch_outbox in the background.
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_LEASE_SECONDS = 60  # a claimed message is retried after this if its worker died; renewed while sending
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE = 2  # seconds, doubled on every failed attempt
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_RETENTION = 7 * 24 * 3600  # sent/skipped messages are removed by a TTL index
+
+outbox_wakeup = asyncio.Event()
+
+def format_order_notification(order: dict) -> str:
+    """Telegram message for a new order with full product details"""
+    # Format items with full details
+    items_lines = []
+    for item in order["items"]:
+        article = item.get('article', 'N/A')
+        name = item.get('name', 'Товар')
+        manufacturer = item.get('manufacturer', '')
+        quantity = item.get('quantity', 1)
+        price = item.get('price', 0)
+        line_total = price * quantity
         
-        # Format items with full details
-        items_lines = []
-        for item in order["items"]:
-            article = item.get('article', 'N/A')
-            name = item.get('name', 'Товар')
-            manufacturer = item.get('manufacturer', '')
-            quantity = item.get('quantity', 1)
-            price = item.get('price', 0)
-            line_total = price * quantity
-            
-            # Format: Article | Name | Manufacturer | Qty × Price = Total
-            manufacturer_text = f" ({manufacturer})" if manufacturer else ""
-            items_lines.append(
-                f"  📦 *{article}*\n"
-                f"      {name}{manufacturer_text}\n"
-                f"      {quantity} шт. × {price:,.0f} ₽ = *{line_total:,.0f} ₽*"
-            )
-        
-        items_text = "\n\n".join(items_lines)
-        
-        # Add comment if present
-        comment_text = ""
-        if order.get('comment'):
-            comment_text = f"\n💬 *Комментарий:* {order['comment']}"
-        
-        message = f"""🛒 *НОВЫЙ ЗАКАЗ!*
+        # Format: Article | Name | Manufacturer | Qty × Price = Total
+        manufacturer_text = f" ({manufacturer})" if manufacturer else ""
+        items_lines.append(
+            f"  📦 *{article}*\n"
+            f"      {name}{manufacturer_text}\n"
+            f"      {quantity} шт. × {price:,.0f} ₽ = *{line_total:,.0f} ₽*"
+        )
+    
+    items_text = "\n\n".join(items_lines)
+    
+    # Add comment if present
+    comment_text = ""
+    if order.get('comment'):
+        comment_text = f"\n💬 *Комментарий:* {order['comment']}"
+    
+    message = f"""🛒 *НОВЫЙ ЗАКАЗ!*
 
 📋 *Заказ #{order['id'][:8]}*
 📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}
@@ -1013,16 +1861,130 @@ async def send_telegram_order_notification(order: dict, user: dict):
 ━━━━━━━━━━━━━━━━━━
 💰 *ИТОГО: {order['total']:,.0f} ₽*
 💳 *Оплата:* наличными при получении"""
+    return message
+
+async def enqueue_order_notification(order: dict, session=None):
+    """Write the order notification to the outbox (inside the caller's transaction)"""
+    now = datetime.now(timezone.utc)
+    await db.outbox.insert_one({
+        "id": str(uuid.uuid4()),
+        "kind": "telegram_order",
+        "order_id": order["id"],
+        "text": format_order_notification(order),
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now
+    }, session=session)
+
+async def deliver_outbox_message(message: dict) -> str:
+    """Send one outbox message; returns the final status ("sent" or "skipped")"""
+    value = await get_setting("telegram") or {}
+    bot_token = value.get("bot_token", "")
+    chat_id = value.get("chat_id", "")
+    if not value.get("enabled") or not bot_token or not chat_id:
+        return "skipped"
+    
+    await telegram.send_message(bot_token, chat_id, message["text"], parse_mode="Markdown")
+    return "sent"
+
+async def claim_outbox_message() -> Optional[dict]:
+    """Lease the oldest due message; it becomes due again if not resolved within the lease"""
+    now = datetime.now(timezone.utc)
+    lease_id = str(uuid.uuid4())
+    message = await db.outbox.find_one_and_update(
+        {"status": "pending", "next_attempt_at": {"$lte": now}},
+        {"$set": {"next_attempt_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS), "lease_id": lease_id},
+         "$inc": {"attempts": 1}},
+        sort=[("next_attempt_at", ASCENDING), ("created_at", ASCENDING)],
+        projection={"_id": 0}
+    )
+    if message:
+        message["lease_id"] = lease_id
+    return message
+
+async def renew_outbox_lease(message: dict):
+    """
+    Extend the lease while a send is in progress: rate-limit waits and 429
+    retries inside the gateway can take longer than one lease, and an expired
+    lease would let another worker send the message a second time.
+    """
+    while True:
+        await asyncio.sleep(OUTBOX_LEASE_SECONDS / 3)
+        try:
+            await db.outbox.update_one(
+                {"id": message["id"], "lease_id": message["lease_id"], "status": "pending"},
+                {"$set": {"next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+            )
+        except Exception as e:
+            logger.error(f"Outbox lease renewal of {message['id']} failed: {e}")
 
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        async with httpx.AsyncClient() as client:
-            await client.post(url, json={
-                "chat_id": chat_id,
-                "text": message,
-                "parse_mode": "Markdown"
-            })
+async def process_outbox_message(message: dict):
+    attempts = message["attempts"] + 1
+    renewer = asyncio.create_task(renew_outbox_lease(message))
+    try:
+        status = await deliver_outbox_message(message)
+        error = None
     except Exception as e:
-        logger.error(f"Failed to send Telegram notification: {e}")
+        error = e
+    finally:
+        renewer.cancel()  # before the backoff below, which the renewal would overwrite
+    
+    now = datetime.now(timezone.utc)
+    if error is None:
+        await db.outbox.update_one({"id": message["id"]}, {"$set": {"status": status, "finished_at": now}})
+        return
+    if (isinstance(error, TelegramError) and error.permanent) or attempts >= OUTBOX_MAX_ATTEMPTS:
+        logger.error(f"Outbox message {message['id']} dead-lettered after {attempts} attempts: {error}")
+        await db.outbox.update_one({"id": message["id"]}, {"$set": {
+            "status": "dead", "last_error": str(error), "dead_at": now
+        }})
+        return
+    delay = getattr(error, "retry_after", None) or min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    logger.warning(f"Outbox message {message['id']} attempt {attempts} failed, retry in {delay}s: {error}")
+    await db.outbox.update_one({"id": message["id"]}, {"$set": {
+        "next_attempt_at": now + timedelta(seconds=delay), "last_error": str(error)
+    }})
+
+async def dispatch_outbox():
+    """Background loop delivering due outbox messages oldest first"""
+    while True:
+        outbox_wakeup.clear()
+        try:
+            while message := await claim_outbox_message():
+                await process_outbox_message(message)
+        except Exception as e:
+            logger.error(f"Outbox dispatch failed: {e}")
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+@api_router.get("/admin/outbox")
+async def get_outbox(user=Depends(get_current_user)):
+    """Outbox message counts by status and the dead-lettered messages (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    counts = await db.outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]).to_list(None)
+    dead = await db.outbox.find({"status": "dead"}, {"_id": 0, "text": 0}).sort("dead_at", -1).to_list(100)
+    return {"counts": {c["_id"]: c["count"] for c in counts}, "dead": dead}
+
+@api_router.post("/admin/outbox/{message_id}/retry")
+async def retry_outbox_message(message_id: str, user=Depends(get_current_user)):
+    """Requeue a dead-lettered message (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    result = await db.outbox.update_one(
+        {"id": message_id, "status": "dead"},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": datetime.now(timezone.utc)},
+         "$unset": {"dead_at": ""}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Dead message not found")
+    outbox_wakeup.set()
+    return {"message": "Message requeued"}
 
 @api_router.get("/admin/telegram-settings")
 async def get_telegram_settings(user=Depends(get_current_user)):
@@ -1044,6 +2006,7 @@ async def update_telegram_settings(data: TelegramSettings, user=Depends(get_curr
         {"$set": {"key": "telegram", "value": data.model_dump()}},
         upsert=True
     )
+    await settings_changed("telegram")
     return {"message": "Telegram settings updated"}
 
 @api_router.post("/admin/telegram-test")
@@ -1063,17 +2026,28 @@ async def test_telegram_notification(user=Depends(get_current_user)):
     
     try:
         message = "✅ Тестовое уведомление от avopt.store\nНастройка Telegram успешна!"
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json={
-                "chat_id": chat_id,
-                "text": message
-            })
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail=f"Telegram API error: {response.text}")
+        await telegram.send_message(bot_token, chat_id, message)
         return {"message": "Test notification sent"}
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to Telegram: {str(e)}")
+    except TelegramError as e:
+        if e.status_code is None:
+            raise HTTPException(status_code=500, detail=f"Failed to connect to Telegram: {e.description}")
+        raise HTTPException(status_code=400, detail=f"Telegram API error: {e.description}")
+
+@api_router.get("/admin/telegram/metrics")
+async def get_telegram_metrics(user=Depends(get_current_user)):
+    """Bot API call counters and latency histograms of this worker (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return telegram.metrics()
+
+@api_router.get("/admin/event-bus")
+async def get_event_bus_stats(user=Depends(get_current_user)):
+    """Event bus mode and subscriptions of this worker (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return event_bus.stats()
 
 # ==================== PARTNER BRANDS ====================
 
@@ -1248,7 +2222,26 @@ async def delete_avatar(user=Depends(get_current_user)):
 
 # Telegram Chat Bot token
 TELEGRAM_CHAT_BOT_TOKEN = os.environ.get('TELEGRAM_CHAT_BOT_TOKEN')
-telegram_chat_id_mapping = {}  # Maps telegram_chat_id -> website_chat_id
+# Live chat events for the customer widget (see /chat/ws) go to topic "chat_user:<user id>"
+async def publish_chat_event(user_id: str, event: dict):
+    await event_bus.publish(f"chat_user:{user_id}", event)
+
+async def publish_unread_count(user_id: str, chat_id: str):
+    count = await db.chat_messages.count_documents({"chat_id": chat_id, "sender_type": "admin", "read": False})
+    await publish_chat_event(user_id, {"type": "unread", "count": count})
+
+async def publish_chat_message(user_id: str, message: dict):
+    """Push a new message to the chat owner, plus the unread count for support messages"""
+    await publish_chat_event(user_id, {"type": "message.created", "message": {k: v for k, v in message.items() if k != "_id"}})
+    if message["sender_type"] == "admin":
+        await publish_unread_count(user_id, message["chat_id"])
+
+async def send_chat_bot_message(chat_id: str, text: str, **params):
+    """Send a message from the chat bot; failures are logged, not raised"""
+    try:
+        await telegram.send_message(TELEGRAM_CHAT_BOT_TOKEN, chat_id, text, **params)
+    except TelegramError as e:
+        logger.error(f"Failed to send to Telegram chat: {e}")
 
 async def send_to_telegram_chat(chat_id: str, user_name: str, text: str, message_type: str = "text", file_url: str = None):
     """Send user message to Telegram for admin to see"""
@@ -1277,19 +2270,7 @@ async def send_to_telegram_chat(chat_id: str, user_name: str, text: str, message
     # Add reply keyboard with chat_id
     formatted_text += f"\n\n💡 _Чтобы ответить, используйте команду:_\n`/reply {chat_id} Ваш ответ`"
     
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/sendMessage",
-                json={
-                    "chat_id": admin_tg_chat_id,
-                    "text": formatted_text,
-                    "parse_mode": "Markdown"
-                },
-                timeout=10
-            )
-    except Exception as e:
-        logging.error(f"Failed to send to Telegram chat: {e}")
+    await send_chat_bot_message(admin_tg_chat_id, formatted_text, parse_mode="Markdown")
 
 @api_router.post("/chat/send")
 async def send_chat_message(message: ChatMessage, user=Depends(get_current_user)):
@@ -1326,9 +2307,11 @@ async def send_chat_message(message: ChatMessage, user=Depends(get_current_user)
         "edited": False
     }
     await db.chat_messages.insert_one(chat_message)
+    await publish_chat_message(user["id"], chat_message)
     
     # Send to Telegram
-    await send_to_telegram_chat(chat_id, user["name"], message.text)
+    # Rate-limit waits in the gateway must not hold the customer's request
+    run_in_background(send_to_telegram_chat(chat_id, user["name"], message.text))
     
     return {"id": msg_id, "chat_id": chat_id}
 
@@ -1402,6 +2385,7 @@ async def send_admin_message(chat_id: str, message: ChatMessage, user=Depends(ge
     await db.chat_messages.insert_one(chat_message)
     
     await db.chats.update_one({"id": chat_id}, {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
+    await publish_chat_message(chat["user_id"], chat_message)
     
     return {"id": msg_id}
 
@@ -1479,6 +2463,7 @@ async def admin_send_chat_media(
     await db.chat_messages.insert_one(chat_message)
     
     await db.chats.update_one({"id": chat_id}, {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
+    await publish_chat_message(chat["user_id"], chat_message)
     
     return {"id": msg_id}
 
@@ -1505,8 +2490,56 @@ async def mark_messages_read(user=Depends(get_current_user)):
             {"chat_id": chat["id"], "sender_type": "admin", "read": False},
             {"$set": {"read": True}}
         )
+        await publish_chat_event(user["id"], {"type": "unread", "count": 0})
     return {"message": "Messages marked as read"}
 
+WS_AUTH_TIMEOUT = 10  # seconds for the client to send its token
+
+@api_router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Push channel for the chat widget. The client first sends {"type": "auth", "token": <JWT>};
+    the server answers {"type": "ready", "unread": n} and then pushes message.created,
+    message.updated, message.deleted and unread events of the user's chat.
+    {"type": "ping"} is answered with {"type": "pong"}.
+    """
+    await websocket.accept()
+    try:
+        auth = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+        token = auth.get("token") if isinstance(auth, dict) else None
+        user = await user_from_token(token or "")
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, HTTPException, ValueError):
+        await websocket.close(code=4401)
+        return
+    
+    # Subscribe before reading the unread count so no event falls in between
+    async with event_bus.subscribe(f"chat_user:{user['id']}") as subscription:
+        chat = await db.chats.find_one({"user_id": user["id"]}, {"_id": 0, "id": 1})
+        unread = await db.chat_messages.count_documents(
+            {"chat_id": chat["id"], "sender_type": "admin", "read": False}
+        ) if chat else 0
+        await websocket.send_json({"type": "ready", "unread": unread})
+        
+        async def forward_events():
+            try:
+                while True:
+                    await websocket.send_json(await subscription.get())
+            except Exception:
+                pass  # connection closed; the receive loop below ends too
+        
+        forwarder = asyncio.create_task(forward_events())
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if isinstance(message, dict) and message.get("type") == "ping":
+                    await websocket.send_json({"type": "pong"})
+        except (WebSocketDisconnect, ValueError):
+            pass
+        finally:
+            forwarder.cancel()
+
 # ==================== CHAT MEDIA UPLOAD ====================
 
 @api_router.post("/chat/upload")
@@ -1586,9 +2619,10 @@ async def send_chat_media(
         "edited": False
     }
     await db.chat_messages.insert_one(chat_message)
+    await publish_chat_message(user["id"], chat_message)
     
     # Send notification to Telegram
-    await send_to_telegram_chat(chat_id, user["name"], caption or filename, message_type, file_url)
+    run_in_background(send_to_telegram_chat(chat_id, user["name"], caption or filename, message_type, file_url))
     
     return {"id": msg_id, "chat_id": chat_id}
 
@@ -1598,13 +2632,90 @@ class TelegramUpdate(BaseModel):
     update_id: int
     message: Optional[Dict[str, Any]] = None
 
+# Updates are stored and acked at once, then handled by process_telegram_updates.
+# The unique update_id drops Telegram's redeliveries; it keeps trying for 24h.
+TELEGRAM_UPDATE_TTL = 24 * 3600
+TELEGRAM_UPDATE_LEASE_SECONDS = 60
+TELEGRAM_UPDATE_MAX_ATTEMPTS = 3
+TELEGRAM_UPDATE_POLL_SECONDS = 5
+REPLY_CHAT_PREFIX_MIN = 8  # /chats lists the first 8 characters of each chat id
+
+telegram_updates_wakeup = asyncio.Event()
+
 @api_router.post("/telegram/chat-webhook")
 async def telegram_chat_webhook(update: TelegramUpdate):
-    """Webhook for Telegram chat bot - receives admin replies"""
-    if not update.message:
+    """Webhook for Telegram chat bot - queues the update and acks immediately"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.telegram_updates.insert_one({
+            "update_id": update.update_id,
+            "update": update.model_dump(),
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "received_at": now
+        })
+    except DuplicateKeyError:
+        logger.info(f"Duplicate Telegram update {update.update_id} ignored")
         return {"ok": True}
+    telegram_updates_wakeup.set()
+    return {"ok": True}
+
+async def claim_telegram_update() -> Optional[dict]:
+    """Lease the oldest due update; it becomes due again if not resolved within the lease"""
+    now = datetime.now(timezone.utc)
+    return await db.telegram_updates.find_one_and_update(
+        {"status": "pending", "next_attempt_at": {"$lte": now}},
+        {"$set": {"next_attempt_at": now + timedelta(seconds=TELEGRAM_UPDATE_LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+        sort=[("next_attempt_at", ASCENDING), ("update_id", ASCENDING)],
+        projection={"_id": 0}
+    )
+
+async def process_telegram_updates():
+    """Background loop handling queued chat bot updates in update_id order"""
+    while True:
+        telegram_updates_wakeup.clear()
+        try:
+            while record := await claim_telegram_update():
+                try:
+                    await handle_telegram_update(record["update"])
+                    status = {"status": "done"}
+                except Exception as e:
+                    attempts = record["attempts"] + 1
+                    logger.error(f"Telegram update {record['update_id']} attempt {attempts} failed: {e}")
+                    status = {"status": "failed" if attempts >= TELEGRAM_UPDATE_MAX_ATTEMPTS else "pending",
+                              "last_error": str(e)}
+                    if status["status"] == "pending":
+                        status["next_attempt_at"] = datetime.now(timezone.utc) + timedelta(seconds=2 ** attempts)
+                await db.telegram_updates.update_one({"update_id": record["update_id"]}, {"$set": status})
+        except Exception as e:
+            logger.error(f"Telegram update processing failed: {e}")
+        try:
+            await asyncio.wait_for(telegram_updates_wakeup.wait(), TELEGRAM_UPDATE_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def find_chat_for_reply(chat_ref: str):
+    """Chat by full id or by a unique id prefix; returns (chat, error message)"""
+    chat = await db.chats.find_one({"id": chat_ref})
+    if chat:
+        return chat, None
+    if len(chat_ref) < REPLY_CHAT_PREFIX_MIN:
+        return None, f"❌ Чат с ID '{chat_ref}' не найден"
+    # Anchored, escaped prefix: an index range scan on id, not a collection scan
+    chats = await db.chats.find({"id": {"$regex": f"^{re.escape(chat_ref)}"}}).limit(2).to_list(2)
+    if len(chats) > 1:
+        return None, f"❌ ID '{chat_ref}' подходит к нескольким чатам, укажите больше символов"
+    if not chats:
+        return None, f"❌ Чат с ID '{chat_ref}' не найден"
+    return chats[0], None
+
+async def handle_telegram_update(update: dict):
+    """Admin replies and commands sent to the chat bot"""
+    message = update.get("message")
+    if not message:
+        return
     
-    message = update.message
     chat_id_tg = str(message.get("chat", {}).get("id", ""))
     text = message.get("text", "")
     
@@ -1615,17 +2726,12 @@ async def telegram_chat_webhook(update: TelegramUpdate):
             website_chat_id = parts[0]
             reply_text = parts[1]
             
-            # Find the chat
-            chat = await db.chats.find_one({"id": website_chat_id})
-            if not chat:
-                # Try partial match
-                chat = await db.chats.find_one({"id": {"$regex": f"^{website_chat_id}"}})
-            
+            chat, not_found = await find_chat_for_reply(website_chat_id)
             if chat:
-                # Send admin message to chat
-                msg_id = str(uuid.uuid4())
+                # Send admin message to chat. Keyed on update_id: an update retried
+                # after a partial failure finds its message instead of adding another.
                 chat_message = {
-                    "id": msg_id,
+                    "id": str(uuid.uuid4()),
                     "chat_id": chat["id"],
                     "user_id": "telegram_admin",
                     "user_name": "Поддержка (Telegram)",
@@ -1634,39 +2740,28 @@ async def telegram_chat_webhook(update: TelegramUpdate):
                     "message_type": "text",
                     "created_at": datetime.now(timezone.utc).isoformat(),
                     "read": False,
-                    "edited": False
+                    "edited": False,
+                    "telegram_update_id": update["update_id"]
                 }
-                await db.chat_messages.insert_one(chat_message)
-                await db.chats.update_one({"id": chat["id"]}, {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
+                result = await db.chat_messages.update_one(
+                    {"telegram_update_id": update["update_id"]},
+                    {"$setOnInsert": chat_message},
+                    upsert=True
+                )
+                if result.upserted_id is not None:
+                    await db.chats.update_one({"id": chat["id"]}, {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
+                else:
+                    chat_message = await db.chat_messages.find_one({"telegram_update_id": update["update_id"]}, {"_id": 0})
+                await publish_chat_message(chat["user_id"], chat_message)  # the widget ignores a repeated id
                 
                 # Send confirmation to Telegram
-                try:
-                    async with httpx.AsyncClient() as client:
-                        await client.post(
-                            f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/sendMessage",
-                            json={
-                                "chat_id": chat_id_tg,
-                                "text": f"✅ Сообщение отправлено пользователю {chat['user_name']}",
-                                "reply_to_message_id": message.get("message_id")
-                            },
-                            timeout=10
-                        )
-                except:
-                    pass
+                await send_chat_bot_message(
+                    chat_id_tg,
+                    f"✅ Сообщение отправлено пользователю {chat['user_name']}",
+                    reply_to_message_id=message.get("message_id")
+                )
             else:
-                # Chat not found
-                try:
-                    async with httpx.AsyncClient() as client:
-                        await client.post(
-                            f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/sendMessage",
-                            json={
-                                "chat_id": chat_id_tg,
-                                "text": f"❌ Чат с ID '{website_chat_id}' не найден"
-                            },
-                            timeout=10
-                        )
-                except:
-                    pass
+                await send_chat_bot_message(chat_id_tg, not_found)
     
     # Check for /start command - save admin chat ID
     elif text == "/start":
@@ -1675,58 +2770,34 @@ async def telegram_chat_webhook(update: TelegramUpdate):
             {"$set": {"admin_chat_id": chat_id_tg, "updated_at": datetime.now(timezone.utc).isoformat()}},
             upsert=True
         )
-        try:
-            async with httpx.AsyncClient() as client:
-                await client.post(
-                    f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/sendMessage",
-                    json={
-                        "chat_id": chat_id_tg,
-                        "text": "✅ Чат-бот подключен!\n\nТеперь вы будете получать сообщения от пользователей сайта.\n\nДля ответа используйте команду:\n`/reply <chat_id> Ваш ответ`",
-                        "parse_mode": "Markdown"
-                    },
-                    timeout=10
-                )
-        except:
-            pass
+        await send_chat_bot_message(
+            chat_id_tg,
+            "✅ Чат-бот подключен!\n\nТеперь вы будете получать сообщения от пользователей сайта.\n\nДля ответа используйте команду:\n`/reply <chat_id> Ваш ответ`",
+            parse_mode="Markdown"
+        )
     
     # Check for /chats command - list active chats
     elif text == "/chats":
         chats = await db.chats.find({}, {"_id": 0}).sort("updated_at", -1).limit(10).to_list(10)
         if chats:
+            unread_counts = await db.chat_messages.aggregate([
+                {"$match": {"chat_id": {"$in": [c["id"] for c in chats]}, "sender_type": "user", "read": False}},
+                {"$group": {"_id": "$chat_id", "count": {"$sum": 1}}}
+            ]).to_list(None)
+            unread_by_chat = {u["_id"]: u["count"] for u in unread_counts}
+            
             chat_list = "📋 *Последние чаты:*\n\n"
             for c in chats:
-                unread = await db.chat_messages.count_documents({"chat_id": c["id"], "sender_type": "user", "read": False})
+                unread = unread_by_chat.get(c["id"], 0)
                 status = "🔴" if unread > 0 else "⚪"
                 chat_list += f"{status} `{c['id'][:8]}` - {c['user_name']}"
                 if unread > 0:
                     chat_list += f" ({unread} новых)"
                 chat_list += "\n"
             
-            try:
-                async with httpx.AsyncClient() as client:
-                    await client.post(
-                        f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/sendMessage",
-                        json={
-                            "chat_id": chat_id_tg,
-                            "text": chat_list,
-                            "parse_mode": "Markdown"
-                        },
-                        timeout=10
-                    )
-            except:
-                pass
+            await send_chat_bot_message(chat_id_tg, chat_list, parse_mode="Markdown")
         else:
-            try:
-                async with httpx.AsyncClient() as client:
-                    await client.post(
-                        f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/sendMessage",
-                        json={"chat_id": chat_id_tg, "text": "📭 Чатов пока нет"},
-                        timeout=10
-                    )
-            except:
-                pass
-    
-    return {"ok": True}
+            await send_chat_bot_message(chat_id_tg, "📭 Чатов пока нет")
 
 @api_router.post("/admin/chat/setup-telegram-webhook")
 async def setup_telegram_chat_webhook(user=Depends(get_current_user)):
@@ -1746,23 +2817,16 @@ async def setup_telegram_chat_webhook(user=Depends(get_current_user)):
     webhook_url = f"{backend_url}/api/telegram/chat-webhook"
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Delete existing webhook first
-            await client.post(f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/deleteWebhook")
-            
-            # Set new webhook
-            res = await client.post(
-                f"https://api.telegram.org/bot{TELEGRAM_CHAT_BOT_TOKEN}/setWebhook",
-                json={"url": webhook_url}
-            )
-            result = res.json()
-            
-            if result.get("ok"):
-                return {"success": True, "message": "Webhook установлен", "url": webhook_url}
-            else:
-                raise HTTPException(status_code=400, detail=result.get("description", "Ошибка установки webhook"))
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка подключения к Telegram: {str(e)}")
+        # Delete existing webhook first
+        await telegram.call(TELEGRAM_CHAT_BOT_TOKEN, "deleteWebhook")
+        
+        # Set new webhook
+        await telegram.call(TELEGRAM_CHAT_BOT_TOKEN, "setWebhook", {"url": webhook_url})
+        return {"success": True, "message": "Webhook установлен", "url": webhook_url}
+    except TelegramError as e:
+        if e.status_code is None:
+            raise HTTPException(status_code=500, detail=f"Ошибка подключения к Telegram: {e.description}")
+        raise HTTPException(status_code=400, detail=e.description or "Ошибка установки webhook")
 
 # ==================== CHAT MANAGEMENT (ADMIN) ====================
 
@@ -1818,14 +2882,21 @@ async def edit_chat_message(chat_id: str, message_id: str, message: ChatMessage,
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
+    edited_at = datetime.now(timezone.utc).isoformat()
     result = await db.chat_messages.update_one(
         {"id": message_id, "chat_id": chat_id},
-        {"$set": {"text": message.text, "edited": True, "edited_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"text": message.text, "edited": True, "edited_at": edited_at}}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Message not found")
     
+    chat = await db.chats.find_one({"id": chat_id}, {"_id": 0, "user_id": 1})
+    if chat:
+        await publish_chat_event(chat["user_id"], {
+            "type": "message.updated", "message_id": message_id, "text": message.text, "edited_at": edited_at
+        })
+    
     return {"message": "Message updated"}
 
 @api_router.delete("/admin/chats/{chat_id}/messages/{message_id}")
@@ -1839,6 +2910,11 @@ async def delete_chat_message(chat_id: str, message_id: str, user=Depends(get_cu
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Message not found")
     
+    chat = await db.chats.find_one({"id": chat_id}, {"_id": 0, "user_id": 1})
+    if chat:
+        await publish_chat_event(chat["user_id"], {"type": "message.deleted", "message_id": message_id})
+        await publish_unread_count(chat["user_id"], chat_id)
+    
     return {"message": "Message deleted"}
 
 # ==================== BONUS PROGRAM ====================
@@ -2598,107 +3674,271 @@ async def get_admin_bonus_history(user=Depends(get_current_user)):
 
 # ==================== IMPORT/EXPORT ====================
 
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+IMPORT_JOB_LEASE = 120  # seconds a worker owns a running job without reporting progress
+IMPORT_JOB_ACTIVE = ["queued", "running"]
+IMPORT_JOB_PROJECTION = {"_id": 0, "path": 0, "lease_until": 0}
+IMPORT_FORMATS = (".csv", ".xlsx")
+
+class ImportCancelled(Exception):
+    pass
+
+def import_lease_until() -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=IMPORT_JOB_LEASE)).isoformat()
+
+async def claim_import_job(job_id: str) -> Optional[dict]:
+    """Take ownership of a queued job, or of a running one whose worker stopped renewing its lease"""
+    while True:
+        now = datetime.now(timezone.utc).isoformat()
+        claim = {"status": "running", "lease_until": import_lease_until()}
+        job = await db.import_jobs.find_one_and_update(
+            {
+                "id": job_id,
+                "status": {"$in": IMPORT_JOB_ACTIVE},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+            },
+            {"$set": claim, "$min": {"started_at": now}},
+            projection={"_id": 0}
+        )
+        if job:
+            return {**job, **claim}
+        
+        job = await db.import_jobs.find_one({"id": job_id}, {"_id": 0, "status": 1})
+        if not job or job["status"] not in IMPORT_JOB_ACTIVE:
+            return None
+        await asyncio.sleep(IMPORT_JOB_LEASE / 4)
+
+def import_job_progress(importer, rows_done: int, started: float) -> dict:
+    elapsed = time.monotonic() - started
+    return {
+        **importer.result(),
+        "rows_parsed": importer.rows,
+        "rows_written": 0 if importer.dry_run else importer.imported + importer.updated,
+        "rows_failed": importer.failed,
+        "chunks": importer.chunks,
+        "rows_per_second": round((importer.rows - rows_done) / elapsed, 1) if elapsed > 0 else 0,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+async def run_import_job(job_id: str):
+    """Worker: stream a staged upload into products, saving progress after every chunk"""
+    job = await claim_import_job(job_id)
+    if not job:
+        return
+    
+    path = Path(job["path"])
+    rows_done = job.get("rows_parsed", 0)
+    state = {**job, "rows": rows_done}
+    started = time.monotonic()
+    importer = None
+    
+    async def save_chunk(articles: List[str], chunk_importer):
+        nonlocal importer
+        importer = chunk_importer
+        if articles:
+            product_ids = []
+            async for product in db.products.find({"article": {"$in": articles}}, SUGGEST_FIELDS):
+                index_product_in_memory(product)
+                product_ids.append(product["id"])
+            await publish_product_change("products.changed", product_ids)
+        saved = await db.import_jobs.find_one_and_update(
+            {"id": job_id},
+            {"$set": {**import_job_progress(importer, rows_done, started), "lease_until": import_lease_until()}},
+            projection={"_id": 0, "cancel_requested": 1}
+        )
+        logger.info(f"Import job {job_id}: {chunk_importer.progress()}")
+        if saved and saved.get("cancel_requested"):
+            raise ImportCancelled()
+    
+    update = {}
+    try:
+        if not path.exists():
+            raise FileNotFoundError("файл импорта не найден")
+        if path.suffix == ".xlsx":
+            importer = await import_product_rows(
+                db.products, iter_xlsx_rows(path), chunk_size=job["chunk_size"],
+                on_chunk=save_chunk, state=state, dry_run=job.get("dry_run", False)
+            )
+        else:
+            with open(path, "rb") as staged:
+                importer = await import_product_rows(
+                    db.products, iter_csv_rows(staged), chunk_size=job["chunk_size"],
+                    on_chunk=save_chunk, state=state, dry_run=job.get("dry_run", False)
+                )
+        # Catalog products that are not in the file (new rows only exist after a real run)
+        if importer.existing_articles is not None:
+            total_products = await db.products.count_documents({})
+            written_new = 0 if importer.dry_run else len(importer.new_articles)
+            update["missing"] = max(0, total_products - len(importer.existing_articles) - written_new)
+        update["status"] = "completed"
+    except ImportCancelled:
+        update["status"] = "cancelled"
+    except Exception as e:
+        logger.error(f"Import job {job_id} failed: {e}")
+        update.update({"status": "failed", "error": str(e)})
+    
+    if importer:
+        update.update(import_job_progress(importer, rows_done, started))
+    update["finished_at"] = datetime.now(timezone.utc).isoformat()
+    await db.import_jobs.update_one({"id": job_id}, {"$set": update, "$unset": {"lease_until": ""}})
+    path.unlink(missing_ok=True)
+    logger.info(f"Import job {job_id} {update['status']}")
+
+async def resume_import_jobs():
+    """Restart jobs that were queued or running when the server stopped"""
+    async for job in db.import_jobs.find({"status": {"$in": IMPORT_JOB_ACTIVE}}, {"_id": 0, "id": 1}):
+        logger.info(f"Resuming import job {job['id']}")
+        run_in_background(run_import_job(job["id"]))
+
 @api_router.post("/admin/products/import")
-async def import_products(file: UploadFile = File(...), user=Depends(get_current_user)):
-    """Import products from CSV file"""
+async def import_products(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=10000),
+    dry_run: bool = False,
+    user=Depends(get_current_user)
+):
+    """
+    Stage a CSV or XLSX upload and import it in a background job.
+    Rows identical to the last import are skipped; dry_run only reports the
+    new/changed/unchanged/missing counts without writing.
+    """
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files are supported")
+    extension = Path(file.filename or "").suffix.lower()
+    if extension not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Only CSV and XLSX files are supported")
+    
+    job_id = str(uuid.uuid4())
+    path = IMPORT_STAGING_DIR / f"{job_id}{extension}"
+    
+    def stage_upload():
+        with open(path, "wb") as staged:
+            shutil.copyfileobj(file.file, staged)
+    await asyncio.to_thread(stage_upload)
+    
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        "id": job_id,
+        "filename": file.filename,
+        "path": str(path),
+        "size": path.stat().st_size,
+        "chunk_size": chunk_size,
+        "dry_run": dry_run,
+        "status": "queued",
+        "cancel_requested": False,
+        "created_by": user["id"],
+        "created_at": now,
+        "updated_at": now,
+        "lease_until": None,
+        "imported": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "missing": None,
+        "samples": {"new": [], "changed": []},
+        "errors": [],
+        "total_errors": 0,
+        "rows_parsed": 0,
+        "rows_written": 0,
+        "rows_failed": 0,
+        "chunks": 0,
+        "rows_per_second": 0
+    }
+    await db.import_jobs.insert_one(job)
+    run_in_background(run_import_job(job_id))
     
-    try:
-        content = await file.read()
-        decoded = content.decode('utf-8-sig')
-        reader = csv.DictReader(io.StringIO(decoded), delimiter=';')
-        
-        imported = 0
-        updated = 0
-        errors = []
-        
-        for row_num, row in enumerate(reader, start=2):
-            try:
-                article = row.get('article', row.get('Артикул', '')).strip()
-                name = row.get('name', row.get('Название', '')).strip()
-                
-                if not article or not name:
-                    errors.append(f"Строка {row_num}: отсутствует артикул или название")
-                    continue
-                
-                price_str = row.get('price', row.get('Цена', '0')).replace(' ', '').replace(',', '.')
-                price = float(price_str) if price_str else 0
-                
-                stock_str = row.get('stock', row.get('Остаток', '0')).replace(' ', '')
-                stock = int(stock_str) if stock_str else 0
-                
-                delivery_str = row.get('delivery_days', row.get('Доставка', '3')).replace(' ', '')
-                delivery_days = int(delivery_str) if delivery_str else 3
-                
-                product_data = {
-                    "name": name,
-                    "article": article,
-                    "price": price,
-                    "stock": stock,
-                    "delivery_days": delivery_days,
-                    "description": row.get('description', row.get('Описание', '')).strip(),
-                    "category_id": row.get('category_id', row.get('Категория', '')).strip() or None,
-                    "image_url": row.get('image_url', row.get('Изображение', '')).strip() or None
-                }
-                
-                # Check if product exists
-                existing = await db.products.find_one({"article": article})
-                if existing:
-                    await db.products.update_one({"article": article}, {"$set": product_data})
-                    updated += 1
-                else:
-                    product_data["id"] = str(uuid.uuid4())
-                    await db.products.insert_one(product_data)
-                    imported += 1
-                    
-            except Exception as e:
-                errors.append(f"Строка {row_num}: {str(e)}")
-        
-        return {
-            "imported": imported,
-            "updated": updated,
-            "errors": errors[:10],
-            "total_errors": len(errors)
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    return await db.import_jobs.find_one({"id": job_id}, IMPORT_JOB_PROJECTION)
 
-@api_router.get("/admin/products/export")
-async def export_products(user=Depends(get_current_user)):
-    """Export products to CSV"""
+@api_router.get("/admin/import-jobs")
+async def list_import_jobs(limit: int = 20, user=Depends(get_current_user)):
+    """Recent import jobs, newest first (admin)"""
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    products = await db.products.find({}, {"_id": 0}).to_list(10000)
+    return await db.import_jobs.find({}, IMPORT_JOB_PROJECTION).sort("created_at", -1).limit(min(limit, 100)).to_list(100)
+
+@api_router.get("/admin/import-jobs/{job_id}")
+async def get_import_job(job_id: str, user=Depends(get_current_user)):
+    """Import job progress (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = await db.import_jobs.find_one({"id": job_id}, IMPORT_JOB_PROJECTION)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@api_router.post("/admin/import-jobs/{job_id}/cancel")
+async def cancel_import_job(job_id: str, user=Depends(get_current_user)):
+    """Cancel a queued job, or ask a running one to stop after its current chunk (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    result = await db.import_jobs.update_one(
+        {"id": job_id, "status": "queued"},
+        {"$set": {"status": "cancelled", "cancel_requested": True, "finished_at": now}}
+    )
+    if result.modified_count:
+        for extension in IMPORT_FORMATS:
+            (IMPORT_STAGING_DIR / f"{job_id}{extension}").unlink(missing_ok=True)
+    else:
+        await db.import_jobs.update_one(
+            {"id": job_id, "status": "running"},
+            {"$set": {"cancel_requested": True}}
+        )
     
-    output = io.StringIO()
-    fieldnames = ['article', 'name', 'price', 'stock', 'delivery_days', 'description', 'category_id', 'image_url']
-    writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=';')
+    job = await db.import_jobs.find_one({"id": job_id}, IMPORT_JOB_PROJECTION)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+EXPORT_BATCH_SIZE = 1000
+
+def gzip_accepted(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+async def gzip_chunks(chunks):
+    """Compress an async stream of text chunks into a gzip byte stream as it is produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streaming_download(chunks, request: Request, media_type: str, filename: str) -> StreamingResponse:
+    """Attachment response for a text stream, gzip-encoded when the client accepts it"""
+    headers = {"Content-Disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if gzip_accepted(request):
+        headers["Content-Encoding"] = "gzip"
+        chunks = gzip_chunks(chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+async def product_csv_chunks():
+    """Yield the product CSV EXPORT_BATCH_SIZE rows at a time straight from the cursor"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, delimiter=';')
     writer.writeheader()
     
-    for product in products:
-        writer.writerow({
-            'article': product.get('article', ''),
-            'name': product.get('name', ''),
-            'price': product.get('price', 0),
-            'stock': product.get('stock', 0),
-            'delivery_days': product.get('delivery_days', 3),
-            'description': product.get('description', ''),
-            'category_id': product.get('category_id', ''),
-            'image_url': product.get('image_url', '')
-        })
+    rows = 0
+    async for product in db.products.find({}, PRODUCT_PROJECTION).batch_size(EXPORT_BATCH_SIZE):
+        writer.writerow(export_row(product))
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@api_router.get("/admin/products/export")
+async def export_products(request: Request, user=Depends(get_current_user)):
+    """Export all products to CSV, streamed from the cursor (gzip if accepted)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    output.seek(0)
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=products.csv"}
-    )
+    return streaming_download(product_csv_chunks(), request, "text/csv", "products.csv")
 
 # ==================== EXTENDED STATISTICS ====================
 
@@ -2915,6 +4155,269 @@ async def get_extended_stats(
         "unique_customers": len(set(o["user_id"] for o in orders))
     }
 
+# ==================== DATABASE INDEXES ====================
+
+# Single source of truth for every index the API relies on.
+# Reconciled against the database on startup (see ensure_indexes).
+INDEX_MANIFEST = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("article", ASCENDING)], name="article"),
+        IndexModel([("article_key", ASCENDING)], name="article_key"),
+        IndexModel([("cross_keys", ASCENDING)], name="cross_keys"),
+        # Catalog sorts (see CATALOG_SORTS), globally and within a category
+        *[IndexModel([(field, ASCENDING), ("id", ASCENDING)], name=f"{field}_id")
+          for field in ("name", "price", "stock", "units_sold")],
+        *[IndexModel([("category_id", ASCENDING), (field, ASCENDING), ("id", ASCENDING)], name=f"category_id_{field}_id")
+          for field in ("name", "price", "stock", "units_sold")],
+        TEXT_INDEX,
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "favorites": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+    ],
+    "chats": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("updated_at", DESCENDING)], name="updated_at"),
+    ],
+    "chat_messages": [
+        IndexModel([("chat_id", ASCENDING), ("created_at", ASCENDING)], name="chat_id_created_at"),
+        IndexModel([("chat_id", ASCENDING), ("sender_type", ASCENDING), ("read", ASCENDING)], name="chat_id_sender_type_read"),
+        IndexModel([("id", ASCENDING), ("chat_id", ASCENDING)], name="id_chat_id"),
+        IndexModel([("telegram_update_id", ASCENDING)], name="telegram_update_id_unique", unique=True,
+                   partialFilterExpression={"telegram_update_id": {"$exists": True}}),
+    ],
+    "settings": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+    ],
+    "telegram_chat_settings": [
+        IndexModel([("setting_type", ASCENDING)], name="setting_type"),
+    ],
+    "partners": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("order", ASCENDING)], name="order"),
+    ],
+    "bonus_programs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "bonus_progress": [
+        IndexModel([("user_id", ASCENDING), ("program_id", ASCENDING)], name="user_id_program_id_unique", unique=True),
+        IndexModel([("program_id", ASCENDING)], name="program_id"),
+    ],
+    "bonus_history": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "product_stats": [
+        IndexModel([("product_id", ASCENDING)], name="product_id_unique", unique=True),
+        IndexModel([("units_sold", DESCENDING)], name="units_sold"),
+    ],
+    "product_recommendations": [
+        IndexModel([("product_id", ASCENDING)], name="product_id_unique", unique=True),
+        IndexModel([("built_at", ASCENDING)], name="built_at"),
+    ],
+    "idempotency_keys": [
+        IndexModel([("user_id", ASCENDING), ("key", ASCENDING)], name="user_id_key_unique", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=IDEMPOTENCY_KEY_TTL),
+    ],
+    "stream_tickets": [
+        IndexModel([("ticket", ASCENDING)], name="ticket_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "outbox": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING), ("created_at", ASCENDING)], name="status_next_attempt_at_created_at"),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=OUTBOX_RETENTION),
+    ],
+    "telegram_updates": [
+        IndexModel([("update_id", ASCENDING)], name="update_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING), ("update_id", ASCENDING)], name="status_next_attempt_at_update_id"),
+        IndexModel([("received_at", ASCENDING)], name="received_at_ttl", expireAfterSeconds=TELEGRAM_UPDATE_TTL),
+    ],
+    "import_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "prize_redemptions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+}
+
+# Index options that change the behaviour of an index - a difference in any
+# of them means the index has to be rebuilt.
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+def index_differs(existing: dict, wanted: dict) -> bool:
+    """Compare an index_information() entry with an IndexModel document"""
+    if "text" in wanted["key"].values():
+        # Text indexes are reported as _fts/_ftsx keys - compare fields via weights
+        wanted_weights = wanted.get("weights") or {f: 1 for f, d in wanted["key"].items() if d == "text"}
+        if existing.get("weights") != wanted_weights:
+            return True
+        if existing.get("default_language", "english") != wanted.get("default_language", "english"):
+            return True
+    elif list(existing["key"]) != list(wanted["key"].items()):
+        return True
+    return any(existing.get(opt, False) != wanted.get(opt, False) for opt in INDEX_OPTIONS)
+
+async def ensure_indexes():
+    """Create missing indexes from INDEX_MANIFEST and rebuild changed ones"""
+    for collection_name, models in INDEX_MANIFEST.items():
+        collection = db[collection_name]
+        try:
+            existing = await collection.index_information()
+        except OperationFailure:
+            existing = {}  # Collection does not exist yet
+        
+        to_create = []
+        for model in models:
+            wanted = model.document
+            current = existing.get(wanted["name"])
+            if current is None:
+                to_create.append(model)
+            elif index_differs(current, wanted):
+                logger.info(f"Rebuilding index {collection_name}.{wanted['name']}")
+                await collection.drop_index(wanted["name"])
+                to_create.append(model)
+        
+        # Indexes that are not in the manifest are left alone, only reported
+        known = {m.document["name"] for m in models} | {"_id_"}
+        for name in existing:
+            if name not in known:
+                logger.warning(f"Index {collection_name}.{name} is not in INDEX_MANIFEST")
+        
+        if not to_create:
+            continue
+        try:
+            created = await collection.create_indexes(to_create)
+            logger.info(f"Created indexes on {collection_name}: {', '.join(created)}")
+        except OperationFailure as e:
+            # Usually duplicate data under a unique index - keep the API running
+            logger.error(f"Failed to create indexes on {collection_name}: {e}")
+
+# Hot queries that must always be served by an index: (name, collection, filter, sort)
+HOT_QUERIES = [
+    ("current_user", "users", {"id": "probe"}, None),
+    ("login", "users", {"email": "probe"}, None),
+    ("product", "products", {"id": "probe"}, None),
+    ("popular_products", "products", {"units_sold": {"$gt": 0}}, [("units_sold", -1), ("id", -1)]),
+    ("related_products", "product_recommendations", {"product_id": "probe"}, None),
+    ("cart", "carts", {"user_id": "probe"}, None),
+    ("user_orders", "orders", {"user_id": "probe"}, [("created_at", -1)]),
+    ("order_export", "orders", {"created_at": {"$gte": "probe"}, "status": {"$in": ["delivered"]}}, [("created_at", 1)]),
+    ("chat_by_user", "chats", {"user_id": "probe"}, None),
+    ("chat_messages", "chat_messages", {"chat_id": "probe"}, [("created_at", 1)]),
+    ("chat_unread", "chat_messages", {"chat_id": "probe", "sender_type": "user", "read": False}, None),
+    ("bonus_progress", "bonus_progress", {"user_id": "probe", "program_id": "probe"}, None),
+    ("settings", "settings", {"key": "probe"}, None),
+    ("telegram_update_due", "telegram_updates", {"status": "pending", "next_attempt_at": {"$lte": "probe"}}, [("next_attempt_at", 1), ("update_id", 1)]),
+    ("chat_by_id_prefix", "chats", {"id": {"$regex": "^probe"}}, None),
+    ("outbox_due", "outbox", {"status": "pending", "next_attempt_at": {"$lte": "probe"}}, [("next_attempt_at", 1), ("created_at", 1)]),
+]
+
+def collect_plan_stages(plan) -> List[str]:
+    """Collect all stage names from an explain() winning plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(collect_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(collect_plan_stages(value))
+    return stages
+
+@api_router.get("/admin/db/query-plans")
+async def get_hot_query_plans(user=Depends(get_current_user)):
+    """Explain every hot query and report whether it falls back to COLLSCAN"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    result = []
+    for name, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = collect_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        result.append({
+            "name": name,
+            "collection": collection_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    
+    return {"queries": result}
+
+# ==================== PRODUCT STATS ====================
+
+async def rebuild_product_stats():
+    """Recompute the product_stats rollup and products.units_sold from order history"""
+    await db.orders.aggregate([
+        {"$match": {"status": {"$ne": "cancelled"}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.product_id",
+            "units_sold": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}},
+            "order_count": {"$sum": 1},
+            "last_sold_at": {"$max": "$created_at"}
+        }},
+        {"$project": {
+            "_id": 0, "product_id": "$_id", "units_sold": 1, "revenue": 1,
+            "order_count": 1, "last_sold_at": 1
+        }},
+        {"$out": "product_stats"}  # replaces the collection, keeps its indexes
+    ], allowDiskUse=True).to_list(None)
+    
+    await db.products.update_many({"units_sold": {"$ne": 0}}, {"$set": {"units_sold": 0}})
+    await db.product_stats.aggregate([
+        {"$match": {"product_id": {"$ne": None}}},
+        {"$project": {"_id": 0, "id": "$product_id", "units_sold": 1}},
+        {"$merge": {"into": "products", "on": "id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ]).to_list(None)
+    invalidate_catalog_caches()
+    await publish_product_change("catalog.changed")
+
+@api_router.get("/admin/product-stats")
+async def get_product_stats(limit: int = 50, user=Depends(get_current_user)):
+    """Best selling products from the product_stats rollup (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    stats = await db.product_stats.find({}, {"_id": 0}).sort("units_sold", -1).limit(min(limit, 1000)).to_list(1000)
+    return {"stats": stats}
+
+@api_router.post("/admin/product-stats/rebuild")
+async def rebuild_product_stats_admin(user=Depends(get_current_user)):
+    """Recompute product_stats from all orders (admin)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await rebuild_product_stats()
+    count = await db.product_stats.count_documents({})
+    return {"message": f"Product stats rebuilt for {count} products"}
+
 # ==================== MIGRATION ====================
 
 @api_router.post("/admin/migrate-orders")
@@ -2951,6 +4454,39 @@ async def migrate_orders(user=Depends(get_current_user)):
     
     return {"message": f"Migrated {updated_count} orders"}
 
+@api_router.post("/admin/migrate-products")
+async def migrate_products(user=Depends(get_current_user)):
+    """Backfill normalized article_key / cross_keys and units_sold on existing products"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    updated_count = 0
+    batch = []
+    cursor = db.products.find({}, {"_id": 1, "article": 1, "cross_articles": 1, "units_sold": 1})
+    async for product in cursor:
+        keys = product_search_keys({
+            "article": product.get("article"),
+            "cross_articles": product.get("cross_articles")
+        })
+        if "units_sold" not in product:
+            keys["units_sold"] = 0  # popularity sort needs the field on every product
+        batch.append(UpdateOne({"_id": product["_id"]}, {"$set": keys}))
+        
+        if len(batch) >= 1000:
+            result = await db.products.bulk_write(batch, ordered=False)
+            updated_count += result.modified_count
+            batch = []
+    
+    if batch:
+        result = await db.products.bulk_write(batch, ordered=False)
+        updated_count += result.modified_count
+    
+    await rebuild_analog_graph()
+    await rebuild_suggest_index()
+    await publish_product_change("products.rebuilt")
+    
+    return {"message": f"Migrated {updated_count} products"}
+
 # ==================== SEED DATA ====================
 
 @api_router.post("/seed")
@@ -2982,7 +4518,14 @@ async def seed_data():
         {"id": str(uuid.uuid4()), "name": "Капот Scania", "article": "SCN-HD-003", "price": 120000, "stock": 2, "delivery_days": 10, "image_url": "https://images.unsplash.com/photo-1594920687401-e70050947ea5?w=400", "description": "Капот Scania R-series"},
     ]
     
+    for product in products:
+        product.update(product_search_keys(product))
+        product["units_sold"] = 0
+    
     await db.products.insert_many(products)
+    for product in products:
+        index_product_in_memory(product)
+    await publish_product_change("products.changed", [p["id"] for p in products])
     return {"message": f"Seeded {len(products)} products"}
 
 # ==================== ROOT ====================
@@ -3196,6 +4739,204 @@ async def get_admin_orders(user=Depends(get_current_user)):
     orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return orders
 
+SSE_HEARTBEAT_SECONDS = 15  # keeps proxies from closing an idle stream
+
+def sse_event(event_type: str, data) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def admin_orders_snapshot() -> list:
+    """The same orders as GET /admin/orders, as order_summary() rows"""
+    return await db.orders.aggregate([
+        {"$sort": {"created_at": -1}},
+        {"$limit": 1000},
+        {"$project": {
+            "_id": 0,
+            **{field: 1 for field in ORDER_SUMMARY_FIELDS},
+            "items_count": {"$size": {"$ifNull": ["$items", []]}}
+        }}
+    ]).to_list(None)
+
+STREAM_TICKET_TTL = 30  # seconds to open the stream with a ticket
+
+@api_router.post("/admin/orders/stream-ticket")
+async def create_stream_ticket(user=Depends(get_current_user)):
+    """
+    Single-use ticket for opening the orders stream. EventSource cannot set
+    headers, so the stream URL carries this ticket instead of the JWT.
+    """
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    ticket = secrets.token_urlsafe(32)
+    await db.stream_tickets.insert_one({
+        "ticket": ticket,
+        "user_id": user["id"],
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_TTL)
+    })
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL}
+
+@api_router.get("/admin/orders/stream")
+async def stream_admin_orders(ticket: str = Query(...)):
+    """
+    Server-Sent Events feed of the orders board. Sends a "snapshot" event with
+    order summaries, then order.created / order.updated / order.deleted with
+    one summary each, and a new snapshot if events were missed. Opened with a
+    ticket from POST /admin/orders/stream-ticket, which is used up here.
+    """
+    # The TTL index only sweeps about once a minute, so expiry is checked here too
+    record = await db.stream_tickets.find_one_and_delete(
+        {"ticket": ticket, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+    )
+    if not record:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    user = await db.users.find_one({"id": record["user_id"]}, {"_id": 0, "password": 0})
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    async def events():
+        # Subscribe before reading the snapshot so no change falls in between;
+        # the subscription lives exactly as long as the response body
+        async with event_bus.subscribe("orders") as subscription:
+            yield sse_event("snapshot", {"orders": await admin_orders_snapshot()})
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event["type"] == "resync":
+                    yield sse_event("snapshot", {"orders": await admin_orders_snapshot()})
+                else:
+                    yield sse_event(event["type"], event["order"])
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+ORDER_EXPORT_FIELDS = ["order_id", "created_at", "status", "full_name", "phone", "address", "payment_method",
+                       "article", "name", "manufacturer", "price", "quantity", "line_total", "order_total"]
+ORDER_EXPORT_PROJECTION = {"_id": 0, "id": 1, "created_at": 1, "status": 1, "full_name": 1, "phone": 1,
+                           "address": 1, "payment_method": 1, "items": 1, "total": 1}
+
+def parse_export_date(value: str, end: bool = False) -> str:
+    """ISO date or datetime (naive = UTC) -> UTC ISO string comparable with orders.created_at; a plain end date is inclusive"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    # created_at is stored in UTC, so the bound must be too for string comparison
+    return parsed.astimezone(timezone.utc).isoformat()
+
+async def order_export_rows(query: dict):
+    """One row per order item, oldest first, read from the created_at index"""
+    cursor = db.orders.find(query, ORDER_EXPORT_PROJECTION).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for order in cursor:
+        for item in order.get("items", []):
+            price = item.get("price", 0)
+            quantity = item.get("quantity", 0)
+            yield {
+                "order_id": order["id"],
+                "created_at": order.get("created_at", ""),
+                "status": order.get("status", ""),
+                "full_name": order.get("full_name", ""),
+                "phone": order.get("phone", ""),
+                "address": order.get("address", ""),
+                "payment_method": order.get("payment_method", ""),
+                "article": item.get("article", ""),
+                "name": item.get("name", ""),
+                "manufacturer": item.get("manufacturer") or "",
+                "price": price,
+                "quantity": quantity,
+                "line_total": price * quantity,
+                "order_total": order.get("total", 0)
+            }
+
+async def order_csv_chunks(query: dict):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ORDER_EXPORT_FIELDS, delimiter=';')
+    writer.writeheader()
+    yield buffer.getvalue()  # headers go out before the first query batch
+    buffer.seek(0)
+    buffer.truncate()
+    
+    rows = 0
+    async for row in order_export_rows(query):
+        writer.writerow(row)
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+async def build_order_xlsx(query: dict) -> str:
+    """Write the order export into a temporary XLSX file with the constant-memory write-only workbook"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Заказы")
+    sheet.append(ORDER_EXPORT_FIELDS)
+    async for row in order_export_rows(query):
+        sheet.append([row[field] for field in ORDER_EXPORT_FIELDS])
+    
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    await asyncio.to_thread(workbook.save, path)
+    return path
+
+def iter_file_and_remove(path: str, chunk_size: int = 64 * 1024):
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+    finally:
+        os.remove(path)
+
+@api_router.get("/admin/orders/export")
+async def export_orders(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    user=Depends(get_current_user)
+):
+    """Export order lines for accounting as CSV (streamed) or XLSX, filtered by date range and status"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    query = {}
+    created_at = {}
+    if date_from:
+        created_at["$gte"] = parse_export_date(date_from)
+    if date_to:
+        created_at["$lt" if len(date_to) == 10 else "$lte"] = parse_export_date(date_to, end=True)
+    if created_at:
+        query["created_at"] = created_at
+    if status:
+        query["status"] = {"$in": status}
+    
+    if format == "xlsx":
+        path = await build_order_xlsx(query)
+        return StreamingResponse(
+            iter_file_and_remove(path),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": "attachment; filename=orders.xlsx"}
+        )
+    return streaming_download(order_csv_chunks(query), request, "text/csv", "orders.csv")
+
+@api_router.get("/admin/orders/{order_id}")
+async def get_admin_order(order_id: str, user=Depends(get_current_user)):
+    """Full order with items; the orders stream only carries summaries"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
 @api_router.put("/admin/orders/{order_id}")
 async def update_admin_order(order_id: str, data: AdminOrderUpdate, user=Depends(get_current_user)):
     if user.get("role") != "admin":
@@ -3216,11 +4957,23 @@ async def update_admin_order(order_id: str, data: AdminOrderUpdate, user=Depends
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
-    result = await db.orders.update_one({"id": order_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    previous_order = await db.orders.find_one_and_update(
+        {"id": order_id}, {"$set": update_data}, projection={"_id": 0}
+    )
+    if not previous_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    updated_order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    updated_order = {**previous_order, **update_data}
+    try:
+        await update_reserved_stock_on_change(previous_order, updated_order)
+    except HTTPException:
+        # Not enough stock for the edit: put the order back as it was
+        await db.orders.update_one(
+            {"id": order_id}, {"$set": {k: previous_order.get(k) for k in update_data}}
+        )
+        raise
+    await update_product_stats_on_change(previous_order, updated_order)
+    await publish_order_event("order.updated", updated_order)
     return updated_order
 
 @api_router.put("/admin/orders/{order_id}/status")
@@ -3232,14 +4985,21 @@ async def update_order_status(order_id: str, status: str, user=Depends(get_curre
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    # Get order before update to check previous status
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    # Returns the order before the update, so concurrent changes see distinct previous statuses
+    order = await db.orders.find_one_and_update({"id": order_id}, {"$set": {"status": status}}, projection={"_id": 0})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
     previous_status = order.get("status")
     
-    result = await db.orders.update_one({"id": order_id}, {"$set": {"status": status}})
+    try:
+        await update_reserved_stock_on_change(order, {**order, "status": status})
+    except HTTPException:
+        # Reopening needs stock that has since sold out: keep the previous status
+        await db.orders.update_one({"id": order_id, "status": status}, {"$set": {"status": previous_status}})
+        raise
+    await update_product_stats_on_change(order, {**order, "status": status})
+    await publish_order_event("order.updated", {**order, "status": status})
     
     # If status changed to "delivered" and wasn't delivered before, add to bonus progress
     if status == "delivered" and previous_status != "delivered":
@@ -3252,9 +5012,12 @@ async def delete_admin_order(order_id: str, user=Depends(get_current_user)):
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = await db.orders.delete_one({"id": order_id})
-    if result.deleted_count == 0:
+    order = await db.orders.find_one_and_delete({"id": order_id}, projection={"_id": 0})
+    if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    await update_reserved_stock_on_change(order, None)
+    await update_product_stats_on_change(order, None)
+    await publish_order_event("order.deleted", order)
     
     return {"message": "Order deleted"}
 
@@ -3290,6 +5053,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_db_indexes():
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Index reconciliation failed: {e}")
+    
+    run_in_background(rebuild_analog_graph())
+    run_in_background(rebuild_suggest_index())
+    run_in_background(refresh_recommendations_periodically())
+    run_in_background(resume_import_jobs())
+    
+    try:
+        await detect_transaction_support()
+    except Exception as e:
+        logger.error(f"Could not check transaction support: {e}")
+    
+    await telegram.start()
+    await event_bus.start()
+    run_in_background(follow_settings_events())
+    run_in_background(follow_product_events())
+    run_in_background(dispatch_outbox())
+    run_in_background(process_telegram_updates())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await event_bus.close()
+    await telegram.close()
     client.close()
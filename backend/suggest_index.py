@@ -0,0 +1,227 @@
+"""
+Typeahead suggestions over articles, cross-articles, manufacturers and name tokens
+"""
+import re
+import bisect
+import heapq
+from array import array
+from typing import Callable, Iterable, List, Tuple
+
+from part_numbers import normalize_article, split_cross_articles
+
+KIND_ARTICLE, KIND_CROSS, KIND_MANUFACTURER, KIND_NAME = 0, 1, 2, 3
+KIND_NAMES = ("article", "cross", "manufacturer", "name")
+
+WORD_RE = re.compile(r"\w+")
+
+# Entry = (key, kind, label, product_id)
+Entry = Tuple[str, int, str, str]
+
+def product_entries(product: dict) -> List[Entry]:
+    """Suggestion entries of a product: its article, cross keys, manufacturer and name words"""
+    product_id = product["id"]
+    entries = []
+    
+    article = product.get("article") or ""
+    key = product.get("article_key") or normalize_article(article)
+    if key:
+        entries.append((key, KIND_ARTICLE, article, product_id))
+    
+    cross_keys = product.get("cross_keys")
+    if cross_keys is None:
+        cross_keys = split_cross_articles(product.get("cross_articles"))
+    for cross_key in cross_keys:
+        entries.append((cross_key, KIND_CROSS, cross_key, product_id))
+    
+    manufacturer = (product.get("manufacturer") or "").strip()
+    if manufacturer:
+        entries.append((normalize_article(manufacturer), KIND_MANUFACTURER, manufacturer, product_id))
+    
+    name = product.get("name") or ""
+    seen = set()
+    for word in WORD_RE.findall(name):
+        word_key = normalize_article(word)
+        if len(word_key) >= 2 and word_key not in seen:
+            seen.add(word_key)
+            entries.append((word_key, KIND_NAME, name, product_id))
+    
+    return entries
+
+class SuggestBase:
+    """Immutable sorted arrays of suggestion entries (no per-key dicts or nodes)"""
+    
+    def __init__(self, entries: Iterable[Entry]):
+        labels = {}       # interning: one string object per distinct label
+        refs_by_id = {}
+        self.keys = []
+        self.kinds = array('B')
+        self.labels = []
+        self.refs = array('I')
+        self.product_ids = []
+        for key, kind, label, product_id in sorted(entries):
+            ref = refs_by_id.get(product_id)
+            if ref is None:
+                ref = refs_by_id[product_id] = len(self.product_ids)
+                self.product_ids.append(product_id)
+            self.keys.append(key)
+            self.kinds.append(kind)
+            self.labels.append(labels.setdefault(label, label))
+            self.refs.append(ref)
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def entries(self) -> Iterable[Entry]:
+        for i, key in enumerate(self.keys):
+            yield key, self.kinds[i], self.labels[i], self.product_ids[self.refs[i]]
+
+class SuggestIndex:
+    """
+    Prefix index for typeahead.
+    
+    Most entries live in a SuggestBase built in one pass; product changes
+    go into a small sorted delta list, and the product's old base entries
+    are masked until the delta is merged back (compaction).
+    
+    Once the delta passes compact_threshold, compaction_due() turns true and
+    the owner runs the merge off the event loop: begin_compaction() returns
+    the build function, finish_compaction() installs its result. Products
+    changed in between stay masked and in the delta.
+    """
+    
+    # Entries inspected per query before ranking
+    SCAN_LIMIT = 500
+    
+    def __init__(self, compact_threshold: int = 50000):
+        self.compact_threshold = compact_threshold
+        self._base = SuggestBase([])
+        self._masked = set()   # product ids whose base entries are stale
+        self._delta = []       # sorted entries of products changed since the base was built
+        self._delta_by_product = {}
+        self._compacting = False
+        self._changed = set()  # product ids changed since begin_compaction()
+        self.ready = False
+    
+    def install_base(self, base: SuggestBase):
+        """Swap in a freshly built base; pending delta stays on top of it"""
+        self.abort_compaction()  # a compaction in flight was built from an older base
+        self._base = base
+        self.ready = True
+    
+    def upsert_product(self, product: dict):
+        self.remove_product(product["id"])
+        entries = product_entries(product)
+        self._delta_by_product[product["id"]] = entries
+        for entry in entries:
+            bisect.insort(self._delta, entry)
+    
+    def remove_product(self, product_id: str):
+        if self._compacting:
+            self._changed.add(product_id)
+        self._masked.add(product_id)
+        for entry in self._delta_by_product.pop(product_id, ()):
+            i = bisect.bisect_left(self._delta, entry)
+            if i < len(self._delta) and self._delta[i] == entry:
+                del self._delta[i]
+    
+    def compact(self):
+        """Merge the delta into a new base"""
+        masked = self._masked
+        live = (e for e in self._base.entries() if e[3] not in masked)
+        self._base = SuggestBase(heapq.merge(live, self._delta))
+        self._masked = set()
+        self._delta = []
+        self._delta_by_product = {}
+    
+    def compaction_due(self) -> bool:
+        return len(self._delta) > self.compact_threshold and not self._compacting
+    
+    def begin_compaction(self) -> Callable[[], SuggestBase]:
+        """Snapshot the current state; the returned function builds the merged base (thread-safe)"""
+        self._compacting = True
+        self._changed = set()
+        base, masked, delta = self._base, set(self._masked), list(self._delta)
+        return lambda: SuggestBase(heapq.merge((e for e in base.entries() if e[3] not in masked), delta))
+    
+    def finish_compaction(self, base: SuggestBase):
+        """Install a base built by begin_compaction(), keeping changes made since as delta"""
+        if not self._compacting:
+            return  # aborted
+        changed = self._changed
+        self._base = base
+        self._masked = set(changed)
+        self._delta_by_product = {pid: self._delta_by_product[pid] for pid in changed if pid in self._delta_by_product}
+        self._delta = sorted(e for entries in self._delta_by_product.values() for e in entries)
+        self._compacting = False
+        self._changed = set()
+    
+    def abort_compaction(self):
+        self._compacting = False
+        self._changed = set()
+    
+    def _scan(self, prefix: str) -> Iterable[Entry]:
+        base = self._base
+        i = bisect.bisect_left(base.keys, prefix)
+        n = 0
+        while i < len(base.keys) and base.keys[i].startswith(prefix) and n < self.SCAN_LIMIT:
+            product_id = base.product_ids[base.refs[i]]
+            if product_id not in self._masked:
+                yield base.keys[i], base.kinds[i], base.labels[i], product_id
+                n += 1
+            i += 1
+        
+        j = bisect.bisect_left(self._delta, (prefix,))
+        while j < len(self._delta) and self._delta[j][0].startswith(prefix):
+            yield self._delta[j]
+            j += 1
+    
+    def suggest(self, query: str, limit: int = 10, ids_per_suggestion: int = 5) -> List[dict]:
+        """
+        Top suggestions for a typed prefix
+        
+        For multi-word queries the last word is the prefix and name
+        suggestions must contain the earlier words.
+        
+        Returns:
+            list of {"text", "type", "product_ids"}
+        """
+        words = query.lower().split()
+        if not words:
+            return []
+        
+        prefixes = [normalize_article(query)]
+        if len(words) > 1:
+            prefixes.append(normalize_article(words[-1]))
+        leading_words = words[:-1]
+        
+        groups = {}  # (kind, label) -> [exact, key_length, product ids]
+        for n, prefix in enumerate(prefixes):
+            if not prefix:
+                continue
+            for key, kind, label, product_id in self._scan(prefix):
+                if n > 0:
+                    # last-word match - only names containing the leading words
+                    if kind != KIND_NAME or not all(w in label.lower() for w in leading_words):
+                        continue
+                group = groups.get((kind, label))
+                if group is None:
+                    group = groups[(kind, label)] = [key != prefix, len(key), []]
+                group[0] = group[0] and key != prefix
+                group[1] = min(group[1], len(key))
+                if len(group[2]) < ids_per_suggestion and product_id not in group[2]:
+                    group[2].append(product_id)
+        
+        # exact keys first, then shortest completions, then by kind
+        ranked = sorted(groups.items(), key=lambda g: (g[1][0], g[1][1], g[0][0], g[0][1]))
+        return [
+            {"text": label, "type": KIND_NAMES[kind], "product_ids": ids}
+            for (kind, label), (_, _, ids) in ranked[:limit]
+        ]
+    
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "base_entries": len(self._base),
+            "delta_entries": len(self._delta),
+            "masked_products": len(self._masked)
+        }
@@ -0,0 +1,169 @@
+"""
+Telegram Bot API gateway: one pooled HTTP client for every bot call, with
+Telegram's rate limits enforced client-side
+"""
+import asyncio
+import bisect
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+GLOBAL_RATE = 30  # messages per second per bot
+PER_CHAT_RATE = 1  # messages per second per chat
+MAX_RETRIES = 3  # 429 retries inside one call
+MAX_RETRY_WAIT = 30  # longer retry_after values are returned to the caller instead of slept
+MAX_CHAT_BUCKETS = 1000  # idle per-chat buckets are dropped beyond this
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds, histogram upper bounds
+
+
+class TelegramError(Exception):
+    """A failed Bot API call; status_code is None when Telegram was unreachable"""
+
+    def __init__(self, method: str, status_code: Optional[int], description: str,
+                 retry_after: Optional[int] = None):
+        super().__init__(f"{method}: {status_code or 'network error'} {description}")
+        self.method = method
+        self.status_code = status_code
+        self.description = description
+        self.retry_after = retry_after
+
+    @property
+    def permanent(self) -> bool:
+        """Retrying will not help (bad token, unknown chat, malformed request)"""
+        return self.status_code is not None and 400 <= self.status_code < 500 and self.status_code != 429
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:  # waiters are served in arrival order
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity and not self._lock.locked()
+
+
+class TelegramGateway:
+    """
+    Every Bot API call goes through call(): the per-chat bucket and the
+    per-bot global bucket are acquired first, a 429 pauses the whole bot for
+    its retry_after and the call is repeated (up to MAX_RETRIES, waits up to
+    MAX_RETRY_WAIT). Counters and latency histograms are kept per method.
+    """
+
+    def __init__(self, base_url: str, global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE,
+                 timeout: float = 10):
+        self.base_url = base_url.rstrip("/")
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.timeout = timeout
+        self.client: Optional[httpx.AsyncClient] = None
+        self._global: Dict[str, TokenBucket] = {}  # bot token -> bucket
+        self._chats: Dict[Tuple[str, str], TokenBucket] = {}  # (bot token, chat id) -> bucket
+        self._paused_until: Dict[str, float] = {}  # bot token -> monotonic time
+        self.counters: Dict[str, int] = {}  # "method:outcome" -> count
+        self.latency: Dict[str, list] = {}  # method -> counts per LATENCY_BUCKETS (+ overflow)
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    def _chat_bucket(self, token: str, chat_id: str) -> TokenBucket:
+        key = (token, str(chat_id))
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[key] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _throttle(self, token: str, chat_id: Optional[str]):
+        if chat_id is not None:
+            await self._chat_bucket(token, chat_id).acquire()
+        paused = self._paused_until.get(token, 0) - time.monotonic()
+        if paused > 0:
+            await asyncio.sleep(paused)
+        bucket = self._global.get(token)
+        if bucket is None:
+            bucket = self._global[token] = TokenBucket(self.global_rate, self.global_rate)
+        await bucket.acquire()
+
+    def _record(self, method: str, outcome: str, elapsed: Optional[float] = None):
+        key = f"{method}:{outcome}"
+        self.counters[key] = self.counters.get(key, 0) + 1
+        if elapsed is not None:
+            histogram = self.latency.setdefault(method, [0] * (len(LATENCY_BUCKETS) + 1))
+            histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    async def call(self, token: str, method: str, payload: Optional[dict] = None,
+                   chat_id: Optional[str] = None) -> dict:
+        """Call a Bot API method and return its result; raises TelegramError"""
+        if self.client is None:
+            raise RuntimeError("TelegramGateway.start() was not called")
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self._throttle(token, chat_id)
+            started = time.monotonic()
+            try:
+                response = await self.client.post(f"{self.base_url}/bot{token}/{method}", json=payload or {})
+            except httpx.RequestError as e:
+                self._record(method, "network_error", time.monotonic() - started)
+                raise TelegramError(method, None, str(e))
+            elapsed = time.monotonic() - started
+
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if response.status_code == 200 and body.get("ok", True):
+                self._record(method, "ok", elapsed)
+                return body.get("result", body)
+
+            description = body.get("description") or response.text
+            if response.status_code == 429:
+                retry_after = (body.get("parameters") or {}).get("retry_after", 1)
+                self._paused_until[token] = time.monotonic() + retry_after
+                self._record(method, "rate_limited", elapsed)
+                if attempt < MAX_RETRIES and retry_after <= MAX_RETRY_WAIT:
+                    continue
+                raise TelegramError(method, 429, description, retry_after)
+            self._record(method, "error", elapsed)
+            raise TelegramError(method, response.status_code, description)
+
+    async def send_message(self, token: str, chat_id: str, text: str, **params) -> dict:
+        return await self.call(token, "sendMessage", {"chat_id": chat_id, "text": text, **params}, chat_id=chat_id)
+
+    def metrics(self) -> dict:
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "latency_buckets": [*LATENCY_BUCKETS, "+Inf"],
+            "latency": {method: list(counts) for method, counts in self.latency.items()},
+            "chat_buckets": len(self._chats),
+        }
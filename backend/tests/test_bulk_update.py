@@ -0,0 +1,73 @@
+"""
+Test suite for the bulk price / stock update keyed by article:
+1. Matched, missing and invalid entries are reported per item
+2. Changes are visible on the product
+3. Request size limit
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestBulkUpdate:
+    """Tests for POST /api/admin/products/bulk-update"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, create a test product"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        
+        self.article = f"TEST-BULK-{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/api/products", headers=self.headers, json={
+            "name": "TEST Bulk update product",
+            "article": self.article,
+            "price": 100,
+            "stock": 1
+        })
+        assert response.status_code == 200
+        self.product_id = response.json()["id"]
+        yield
+        requests.delete(f"{BASE_URL}/api/products/{self.product_id}", headers=self.headers)
+    
+    def test_bulk_update_requires_admin(self):
+        """Bulk update is not available without a token"""
+        response = requests.post(f"{BASE_URL}/api/admin/products/bulk-update", json={"items": []})
+        assert response.status_code in [401, 403]
+    
+    def test_bulk_update_results(self):
+        """Existing articles are updated, unknown ones reported as missing"""
+        response = requests.post(f"{BASE_URL}/api/admin/products/bulk-update", headers=self.headers, json={
+            "items": [
+                {"article": self.article, "price": 150.5},
+                {"article": self.article, "stock": 7, "delivery_days": 1},
+                {"article": "TEST-BULK-DOES-NOT-EXIST", "stock": 1},
+                {"article": self.article}
+            ]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        print(f"Bulk update: {data}")
+        assert [r["status"] for r in data["results"]] == ["matched", "matched", "missing", "invalid"]
+        assert data["matched"] == 2
+        assert data["missing"] == 1
+        assert data["modified"] == 1
+        
+        product = requests.get(f"{BASE_URL}/api/products/{self.product_id}").json()
+        assert product["price"] == 150.5
+        assert product["stock"] == 7
+        assert product["delivery_days"] == 1
+    
+    def test_bulk_update_limit(self):
+        """More than 10k entries are rejected"""
+        items = [{"article": self.article, "stock": 1}] * 10001
+        response = requests.post(f"{BASE_URL}/api/admin/products/bulk-update", headers=self.headers, json={"items": items})
+        assert response.status_code == 422
@@ -0,0 +1,73 @@
+"""
+Test suite for atomic cart mutations:
+1. No increments are lost under 50 parallel adds
+2. Update sets the quantity of one item only
+"""
+import pytest
+import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestCartConcurrency:
+    """Tests for /api/cart/add and /api/cart/update"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, start from an empty cart"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        
+        products = requests.get(f"{BASE_URL}/api/products?limit=2").json()
+        if len(products) < 2:
+            pytest.skip("Need at least two products")
+        self.product_ids = [p["id"] for p in products]
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+        yield
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+    
+    def cart_quantities(self):
+        response = requests.get(f"{BASE_URL}/api/cart", headers=self.headers)
+        assert response.status_code == 200
+        return {item["product_id"]: item["quantity"] for item in response.json()["items"]}
+    
+    def add(self, product_id, quantity=1):
+        return requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+            "product_id": product_id,
+            "quantity": quantity
+        }).status_code
+    
+    def test_parallel_adds_are_not_lost(self):
+        """50 concurrent adds of the same product give quantity 50"""
+        product_id = self.product_ids[0]
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            statuses = list(pool.map(lambda _: self.add(product_id), range(50)))
+        assert statuses == [200] * 50
+        
+        quantities = self.cart_quantities()
+        print(f"Quantity after 50 parallel adds: {quantities}")
+        assert quantities == {product_id: 50}
+    
+    def test_parallel_adds_of_different_products(self):
+        """Concurrent first adds of two products create one line each"""
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            list(pool.map(lambda i: self.add(self.product_ids[i % 2]), range(20)))
+        assert self.cart_quantities() == {self.product_ids[0]: 10, self.product_ids[1]: 10}
+    
+    def test_update_sets_single_item(self):
+        """Update changes only the targeted item"""
+        self.add(self.product_ids[0], 2)
+        self.add(self.product_ids[1], 3)
+        response = requests.post(f"{BASE_URL}/api/cart/update", headers=self.headers, json={
+            "product_id": self.product_ids[1],
+            "quantity": 7
+        })
+        assert response.status_code == 200
+        assert self.cart_quantities() == {self.product_ids[0]: 2, self.product_ids[1]: 7}
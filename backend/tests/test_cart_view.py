@@ -0,0 +1,72 @@
+"""
+Test suite for the single-aggregation cart view:
+1. Empty cart returns items, total and warnings
+2. Line totals and cart total match price x quantity
+3. Quantity above stock is reported as a warning
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestCartView:
+    """Tests for GET /api/cart"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, start from an empty cart"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        
+        self.products = requests.get(f"{BASE_URL}/api/products?limit=2").json()
+        if len(self.products) < 2:
+            pytest.skip("Need at least two products")
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+        yield
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+    
+    def get_cart(self):
+        response = requests.get(f"{BASE_URL}/api/cart", headers=self.headers)
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_empty_cart(self):
+        """Empty cart has the full response shape"""
+        cart = self.get_cart()
+        assert cart == {"items": [], "total": 0, "warnings": []}
+    
+    def test_totals(self):
+        """Line totals and cart total are computed server-side"""
+        for product, quantity in zip(self.products, (1, 2)):
+            requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+                "product_id": product["id"],
+                "quantity": quantity
+            })
+        cart = self.get_cart()
+        print(f"Cart total: {cart['total']}, warnings: {cart['warnings']}")
+        
+        assert len(cart["items"]) == 2
+        for item in cart["items"]:
+            assert item["line_total"] == pytest.approx(item["price"] * item["quantity"])
+            assert "stock" in item and "availability" in item
+        assert cart["total"] == pytest.approx(sum(i["line_total"] for i in cart["items"]))
+    
+    def test_insufficient_stock_warning(self):
+        """Quantity above stock is flagged"""
+        product = self.products[0]
+        quantity = product.get("stock", 0) + 1
+        requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+            "product_id": product["id"],
+            "quantity": quantity
+        })
+        cart = self.get_cart()
+        warning = next(w for w in cart["warnings"] if w["product_id"] == product["id"])
+        assert warning["type"] in ("out_of_stock", "insufficient_stock")
+        assert warning["available"] == product.get("stock", 0)
@@ -0,0 +1,90 @@
+"""
+Test suite for the chat widget push channel:
+1. The socket requires a valid JWT
+2. New, edited and deleted messages and unread counts are pushed
+"""
+import pytest
+import requests
+import os
+import json
+import uuid
+from websockets.sync.client import connect
+from websockets.exceptions import ConnectionClosed
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+WS_URL = BASE_URL.replace("http", "ws", 1) + "/api/chat/ws"
+
+
+class TestChatWebSocket:
+    """Tests for /api/chat/ws"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, register a customer"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.admin_headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        
+        response = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "email": f"test_ws_{uuid.uuid4().hex[:12]}@example.com",
+            "password": "test123",
+            "name": "TEST WebSocket user"
+        })
+        assert response.status_code == 200, response.text
+        self.user_token = response.json()["token"]
+        self.user_id = response.json()["user"]["id"]
+        self.user_headers = {"Authorization": f"Bearer {self.user_token}"}
+        self.chat_id = None
+        yield
+        if self.chat_id:
+            requests.delete(f"{BASE_URL}/api/admin/chats/{self.chat_id}", headers=self.admin_headers)
+        requests.delete(f"{BASE_URL}/api/admin/users/{self.user_id}", headers=self.admin_headers)
+    
+    def recv_event(self, ws, event_type):
+        """Next event of the given type (other pushed events are skipped)"""
+        while True:
+            event = json.loads(ws.recv(timeout=5))
+            if event["type"] == event_type:
+                return event
+    
+    def test_invalid_token_is_rejected(self):
+        """A bad token closes the socket with 4401"""
+        with connect(WS_URL) as ws:
+            ws.send(json.dumps({"type": "auth", "token": "invalid"}))
+            with pytest.raises(ConnectionClosed) as closed:
+                ws.recv(timeout=5)
+        assert closed.value.rcvd.code == 4401
+    
+    def test_events_are_pushed(self):
+        """Messages, edits, deletions and unread counts arrive without polling"""
+        with connect(WS_URL) as ws:
+            ws.send(json.dumps({"type": "auth", "token": self.user_token}))
+            assert self.recv_event(ws, "ready")["unread"] == 0
+            
+            response = requests.post(f"{BASE_URL}/api/chat/send", headers=self.user_headers, json={"text": "TEST question"})
+            self.chat_id = response.json()["chat_id"]
+            event = self.recv_event(ws, "message.created")
+            assert event["message"]["text"] == "TEST question"
+            
+            response = requests.post(f"{BASE_URL}/api/admin/chats/{self.chat_id}/send",
+                                     headers=self.admin_headers, json={"text": "TEST answer"})
+            message_id = response.json()["id"]
+            event = self.recv_event(ws, "message.created")
+            assert event["message"]["id"] == message_id
+            assert event["message"]["sender_type"] == "admin"
+            assert self.recv_event(ws, "unread")["count"] == 1
+            
+            requests.put(f"{BASE_URL}/api/admin/chats/{self.chat_id}/messages/{message_id}",
+                         headers=self.admin_headers, json={"text": "TEST edited"})
+            event = self.recv_event(ws, "message.updated")
+            assert event["message_id"] == message_id and event["text"] == "TEST edited"
+            
+            requests.delete(f"{BASE_URL}/api/admin/chats/{self.chat_id}/messages/{message_id}", headers=self.admin_headers)
+            assert self.recv_event(ws, "message.deleted")["message_id"] == message_id
+            assert self.recv_event(ws, "unread")["count"] == 0
+            
+            ws.send(json.dumps({"type": "ping"}))
+            assert self.recv_event(ws, "pong")
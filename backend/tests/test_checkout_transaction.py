@@ -0,0 +1,151 @@
+"""
+Test suite for transactional checkout:
+1. 100 concurrent checkouts of the same SKU never oversell
+2. A retried POST with the same Idempotency-Key returns the same order
+3. Checkout above stock is rejected with 409 and leaves the cart intact
+4. Cancelling, editing and deleting an order return its reserved stock
+5. Reopening a cancelled order whose stock has sold out is rejected with 409
+"""
+import pytest
+import requests
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+BUYERS = 100
+STOCK = 10
+SHIPPING = {"full_name": "TEST Checkout", "address": "TEST address", "phone": "+70000000000"}
+
+
+class TestCheckoutTransaction:
+    """Tests for POST /api/orders"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, create a test product with limited stock"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        
+        response = requests.post(f"{BASE_URL}/api/products", headers=self.headers, json={
+            "name": "TEST Checkout product",
+            "article": f"TEST-CHECKOUT-{uuid.uuid4().hex[:8]}",
+            "price": 100,
+            "stock": STOCK
+        })
+        assert response.status_code == 200
+        self.product_id = response.json()["id"]
+        self.user_ids = []
+        self.order_ids = []
+        yield
+        for order_id in self.order_ids:
+            requests.delete(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+        for user_id in self.user_ids:
+            requests.delete(f"{BASE_URL}/api/admin/users/{user_id}", headers=self.headers)
+        requests.delete(f"{BASE_URL}/api/products/{self.product_id}", headers=self.headers)
+    
+    def buyer(self, quantity=1):
+        """Register a user with the test product in the cart, return auth headers"""
+        response = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "email": f"test_checkout_{uuid.uuid4().hex[:12]}@example.com",
+            "password": "test123",
+            "name": "TEST Checkout buyer"
+        })
+        assert response.status_code == 200, response.text
+        self.user_ids.append(response.json()["user"]["id"])
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        requests.post(f"{BASE_URL}/api/cart/add", headers=headers, json={
+            "product_id": self.product_id,
+            "quantity": quantity
+        })
+        return headers
+    
+    def checkout(self, headers, key=None):
+        if key:
+            headers = {**headers, "Idempotency-Key": key}
+        response = requests.post(f"{BASE_URL}/api/orders", headers=headers, json=SHIPPING)
+        if response.status_code == 200:
+            self.order_ids.append(response.json()["id"])
+        return response
+    
+    def product_stock(self):
+        return requests.get(f"{BASE_URL}/api/products/{self.product_id}").json()["stock"]
+    
+    def test_concurrent_checkouts_do_not_oversell(self):
+        """Exactly STOCK of BUYERS concurrent checkouts succeed"""
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            buyers = list(pool.map(lambda _: self.buyer(), range(BUYERS)))
+        with ThreadPoolExecutor(max_workers=BUYERS) as pool:
+            statuses = [r.status_code for r in pool.map(self.checkout, buyers)]
+        
+        print(f"200: {statuses.count(200)}, 409: {statuses.count(409)}, stock left: {self.product_stock()}")
+        assert statuses.count(200) == STOCK
+        assert statuses.count(409) == BUYERS - STOCK
+        assert self.product_stock() == 0
+    
+    def test_idempotent_retry(self):
+        """Parallel and sequential retries with one key create one order"""
+        headers = self.buyer(quantity=2)
+        key = str(uuid.uuid4())
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            responses = list(pool.map(lambda _: self.checkout(headers, key), range(5)))
+        responses.append(self.checkout(headers, key))
+        
+        assert all(r.status_code == 200 for r in responses), [r.text for r in responses]
+        assert len({r.json()["id"] for r in responses}) == 1
+        assert self.product_stock() == STOCK - 2
+        orders = requests.get(f"{BASE_URL}/api/orders", headers=headers).json()
+        assert len(orders) == 1
+    
+    def test_insufficient_stock(self):
+        """Checkout above stock fails without touching stock or cart"""
+        headers = self.buyer(quantity=STOCK + 1)
+        response = self.checkout(headers)
+        assert response.status_code == 409
+        assert self.product_stock() == STOCK
+        cart = requests.get(f"{BASE_URL}/api/cart", headers=headers).json()
+        assert cart["items"][0]["quantity"] == STOCK + 1
+    
+    def test_order_changes_return_stock(self):
+        """Reserved stock follows the order: cancel returns it, reopen and edits take it again"""
+        headers = self.buyer(quantity=3)
+        order = self.checkout(headers).json()
+        assert self.product_stock() == STOCK - 3
+        
+        admin_order = f"{BASE_URL}/api/admin/orders/{order['id']}"
+        requests.put(f"{admin_order}/status", headers=self.headers, params={"status": "cancelled"})
+        requests.put(f"{admin_order}/status", headers=self.headers, params={"status": "cancelled"})
+        assert self.product_stock() == STOCK
+        
+        requests.put(f"{admin_order}/status", headers=self.headers, params={"status": "pending"})
+        assert self.product_stock() == STOCK - 3
+        
+        items = requests.get(admin_order, headers=self.headers).json()["items"]
+        items[0]["quantity"] = 1
+        requests.put(admin_order, headers=self.headers, json={"items": items})
+        assert self.product_stock() == STOCK - 1
+        
+        requests.delete(admin_order, headers=self.headers)
+        assert self.product_stock() == STOCK
+    
+    def test_reopen_after_sellout(self):
+        """A cancelled order cannot be reopened once its stock has gone to another buyer"""
+        order = self.checkout(self.buyer(quantity=3)).json()
+        admin_order = f"{BASE_URL}/api/admin/orders/{order['id']}"
+        requests.put(f"{admin_order}/status", headers=self.headers, params={"status": "cancelled"})
+        assert self.checkout(self.buyer(quantity=STOCK)).status_code == 200
+        assert self.product_stock() == 0
+        
+        response = requests.put(f"{admin_order}/status", headers=self.headers, params={"status": "pending"})
+        print(f"Reopen: {response.status_code} {response.text}")
+        assert response.status_code == 409
+        response = requests.put(admin_order, headers=self.headers, json={"status": "processing"})
+        assert response.status_code == 409
+        assert self.product_stock() == 0
+        assert requests.get(admin_order, headers=self.headers).json()["status"] == "cancelled"
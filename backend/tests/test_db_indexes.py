@@ -0,0 +1,43 @@
+"""
+Test suite for database indexes:
+1. Every hot query is served by an index (no COLLSCAN in the winning plan)
+2. Query plan endpoint is admin only
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestHotQueryPlans:
+    """Explain-plan checks for the queries listed in HOT_QUERIES"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+    
+    def test_query_plans_require_auth(self):
+        """Query plans are not available without a token"""
+        response = requests.get(f"{BASE_URL}/api/admin/db/query-plans")
+        assert response.status_code in [401, 403]
+    
+    def test_no_hot_query_uses_collscan(self):
+        """No hot query falls back to a collection scan"""
+        response = requests.get(f"{BASE_URL}/api/admin/db/query-plans", headers=self.headers)
+        assert response.status_code == 200
+        queries = response.json()["queries"]
+        assert len(queries) > 0
+        
+        for q in queries:
+            print(f"{q['name']} ({q['collection']}): {' -> '.join(q['stages'])}")
+        
+        collscans = [q["name"] for q in queries if q["collscan"]]
+        assert not collscans, f"Hot queries without an index: {collscans}"
@@ -0,0 +1,142 @@
+"""
+Test suite for the cross-worker event bus. Two MongoEventBus instances stand
+in for two uvicorn workers sharing a throwaway database (needs MONGO_URL):
+1. An event published by one worker reaches subscribers of both
+2. A worker that lost its connection catches up on the events it missed
+3. Topics are isolated
+4. A product written by another worker shows up in this worker's suggestions
+"""
+import pytest
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MONGO_URL'), reason="MONGO_URL not set")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from event_bus import MongoEventBus
+
+
+class TestMongoEventBus:
+    """Tests for MongoEventBus publish / subscribe across instances"""
+
+    def run(self, scenario):
+        """Run scenario(worker_a, worker_b) on a fresh client and test database"""
+        async def main():
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            db = mongo[f"{os.environ.get('DB_NAME', 'test')}_event_bus_test"]
+            await mongo.drop_database(db.name)
+            workers = [MongoEventBus(db, size=1024 * 1024), MongoEventBus(db, size=1024 * 1024)]
+            for worker in workers:
+                await worker.start()
+            print(f"Event bus mode: {workers[0].mode}")
+            try:
+                return await scenario(*workers)
+            finally:
+                for worker in workers:
+                    await worker.close()
+                await mongo.drop_database(db.name)
+        return asyncio.run(main())
+
+    async def receive(self, subscription, timeout=10):
+        return await asyncio.wait_for(subscription.get(), timeout)
+
+    def test_publish_reaches_all_workers(self):
+        """Both workers deliver an event, in publish order"""
+        async def scenario(a, b):
+            sub_a = a.subscribe("orders")
+            sub_b = b.subscribe("orders")
+            for n in range(3):
+                await a.publish("orders", {"type": "order.created", "n": n})
+            return [[(await self.receive(s))["n"] for _ in range(3)] for s in (sub_a, sub_b)]
+        received = self.run(scenario)
+
+        assert received == [[0, 1, 2], [0, 1, 2]]
+
+    def test_reconnect_does_not_lose_events(self):
+        """Events published while a worker is disconnected are delivered after it restarts"""
+        async def scenario(a, b):
+            subscription = b.subscribe("orders")
+            await a.publish("orders", {"n": 1})
+            first = await self.receive(subscription)
+
+            await b.close()
+            await a.publish("orders", {"n": 2})
+            await b.start()
+            await a.publish("orders", {"n": 3})
+            return [first, await self.receive(subscription), await self.receive(subscription)]
+        received = self.run(scenario)
+
+        print(f"Received: {received}")
+        assert [e["n"] for e in received] == [1, 2, 3]
+
+    def test_topics_are_isolated(self):
+        """A subscriber only gets the topics it subscribed to"""
+        async def scenario(a, b):
+            subscription = b.subscribe("chat_user:1")
+            await a.publish("chat_user:2", {"n": 1})
+            await a.publish("chat_user:1", {"n": 2})
+            event = await self.receive(subscription)
+            await asyncio.sleep(0.5)
+            return event, subscription.queue.qsize()
+        event, pending = self.run(scenario)
+
+        assert event == {"n": 2}
+        assert pending == 0
+
+
+class TestProductFanOut:
+    """Tests for follow_product_events: in-memory indexes follow other workers' writes"""
+
+    def test_other_worker_product_change(self):
+        """products.changed from another worker reloads the product; a deleted id is dropped"""
+        import server
+
+        async def main():
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            db = mongo[f"{os.environ.get('DB_NAME', 'test')}_product_fanout_test"]
+            other_worker = MongoEventBus(db)
+            server.db = db
+            server.event_bus = MongoEventBus(db)
+            await other_worker.start()
+            await server.event_bus.start()
+            follower = asyncio.create_task(server.follow_product_events())
+            try:
+                product = {"id": "TEST-fanout", "name": "TEST Ремень", "article": "TESTFAN-77"}
+                product.update(server.product_search_keys(product))
+                await db.products.insert_one(product)
+                await asyncio.sleep(0.1)  # follower subscribed
+                await other_worker.publish("products", {"type": "products.changed", "ids": ["TEST-fanout"], "origin": "other"})
+                found = await self.suggest_until(server, "testfan77", bool)
+
+                await db.products.delete_one({"id": "TEST-fanout"})
+                await other_worker.publish("products", {"type": "products.changed", "ids": ["TEST-fanout"], "origin": "other"})
+                gone = await self.suggest_until(server, "testfan77", lambda s: not s)
+                return found, gone
+            finally:
+                follower.cancel()
+                await other_worker.close()
+                await server.event_bus.close()
+                await mongo.drop_database(db.name)
+
+        original_db, original_bus = server.db, server.event_bus
+        try:
+            found, gone = asyncio.run(main())
+        finally:
+            server.db, server.event_bus = original_db, original_bus
+            server.drop_product_from_memory("TEST-fanout")
+
+        assert found[0]["product_ids"] == ["TEST-fanout"]
+        assert gone == []
+
+    async def suggest_until(self, server, query, condition, timeout=10):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            suggestions = server.suggest_index.suggest(query)
+            if condition(suggestions) or asyncio.get_running_loop().time() > deadline:
+                return suggestions
+            await asyncio.sleep(0.05)
@@ -0,0 +1,86 @@
+"""
+Test suite for the accounting order export:
+1. CSV has one line per order item and honours status / date filters (offsets normalised to UTC)
+2. XLSX export opens as a workbook
+3. Invalid parameters are rejected
+"""
+import pytest
+import requests
+import os
+import io
+from datetime import datetime, timedelta, timezone
+from openpyxl import load_workbook
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestOrderExport:
+    """Tests for GET /api/admin/orders/export"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+    
+    def export(self, **params):
+        return requests.get(f"{BASE_URL}/api/admin/orders/export", headers=self.headers, params=params)
+    
+    def test_export_requires_auth(self):
+        """Export is not available without a token"""
+        response = requests.get(f"{BASE_URL}/api/admin/orders/export")
+        assert response.status_code in [401, 403]
+    
+    def test_csv_one_line_per_item(self):
+        """Every item of every matching order becomes one CSV line"""
+        orders = requests.get(f"{BASE_URL}/api/admin/orders", headers=self.headers).json()
+        if not orders or len(orders) >= 1000:
+            pytest.skip("Need a non-empty, non-truncated order list")
+        
+        status = orders[0]["status"]
+        day = orders[0]["created_at"][:10]
+        expected = sum(
+            len(o.get("items", [])) for o in orders
+            if o["status"] == status and o["created_at"][:10] == day
+        )
+        
+        response = self.export(status=status, date_from=day, date_to=day)
+        assert response.status_code == 200
+        lines = response.content.decode("utf-8").splitlines()
+        print(f"{status} orders on {day}: {len(lines) - 1} lines, expected {expected}")
+        assert lines[0].startswith("order_id;created_at;status")
+        assert len(lines) - 1 == expected
+        assert all(f";{status};" in line for line in lines[1:])
+    
+    def test_date_with_offset(self):
+        """A bound with a UTC offset selects the same orders as the equivalent UTC bound"""
+        orders = requests.get(f"{BASE_URL}/api/admin/orders", headers=self.headers).json()
+        order = next((o for o in orders if o.get("items")), None)
+        if not order:
+            pytest.skip("Need an order with items")
+        
+        created_at = order["created_at"]
+        moscow = datetime.fromisoformat(created_at).astimezone(timezone(timedelta(hours=3))).isoformat()
+        utc_export = self.export(date_from=created_at, date_to=created_at)
+        offset_export = self.export(date_from=moscow, date_to=moscow)
+        assert offset_export.status_code == 200
+        assert order["id"] in offset_export.text
+        assert offset_export.content == utc_export.content
+    
+    def test_xlsx_export(self):
+        """XLSX export is a workbook with the same header"""
+        response = self.export(format="xlsx", date_from="2020-01-01")
+        assert response.status_code == 200
+        workbook = load_workbook(io.BytesIO(response.content), read_only=True)
+        header = next(workbook.active.iter_rows(values_only=True))
+        assert header[:3] == ("order_id", "created_at", "status")
+    
+    def test_invalid_parameters(self):
+        """Unknown format and malformed dates are rejected"""
+        assert self.export(format="pdf").status_code == 422
+        assert self.export(date_from="not-a-date").status_code == 400
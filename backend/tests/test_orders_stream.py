@@ -0,0 +1,149 @@
+"""
+Test suite for the admin orders SSE feed:
+1. The stream is opened with a short-lived, single-use ticket issued to admins
+2. A compact snapshot comes first, then order.created / order.updated / order.deleted
+3. Full order details are fetched separately
+"""
+import pytest
+import requests
+import os
+import json
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def read_event(lines):
+    """Next SSE event as (event type, data), skipping heartbeat comments"""
+    event_type, data = None, None
+    for line in lines:
+        if line.startswith(":"):
+            continue
+        if line.startswith("event: "):
+            event_type = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+        elif not line and event_type:
+            return event_type, data
+    pytest.fail("Stream ended")
+
+
+class TestOrdersStream:
+    """Tests for GET /api/admin/orders/stream and GET /api/admin/orders/{id}"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, create a test product in the cart"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+
+        response = requests.post(f"{BASE_URL}/api/products", headers=self.headers, json={
+            "name": "TEST Stream product",
+            "article": f"TEST-SSE-{uuid.uuid4().hex[:8]}",
+            "price": 100,
+            "stock": 10
+        })
+        assert response.status_code == 200
+        self.product_id = response.json()["id"]
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+        yield
+        requests.delete(f"{BASE_URL}/api/products/{self.product_id}", headers=self.headers)
+
+    def stream_ticket(self, headers=None):
+        response = requests.post(f"{BASE_URL}/api/admin/orders/stream-ticket", headers=headers or self.headers)
+        assert response.status_code == 200, response.text
+        return response.json()["ticket"]
+    
+    def open_stream(self, ticket=None):
+        response = requests.get(f"{BASE_URL}/api/admin/orders/stream", params={"ticket": ticket or self.stream_ticket()},
+                                stream=True, timeout=30)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        return response
+
+    def place_order(self):
+        requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+            "product_id": self.product_id,
+            "quantity": 2
+        })
+        response = requests.post(f"{BASE_URL}/api/orders", headers=self.headers, json={
+            "full_name": "TEST Stream", "address": "TEST", "phone": "+70000000000"
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    def test_stream_requires_ticket(self):
+        """No ticket, a bad ticket, the JWT itself or a used ticket are rejected"""
+        stream_url = f"{BASE_URL}/api/admin/orders/stream"
+        assert requests.get(stream_url).status_code == 422
+        assert requests.get(stream_url, params={"ticket": "invalid"}).status_code == 401
+        assert requests.get(stream_url, params={"ticket": self.token}).status_code == 401
+        
+        ticket = self.stream_ticket()
+        self.open_stream(ticket).close()
+        assert requests.get(stream_url, params={"ticket": ticket}).status_code == 401
+    
+    def test_ticket_requires_admin(self):
+        """Customers and anonymous requests get no ticket"""
+        assert requests.post(f"{BASE_URL}/api/admin/orders/stream-ticket").status_code in (401, 403)
+        response = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "email": f"test_stream_{uuid.uuid4().hex[:12]}@example.com",
+            "password": "test123",
+            "name": "TEST Stream customer"
+        })
+        assert response.status_code == 200
+        customer = response.json()
+        try:
+            response = requests.post(f"{BASE_URL}/api/admin/orders/stream-ticket",
+                                     headers={"Authorization": f"Bearer {customer['token']}"})
+            assert response.status_code == 403
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/users/{customer['user']['id']}", headers=self.headers)
+
+    def test_snapshot_then_events(self):
+        """Snapshot rows carry no items; each change arrives as one event"""
+        response = self.open_stream()
+        lines = response.iter_lines(decode_unicode=True)
+        try:
+            event_type, data = read_event(lines)
+            assert event_type == "snapshot"
+            print(f"Snapshot: {len(data['orders'])} orders")
+            assert all("items" not in order for order in data["orders"])
+
+            order_id = self.place_order()
+            event_type, order = read_event(lines)
+            assert event_type == "order.created"
+            assert order["id"] == order_id
+            assert order["items_count"] == 1
+            assert order["total"] == 200
+            assert "items" not in order
+
+            requests.put(f"{BASE_URL}/api/admin/orders/{order_id}/status", headers=self.headers,
+                         params={"status": "shipped"})
+            event_type, order = read_event(lines)
+            assert (event_type, order["id"], order["status"]) == ("order.updated", order_id, "shipped")
+
+            requests.delete(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+            event_type, order = read_event(lines)
+            assert (event_type, order["id"]) == ("order.deleted", order_id)
+        finally:
+            response.close()
+
+    def test_order_details(self):
+        """The full order with items is available by id"""
+        order_id = self.place_order()
+        try:
+            response = requests.get(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+            assert response.status_code == 200
+            items = response.json()["items"]
+            assert [(i["product_id"], i["quantity"]) for i in items] == [(self.product_id, 2)]
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+
+        response = requests.get(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+        assert response.status_code == 404
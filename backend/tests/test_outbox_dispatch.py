@@ -0,0 +1,170 @@
+"""
+Test suite for the Telegram notification outbox. Runs the dispatcher in-process
+against a local stub of the Bot API, in a throwaway database (needs MONGO_URL):
+1. Notifications are delivered once each, in creation order
+2. 429 responses are retried after retry_after by the gateway
+3. Persistent failures are dead-lettered after OUTBOX_MAX_ATTEMPTS
+4. A send that outlasts the lease is not picked up by a second dispatcher
+"""
+import pytest
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MONGO_URL'), reason="MONGO_URL not set")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telegram_gateway import TelegramGateway
+
+
+class StubTelegram(BaseHTTPRequestHandler):
+    """Records sendMessage calls; answers with the queued (status, body) responses, then 200"""
+    calls = []
+    responses = []
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubTelegram.calls.append({"path": self.path, **body})
+        status, payload = StubTelegram.responses.pop(0) if StubTelegram.responses else (200, {"ok": True})
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, *args):
+        pass
+
+
+def make_order(n):
+    return {"id": f"{n:08d}-test", "items": [], "total": n, "full_name": "TEST", "phone": "+7", "address": "TEST"}
+
+
+class TestOutboxDispatch:
+    """Tests for enqueue_order_notification / dispatch_outbox"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        """Setup - stub Bot API on a free port, fast dispatcher timings"""
+        import server
+        self.server = server
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubTelegram)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        StubTelegram.calls = []
+        StubTelegram.responses = []
+        self.api_url = f"http://127.0.0.1:{httpd.server_port}"
+        monkeypatch.setattr(server, "OUTBOX_POLL_SECONDS", 0.05)
+        monkeypatch.setattr(server, "OUTBOX_BACKOFF_BASE", 0.05)
+        yield
+        httpd.shutdown()
+    
+    def run(self, scenario):
+        """Run scenario(db) with the dispatcher going, on a fresh client and test database"""
+        server = self.server
+        
+        async def main():
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            db = mongo[f"{os.environ.get('DB_NAME', 'test')}_outbox_test"]
+            await db.settings.insert_one({"key": "telegram", "value": {"enabled": True, "bot_token": "TEST", "chat_id": "42"}})
+            server.db = db
+            server.outbox_wakeup = asyncio.Event()  # an Event is bound to the loop that first waits on it
+            server.telegram = TelegramGateway(self.api_url, per_chat_rate=100)  # all messages go to one chat
+            await server.telegram.start()
+            dispatcher = asyncio.create_task(server.dispatch_outbox())
+            try:
+                return await scenario(db)
+            finally:
+                dispatcher.cancel()
+                await server.telegram.close()
+                await mongo.drop_database(db.name)
+        
+        original_db = server.db
+        original_telegram = server.telegram
+        try:
+            return asyncio.run(main())
+        finally:
+            server.db = original_db
+            server.telegram = original_telegram
+    
+    async def wait_for(self, db, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if await condition():
+                return
+            await asyncio.sleep(0.05)
+        pytest.fail(f"Timed out; stub calls: {len(StubTelegram.calls)}")
+    
+    def test_delivery_in_order(self):
+        """Every notification is sent once, oldest first"""
+        async def scenario(db):
+            for n in range(20):
+                await self.server.enqueue_order_notification(make_order(n))
+            self.server.outbox_wakeup.set()
+            await self.wait_for(db, lambda: self.count(db, "sent", 20))
+        self.run(scenario)
+        
+        print(f"Stub received {len(StubTelegram.calls)} messages")
+        assert len(StubTelegram.calls) == 20
+        assert all(c["path"] == "/botTEST/sendMessage" and c["chat_id"] == "42" for c in StubTelegram.calls)
+        numbers = [int(c["text"].split("#")[1][:8]) for c in StubTelegram.calls]
+        assert numbers == list(range(20))
+    
+    def test_rate_limit_retry_after(self):
+        """A 429 is retried after the retry_after it carries"""
+        StubTelegram.responses = [(429, {"ok": False, "parameters": {"retry_after": 1}})]
+        
+        async def scenario(db):
+            await self.server.enqueue_order_notification(make_order(1))
+            self.server.outbox_wakeup.set()
+            started = time.monotonic()
+            await self.wait_for(db, lambda: self.count(db, "sent", 1))
+            return time.monotonic() - started
+        elapsed = self.run(scenario)
+        
+        assert len(StubTelegram.calls) == 2
+        assert elapsed >= 1
+    
+    def test_dead_letter(self, monkeypatch):
+        """Server errors are retried with backoff, then the message is dead-lettered"""
+        monkeypatch.setattr(self.server, "OUTBOX_MAX_ATTEMPTS", 3)
+        StubTelegram.responses = [(500, {"ok": False})] * 3
+        
+        async def scenario(db):
+            await self.server.enqueue_order_notification(make_order(1))
+            self.server.outbox_wakeup.set()
+            await self.wait_for(db, lambda: self.count(db, "dead", 1))
+            return await db.outbox.find_one({}, {"_id": 0})
+        message = self.run(scenario)
+        
+        assert len(StubTelegram.calls) == 3
+        assert message["attempts"] == 3
+        assert "500" in message["last_error"]
+    
+    def test_lease_renewed_during_slow_send(self, monkeypatch):
+        """A 429 wait longer than the lease does not let another dispatcher send the message again"""
+        monkeypatch.setattr(self.server, "OUTBOX_LEASE_SECONDS", 0.3)
+        StubTelegram.responses = [(429, {"ok": False, "parameters": {"retry_after": 1}})]
+        
+        async def scenario(db):
+            second = asyncio.create_task(self.server.dispatch_outbox())
+            try:
+                await self.server.enqueue_order_notification(make_order(1))
+                self.server.outbox_wakeup.set()
+                await self.wait_for(db, lambda: self.count(db, "sent", 1))
+                await asyncio.sleep(0.5)
+            finally:
+                second.cancel()
+        self.run(scenario)
+        
+        assert len(StubTelegram.calls) == 2  # the 429 and its retry, no second delivery
+    
+    async def count(self, db, status, expected):
+        return await db.outbox.count_documents({"status": status}) == expected
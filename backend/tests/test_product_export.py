@@ -0,0 +1,59 @@
+"""
+Test suite for the streaming product export:
+1. Export is admin only
+2. Header lists every column the import accepts
+3. gzip encoding when the client asks for it
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+EXPORT_COLUMNS = ['article', 'name', 'price', 'stock', 'delivery_days', 'description',
+                  'category_id', 'image_url', 'manufacturer', 'cross_articles', 'images']
+
+
+class TestProductExport:
+    """Tests for GET /api/admin/products/export"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+    
+    def test_export_requires_auth(self):
+        """Export is not available without a token"""
+        response = requests.get(f"{BASE_URL}/api/admin/products/export")
+        assert response.status_code in [401, 403]
+    
+    def test_export_columns_and_row_count(self):
+        """Header has all import columns and every product is exported"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/products/export",
+            headers={**self.headers, "Accept-Encoding": "identity"}
+        )
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+        lines = response.content.decode("utf-8").splitlines()
+        assert lines[0].split(";") == EXPORT_COLUMNS
+        
+        total = requests.get(f"{BASE_URL}/api/products", params={"paging": "cursor", "with_total": "true", "limit": 1}).json()["total"]
+        print(f"Exported {len(lines) - 1} lines for {total} products")
+        assert len(lines) - 1 >= total
+    
+    def test_export_gzip(self):
+        """Export is gzip-encoded when the client accepts gzip"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/products/export",
+            headers={**self.headers, "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert response.content.decode("utf-8").splitlines()[0].split(";") == EXPORT_COLUMNS
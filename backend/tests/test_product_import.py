@@ -0,0 +1,218 @@
+"""
+Test suite for the streaming CSV product import:
+1. Imported/updated/errors contract with Russian headers
+2. Re-import updates instead of duplicating
+3. Chunked import throughput
+4. Background import jobs: progress polling and cancellation
+5. XLSX import with a title block above the header row
+6. Unchanged rows are skipped, dry run reports a diff without writing
+7. Stock taken by an order is restored by the next import of the same feed
+"""
+import pytest
+import requests
+import os
+import io
+import time
+from openpyxl import Workbook
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+PREFIX = "TESTIMP"
+
+
+class TestProductImport:
+    """Tests for POST /api/admin/products/import"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token, remove test products afterwards"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        yield
+        response = requests.get(f"{BASE_URL}/api/admin/products/export", headers=self.headers)
+        for line in response.text.splitlines()[1:]:
+            if line.startswith(PREFIX):
+                product = self.find_by_article(line.split(";")[0])
+                if product:
+                    requests.delete(f"{BASE_URL}/api/products/{product['id']}", headers=self.headers)
+    
+    def find_by_article(self, article):
+        response = requests.get(f"{BASE_URL}/api/products/search-with-alternatives", params={"search": article})
+        exact = [p for p in response.json()["exact"] if p["article"] == article]
+        return exact[0] if exact else None
+    
+    def start_import(self, lines, **params):
+        content = "\n".join(lines).encode("utf-8-sig")
+        response = requests.post(
+            f"{BASE_URL}/api/admin/products/import",
+            headers=self.headers,
+            params=params,
+            files={"file": ("products.csv", content, "text/csv")}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+    
+    def wait_for_job(self, job_id, timeout=120):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            response = requests.get(f"{BASE_URL}/api/admin/import-jobs/{job_id}", headers=self.headers)
+            assert response.status_code == 200
+            job = response.json()
+            if job["status"] not in ["queued", "running"]:
+                return job
+            time.sleep(0.5)
+        pytest.fail(f"Import job {job_id} did not finish in {timeout}s")
+    
+    def upload(self, lines, **params):
+        job = self.start_import(lines, **params)
+        return self.wait_for_job(job["id"])
+    
+    def test_import_contract(self):
+        """New rows are imported, repeated articles updated, bad rows reported"""
+        data = self.upload([
+            "Артикул;Название;Цена;Остаток",
+            f"{PREFIX}-1;Фильтр масляный;1 250,50;4",
+            f"{PREFIX}-2;Фильтр воздушный;900;0",
+            f"{PREFIX}-1;Фильтр масляный (новый);1300;5",
+            ";Без артикула;100;1",
+        ], chunk_size=2)
+        assert data["status"] == "completed"
+        print(f"Import result: {data}")
+        assert data["imported"] == 2
+        assert data["updated"] == 1
+        assert data["total_errors"] == 1
+        assert data["errors"][0].startswith("Строка 5")
+        
+        data = self.upload([
+            "article;name;price;stock",
+            f"{PREFIX}-1;Фильтр масляный;1400;6",
+        ])
+        assert data["imported"] == 0
+        assert data["updated"] == 1
+        
+        product = self.find_by_article(f"{PREFIX}-1")
+        assert product["price"] == 1400
+        assert product["stock"] == 6
+    
+    def test_import_throughput(self):
+        """Thousands of rows go through the chunked upsert path"""
+        rows = 2000
+        lines = ["article;name;price;stock"] + [f"{PREFIX}-BULK-{i};Деталь {i};{i};1" for i in range(rows)]
+        start = time.time()
+        data = self.upload(lines, chunk_size=500)
+        elapsed = time.time() - start
+        print(f"{rows} rows in {elapsed:.1f}s ({data['rows_per_second']} rows/s in the worker)")
+        assert data["status"] == "completed"
+        assert data["imported"] + data["updated"] + data["unchanged"] == rows
+        assert data["total_errors"] == 0
+    
+    def test_import_job_cancel(self):
+        """A cancelled job stops and keeps the chunks it already wrote"""
+        lines = ["article;name;price;stock"] + [f"{PREFIX}-CANCEL-{i};Деталь {i};{i};1" for i in range(5000)]
+        job = self.start_import(lines, chunk_size=100)
+        assert job["status"] in ["queued", "running", "completed"]
+        
+        response = requests.post(f"{BASE_URL}/api/admin/import-jobs/{job['id']}/cancel", headers=self.headers)
+        assert response.status_code == 200
+        
+        job = self.wait_for_job(job["id"])
+        print(f"Job finished as {job['status']} after {job['rows_parsed']} rows")
+        assert job["status"] in ["cancelled", "completed"]
+        if job["status"] == "cancelled":
+            assert job["rows_written"] < 5000
+    
+    def test_xlsx_import(self):
+        """Header row is found below a title block, numeric cells are converted"""
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(["Прайс-лист поставщика"])
+        sheet.append([])
+        sheet.append(["Артикул", "Название", "Цена", "Остаток"])
+        sheet.append([f"{PREFIX}-X1", "Колодки тормозные", 2500.5, 3])
+        sheet.append([f"{PREFIX}-X2", "Диск тормозной", 4100, 0])
+        sheet.append([])
+        sheet.append([None, "Без артикула", 100, 1])
+        content = io.BytesIO()
+        workbook.save(content)
+        
+        response = requests.post(
+            f"{BASE_URL}/api/admin/products/import",
+            headers=self.headers,
+            files={"file": ("price.xlsx", content.getvalue(), "application/octet-stream")}
+        )
+        assert response.status_code == 200, response.text
+        data = self.wait_for_job(response.json()["id"])
+        print(f"XLSX import: {data}")
+        assert data["status"] == "completed"
+        assert data["imported"] + data["updated"] == 2
+        assert data["errors"] == ["Строка 7: отсутствует артикул или название"]
+        
+        product = self.find_by_article(f"{PREFIX}-X1")
+        assert product["price"] == 2500.5
+        assert product["stock"] == 3
+    
+    def test_unchanged_rows_skipped_and_dry_run(self):
+        """Re-importing the same rows writes nothing; dry run reports the diff only"""
+        lines = ["article;name;price;stock"] + [f"{PREFIX}-H{i};Деталь {i};{i};1" for i in range(5)]
+        data = self.upload(lines)
+        assert data["imported"] + data["updated"] + data["unchanged"] == 5
+        
+        data = self.upload(lines)
+        assert data["unchanged"] == 5
+        assert data["rows_written"] == 0
+        
+        changed = lines[:4] + [f"{PREFIX}-H0;Деталь 0;999;1", f"{PREFIX}-HNEW;Новая деталь;1;1"]
+        data = self.upload(changed, dry_run="true")
+        print(f"Dry run: {data}")
+        assert data["dry_run"] is True
+        assert data["imported"] == 1
+        assert data["updated"] == 1
+        assert data["unchanged"] == 2
+        assert data["rows_written"] == 0
+        assert data["missing"] >= 2
+        assert data["samples"]["new"] == [f"{PREFIX}-HNEW"]
+        assert self.find_by_article(f"{PREFIX}-HNEW") is None
+        assert self.find_by_article(f"{PREFIX}-H0")["price"] == 0
+    
+    def test_reimport_restores_ordered_stock(self):
+        """An order changes stock, so the same feed row is no longer skipped as unchanged"""
+        lines = ["article;name;price;stock", f"{PREFIX}-S1;Деталь со склада;100;5"]
+        self.upload(lines)
+        product = self.find_by_article(f"{PREFIX}-S1")
+        
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+        requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+            "product_id": product["id"],
+            "quantity": 2
+        })
+        response = requests.post(f"{BASE_URL}/api/orders", headers=self.headers, json={
+            "full_name": "TEST Import", "address": "TEST", "phone": "+70000000000"
+        })
+        assert response.status_code == 200, response.text
+        order_id = response.json()["id"]
+        try:
+            assert self.find_by_article(f"{PREFIX}-S1")["stock"] == 3
+            data = self.upload(lines)
+            print(f"Re-import after order: {data}")
+            assert data["updated"] == 1
+            assert self.find_by_article(f"{PREFIX}-S1")["stock"] == 5
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+    
+    def test_unsupported_format(self):
+        """Other file types are rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/products/import",
+            headers=self.headers,
+            files={"file": ("products.txt", b"article;name", "text/plain")}
+        )
+        assert response.status_code == 400
+    
+    def test_import_job_not_found(self):
+        """Unknown job id returns 404"""
+        response = requests.get(f"{BASE_URL}/api/admin/import-jobs/nonexistent", headers=self.headers)
+        assert response.status_code == 404
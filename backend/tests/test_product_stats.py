@@ -0,0 +1,105 @@
+"""
+Test suite for the product_stats popularity rollup:
+1. Rebuilt rollup matches an aggregation over the order history
+2. Incremental updates on order creation and cancellation
+3. /products/popular is ordered by units sold
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestProductStats:
+    """Tests for the product_stats rollup"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+    
+    def get_units_sold(self):
+        response = requests.get(f"{BASE_URL}/api/admin/product-stats?limit=1000", headers=self.headers)
+        assert response.status_code == 200
+        return {s["product_id"]: s["units_sold"] for s in response.json()["stats"]}
+    
+    def test_product_stats_require_admin(self):
+        """Product stats are not available without a token"""
+        response = requests.get(f"{BASE_URL}/api/admin/product-stats")
+        assert response.status_code in [401, 403]
+    
+    def test_rebuild_matches_order_aggregation(self):
+        """Rebuilt rollup equals units summed over non-cancelled orders"""
+        response = requests.post(f"{BASE_URL}/api/admin/product-stats/rebuild", headers=self.headers)
+        assert response.status_code == 200
+        print(response.json()["message"])
+        
+        response = requests.get(f"{BASE_URL}/api/admin/orders", headers=self.headers)
+        assert response.status_code == 200
+        orders = response.json()
+        if len(orders) >= 1000:
+            pytest.skip("Order list is truncated, cannot aggregate client-side")
+        
+        expected = {}
+        for order in orders:
+            if order.get("status") == "cancelled":
+                continue
+            for item in order.get("items", []):
+                expected[item["product_id"]] = expected.get(item["product_id"], 0) + item["quantity"]
+        
+        actual = {pid: units for pid, units in self.get_units_sold().items() if units}
+        print(f"Products with sales: {len(actual)}")
+        assert actual == expected
+    
+    def test_order_lifecycle_updates_stats(self):
+        """Creating an order adds its units, cancelling removes them"""
+        products = requests.get(f"{BASE_URL}/api/products?limit=1").json()
+        if not products:
+            pytest.skip("No products available")
+        product_id = products[0]["id"]
+        
+        before = self.get_units_sold().get(product_id, 0)
+        
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+        response = requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+            "product_id": product_id,
+            "quantity": 2
+        })
+        assert response.status_code == 200
+        response = requests.post(f"{BASE_URL}/api/orders", headers=self.headers, json={
+            "full_name": "TEST Stats",
+            "address": "Test address",
+            "phone": "+70000000000"
+        })
+        assert response.status_code == 200
+        order_id = response.json()["id"]
+        
+        assert self.get_units_sold().get(product_id, 0) == before + 2
+        
+        response = requests.put(
+            f"{BASE_URL}/api/admin/orders/{order_id}/status?status=cancelled",
+            headers=self.headers
+        )
+        assert response.status_code == 200
+        assert self.get_units_sold().get(product_id, 0) == before
+        
+        requests.delete(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+        assert self.get_units_sold().get(product_id, 0) == before
+    
+    def test_popular_products_sorted_by_units_sold(self):
+        """Popular products come back in descending units_sold order"""
+        response = requests.get(f"{BASE_URL}/api/products/popular?limit=10")
+        assert response.status_code == 200
+        products = response.json()
+        units = self.get_units_sold()
+        sold = [units.get(p["id"], 0) for p in products]
+        print(f"Popular: {[(p['name'], u) for p, u in zip(products, sold)]}")
+        if any(sold):
+            assert sold == sorted(sold, reverse=True)
@@ -0,0 +1,71 @@
+"""
+Test suite for frequently-bought-together recommendations:
+1. Rebuild is admin only
+2. Products ordered together show up first in /related
+3. /related still fills up from the category without order data
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestRecommendations:
+    """Tests for /products/{id}/related backed by product_recommendations"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - get admin token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "admin@avarus.ru",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        self.token = response.json()["token"]
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+    
+    def test_rebuild_requires_admin(self):
+        """Rebuild is not available without a token"""
+        response = requests.post(f"{BASE_URL}/api/admin/recommendations/rebuild")
+        assert response.status_code in [401, 403]
+    
+    def test_bought_together_ranked_first(self):
+        """A product ordered together with another is recommended for it"""
+        products = requests.get(f"{BASE_URL}/api/products?limit=2").json()
+        if len(products) < 2:
+            pytest.skip("Need at least two products")
+        first, second = products[0]["id"], products[1]["id"]
+        
+        requests.delete(f"{BASE_URL}/api/cart", headers=self.headers)
+        for product_id in (first, second):
+            response = requests.post(f"{BASE_URL}/api/cart/add", headers=self.headers, json={
+                "product_id": product_id,
+                "quantity": 1
+            })
+            assert response.status_code == 200
+        response = requests.post(f"{BASE_URL}/api/orders", headers=self.headers, json={
+            "full_name": "TEST Recommendations",
+            "address": "Test address",
+            "phone": "+70000000000"
+        })
+        assert response.status_code == 200
+        order_id = response.json()["id"]
+        
+        try:
+            response = requests.post(f"{BASE_URL}/api/admin/recommendations/rebuild", headers=self.headers)
+            assert response.status_code == 200
+            print(f"Rebuild: {response.json()}")
+            
+            response = requests.get(f"{BASE_URL}/api/products/{first}/related?limit=20")
+            assert response.status_code == 200
+            related_ids = [p["id"] for p in response.json()]
+            assert second in related_ids
+            assert first not in related_ids
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/orders/{order_id}", headers=self.headers)
+    
+    def test_related_unknown_product(self):
+        """Unknown product returns 404"""
+        response = requests.get(f"{BASE_URL}/api/products/nonexistent-product/related")
+        assert response.status_code == 404
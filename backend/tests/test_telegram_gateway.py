@@ -0,0 +1,133 @@
+"""
+Test suite for the Telegram gateway against a local stub of the Bot API:
+1. Per-chat and global rate limits are enforced
+2. A 429 pauses the bot for retry_after and the call is retried
+3. Errors carry the status code; counters and latency histograms are kept
+"""
+import pytest
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telegram_gateway import TelegramGateway, TelegramError
+
+
+class StubTelegram(BaseHTTPRequestHandler):
+    """Records calls with their arrival time; answers with the queued (status, body) responses, then 200"""
+    calls = []
+    responses = []
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        StubTelegram.calls.append({"path": self.path, "at": time.monotonic(), **body})
+        status, payload = StubTelegram.responses.pop(0) if StubTelegram.responses else (200, {"ok": True, "result": {}})
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, *args):
+        pass
+
+
+class TestTelegramGateway:
+    """Tests for TelegramGateway"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Setup - stub Bot API on a free port"""
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubTelegram)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        StubTelegram.calls = []
+        StubTelegram.responses = []
+        self.api_url = f"http://127.0.0.1:{httpd.server_port}"
+        yield
+        httpd.shutdown()
+    
+    def run(self, scenario, **options):
+        async def main():
+            gateway = TelegramGateway(self.api_url, **options)
+            await gateway.start()
+            try:
+                return await scenario(gateway)
+            finally:
+                await gateway.close()
+        return asyncio.run(main())
+    
+    def test_per_chat_rate(self):
+        """Messages to one chat are spaced by 1/per_chat_rate, other chats are not held up"""
+        async def scenario(gateway):
+            await asyncio.gather(*[gateway.send_message("T", "1", f"m{i}") for i in range(3)],
+                                 gateway.send_message("T", "2", "other"))
+        self.run(scenario, per_chat_rate=5)
+        
+        chat_1 = [c["at"] for c in StubTelegram.calls if c["chat_id"] == "1"]
+        chat_2 = [c["at"] for c in StubTelegram.calls if c["chat_id"] == "2"]
+        gaps = [b - a for a, b in zip(chat_1, chat_1[1:])]
+        print(f"Gaps between messages to one chat: {gaps}")
+        assert len(chat_1) == 3 and all(g >= 0.18 for g in gaps)
+        assert chat_2[0] < chat_1[1]
+    
+    def test_global_rate(self):
+        """Bursts above the global rate are spread out"""
+        async def scenario(gateway):
+            started = time.monotonic()
+            await asyncio.gather(*[gateway.send_message("T", str(i), "m") for i in range(30)])
+            return time.monotonic() - started
+        elapsed = self.run(scenario, global_rate=10)
+        
+        print(f"30 messages at 10/s took {elapsed:.2f}s")
+        assert elapsed >= 1.9  # a burst of 10, then 20 more at 10/s
+    
+    def test_retry_after(self):
+        """A 429 is retried after retry_after and other calls of the bot wait too"""
+        StubTelegram.responses = [(429, {"ok": False, "description": "Too Many Requests", "parameters": {"retry_after": 1}})]
+        
+        async def scenario(gateway):
+            first = asyncio.create_task(gateway.send_message("T", "1", "limited"))
+            await asyncio.sleep(0.2)
+            await gateway.send_message("T", "2", "queued")
+            await first
+            return gateway.metrics()
+        metrics = self.run(scenario)
+        
+        first, *rest = StubTelegram.calls
+        assert len(rest) == 2
+        assert all(c["at"] - first["at"] >= 0.9 for c in rest)
+        assert metrics["counters"]["sendMessage:rate_limited"] == 1
+        assert metrics["counters"]["sendMessage:ok"] == 2
+    
+    def test_errors_and_metrics(self):
+        """A 4xx is raised as a permanent TelegramError and counted"""
+        StubTelegram.responses = [(400, {"ok": False, "description": "Bad Request: chat not found"})]
+        
+        async def scenario(gateway):
+            with pytest.raises(TelegramError) as error:
+                await gateway.send_message("T", "1", "m")
+            await gateway.call("T", "setWebhook", {"url": "https://example.com"})
+            return error.value, gateway.metrics()
+        error, metrics = self.run(scenario)
+        
+        assert error.status_code == 400 and error.permanent
+        assert "chat not found" in error.description
+        assert StubTelegram.calls[1]["path"] == "/botT/setWebhook"
+        assert metrics["counters"] == {"sendMessage:error": 1, "setWebhook:ok": 1}
+        assert sum(metrics["latency"]["sendMessage"]) == 1
+    
+    def test_network_error(self):
+        """An unreachable API raises TelegramError without a status code"""
+        async def scenario(gateway):
+            with pytest.raises(TelegramError) as error:
+                await gateway.send_message("T", "1", "m")
+            return error.value
+        self.api_url = "http://127.0.0.1:1"
+        error = self.run(scenario)
+        assert error.status_code is None and not error.permanent
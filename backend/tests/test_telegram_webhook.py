@@ -0,0 +1,163 @@
+"""
+Test suite for queued Telegram webhook processing. Runs the app and the update
+consumer in-process against a slow local stub of the Bot API, in a throwaway
+database (needs MONGO_URL):
+1. The webhook acks in under 10ms although every Bot API call takes 500ms
+2. Redelivered updates are handled once, in update_id order
+3. /reply accepts a unique chat id prefix
+4. A retried update does not repeat its chat message
+"""
+import pytest
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MONGO_URL'), reason="MONGO_URL not set")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telegram_gateway import TelegramGateway
+
+STUB_DELAY = 0.5
+CHAT_ID = "a1b2c3d4-0000-4000-8000-000000000001"
+
+
+class SlowStubTelegram(BaseHTTPRequestHandler):
+    """Records calls and answers each one after STUB_DELAY"""
+    calls = []
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(STUB_DELAY)
+        SlowStubTelegram.calls.append(body)
+        data = b'{"ok": true, "result": {}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, *args):
+        pass
+
+
+def reply_update(update_id, chat_ref, text):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "chat": {"id": 777}, "text": f"/reply {chat_ref} {text}"
+    }}
+
+
+class TestTelegramWebhook:
+    """Tests for POST /api/telegram/chat-webhook and process_telegram_updates"""
+    
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        """Setup - slow stub Bot API on a free port, chat bot token"""
+        import server
+        self.server = server
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowStubTelegram)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        SlowStubTelegram.calls = []
+        self.api_url = f"http://127.0.0.1:{httpd.server_port}"
+        monkeypatch.setattr(server, "TELEGRAM_CHAT_BOT_TOKEN", "TEST")
+        yield
+        httpd.shutdown()
+    
+    def run(self, scenario):
+        """Run scenario(db, http) with the update consumer going, on a fresh client and test database"""
+        server = self.server
+        
+        async def main():
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            db = mongo[f"{os.environ.get('DB_NAME', 'test')}_webhook_test"]
+            await db.telegram_updates.create_index("update_id", unique=True)
+            await db.chats.insert_one({"id": CHAT_ID, "user_id": "TEST-user", "user_name": "TEST user", "updated_at": ""})
+            server.db = db
+            server.telegram_updates_wakeup = asyncio.Event()  # an Event is bound to the loop that first waits on it
+            server.telegram = TelegramGateway(self.api_url, per_chat_rate=100)
+            await server.telegram.start()
+            consumer = asyncio.create_task(server.process_telegram_updates())
+            transport = httpx.ASGITransport(app=server.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                    return await scenario(db, http)
+            finally:
+                consumer.cancel()
+                await server.telegram.close()
+                await mongo.drop_database(db.name)
+        
+        original_db, original_telegram = server.db, server.telegram
+        try:
+            return asyncio.run(main())
+        finally:
+            server.db, server.telegram = original_db, original_telegram
+    
+    async def wait_for_calls(self, count, timeout=15):
+        deadline = time.monotonic() + timeout
+        while len(SlowStubTelegram.calls) < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(STUB_DELAY * 2)  # let any unexpected extra call arrive
+    
+    def test_fast_ack_and_deduplication(self):
+        """Webhook acks fast; each update is handled once, in order"""
+        async def scenario(db, http):
+            latencies = []
+            for update_id in range(100, 105):
+                for _ in range(2):  # Telegram redelivers when we are slow
+                    started = time.perf_counter()
+                    response = await http.post("/api/telegram/chat-webhook", json=reply_update(update_id, CHAT_ID, f"m{update_id}"))
+                    latencies.append(time.perf_counter() - started)
+                    assert response.status_code == 200
+            await self.wait_for_calls(5)
+            messages = await db.chat_messages.find({"chat_id": CHAT_ID}, {"_id": 0}).sort("created_at", 1).to_list(None)
+            return latencies, messages
+        latencies, messages = self.run(scenario)
+        
+        print(f"Webhook latency: median {statistics.median(latencies) * 1000:.1f}ms, max {max(latencies) * 1000:.1f}ms")
+        assert statistics.median(latencies) < 0.01
+        assert [m["text"] for m in messages] == [f"m{i}" for i in range(100, 105)]
+        assert len(SlowStubTelegram.calls) == 5
+        assert [c["reply_to_message_id"] for c in SlowStubTelegram.calls] == list(range(100, 105))
+    
+    def test_reply_by_prefix(self):
+        """A unique 8-character prefix finds the chat, a shorter one does not"""
+        async def scenario(db, http):
+            await http.post("/api/telegram/chat-webhook", json=reply_update(1, CHAT_ID[:8], "by prefix"))
+            await http.post("/api/telegram/chat-webhook", json=reply_update(2, CHAT_ID[:4], "too short"))
+            await self.wait_for_calls(2)
+            return await db.chat_messages.find({}, {"_id": 0}).to_list(None)
+        messages = self.run(scenario)
+        
+        assert [m["text"] for m in messages] == ["by prefix"]
+        assert SlowStubTelegram.calls[0]["text"].startswith("✅")
+        assert SlowStubTelegram.calls[1]["text"].startswith("❌")
+    
+    def test_retry_after_partial_failure(self, monkeypatch):
+        """An update retried after its message was stored does not store it twice"""
+        publish = self.server.publish_chat_message
+        failures = [RuntimeError("publish failed")]
+        
+        async def flaky_publish(user_id, message):
+            if failures:
+                raise failures.pop()
+            await publish(user_id, message)
+        monkeypatch.setattr(self.server, "publish_chat_message", flaky_publish)
+        
+        async def scenario(db, http):
+            await http.post("/api/telegram/chat-webhook", json=reply_update(1, CHAT_ID, "once"))
+            await self.wait_for_calls(1)
+            return await db.chat_messages.find({}, {"_id": 0}).to_list(None)
+        messages = self.run(scenario)
+        
+        assert not failures
+        assert [m["text"] for m in messages] == ["once"]
+        assert len(SlowStubTelegram.calls) == 1
@@ -8,6 +8,8 @@ import { toast } from 'sonner';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const WS_URL = `${(BACKEND_URL || window.location.origin).replace(/^http/, 'ws')}/api/chat/ws`;
+const WS_RECONNECT_MAX_MS = 30000;
 
 // Normalize file URL - handle local uploads and Google Drive URLs
 const normalizeFileUrl = (fileUrl) => {
@@ -159,26 +161,88 @@ export const ChatWidget = () => {
   const [showEmoji, setShowEmoji] = useState(false);
   const [lightboxImage, setLightboxImage] = useState(null);
   const [lightboxVideo, setLightboxVideo] = useState(null);
+  const [wsConnected, setWsConnected] = useState(false);
   const messagesEndRef = useRef(null);
   const fileInputRef = useRef(null);
+  const isOpenRef = useRef(isOpen);
 
   useEffect(() => {
+    isOpenRef.current = isOpen;
     if (user && isOpen) {
       fetchMessages();
       markAsRead();
     }
   }, [user, isOpen]);
 
+  // Push channel; while it is connected the polling below is paused
   useEffect(() => {
-    if (user) {
+    if (!user) return;
+    let ws = null;
+    let retryTimer = null;
+    let retryDelay = 1000;
+    let closed = false;
+
+    const handleEvent = (event) => {
+      switch (event.type) {
+        case 'ready':
+          retryDelay = 1000;
+          setWsConnected(true);
+          setUnreadCount(event.unread);
+          if (isOpenRef.current) fetchMessages(); // catch up on anything missed while disconnected
+          break;
+        case 'message.created':
+          setMessages(prev => prev.some(m => m.id === event.message.id) ? prev : [...prev, event.message]);
+          if (isOpenRef.current && event.message.sender_type === 'admin') markAsRead();
+          break;
+        case 'message.updated':
+          setMessages(prev => prev.map(m => m.id === event.message_id
+            ? { ...m, text: event.text, edited: true, edited_at: event.edited_at } : m));
+          break;
+        case 'message.deleted':
+          setMessages(prev => prev.filter(m => m.id !== event.message_id));
+          break;
+        case 'unread':
+          setUnreadCount(isOpenRef.current ? 0 : event.count);
+          break;
+        case 'resync':
+          fetchUnreadCount();
+          if (isOpenRef.current) fetchMessages();
+          break;
+        default:
+          break;
+      }
+    };
+
+    const connect = () => {
+      ws = new WebSocket(WS_URL);
+      ws.onopen = () => ws.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('token') }));
+      ws.onmessage = (e) => handleEvent(JSON.parse(e.data));
+      ws.onclose = (e) => {
+        setWsConnected(false);
+        if (closed || e.code === 4401) return; // rejected token: stay on polling
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, WS_RECONNECT_MAX_MS);
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      ws?.close();
+    };
+  }, [user]);
+
+  useEffect(() => {
+    if (user && !wsConnected) {
       fetchUnreadCount();
       const interval = setInterval(() => {
         fetchUnreadCount();
         if (isOpen) fetchMessages();
-      }, 2000); // Poll every 2 seconds for real-time feel
+      }, 2000); // Fallback polling while the push channel is down
       return () => clearInterval(interval);
     }
-  }, [user, isOpen]);
+  }, [user, isOpen, wsConnected]);
 
   useEffect(() => {
     scrollToBottom();
@@ -224,7 +288,7 @@ export const ChatWidget = () => {
       await axios.post(`${API}/chat/send`, { text: newMessage });
       setNewMessage('');
       setShowEmoji(false);
-      fetchMessages();
+      if (!wsConnected) fetchMessages();
     } catch (err) {
       console.error('Failed to send message', err);
       toast.error('Ошибка отправки сообщения');
@@ -258,7 +322,7 @@ export const ChatWidget = () => {
         }
       });
 
-      fetchMessages();
+      if (!wsConnected) fetchMessages();
       toast.success('Файл отправлен');
     } catch (err) {
       console.error('Failed to upload file', err);
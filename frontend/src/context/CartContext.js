@@ -74,7 +74,7 @@ export const CartProvider = ({ children }) => {
     }
   };
 
-  const cartTotal = cart.items.reduce((sum, item) => sum + item.price * item.quantity, 0);
+  const cartTotal = cart.total ?? cart.items.reduce((sum, item) => sum + item.price * item.quantity, 0);
   const cartCount = cart.items.reduce((sum, item) => sum + item.quantity, 0);
 
   return (
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { 
@@ -23,7 +23,7 @@ const ORDER_STATUSES = [
 ];
 
 export default function AdminOrdersPage() {
-  const { user, loading: authLoading } = useAuth();
+  const { user, loading: authLoading, logout } = useAuth();
   const navigate = useNavigate();
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -32,6 +32,8 @@ export default function AdminOrdersPage() {
   const [viewingOrder, setViewingOrder] = useState(null);
   const [editingOrder, setEditingOrder] = useState(null);
   const [expandedOrders, setExpandedOrders] = useState({});
+  const [orderDetails, setOrderDetails] = useState({}); // id -> full order with items
+  const [streamKey, setStreamKey] = useState(0); // bump to reconnect the feed
 
   useEffect(() => {
     if (authLoading) return;
@@ -41,29 +43,90 @@ export default function AdminOrdersPage() {
     }
     if (user.role !== 'admin') {
       navigate('/');
-      return;
     }
-    fetchOrders();
   }, [user, authLoading, navigate]);
 
-  // Real-time polling for orders
+  // Live orders feed: a snapshot of order summaries, then one event per change.
+  // The stream is opened with a single-use ticket rather than the JWT, so
+  // EventSource cannot reconnect by itself: on any error the feed is closed and
+  // reopened later with a fresh ticket, unless the session has expired.
   useEffect(() => {
     if (!user || user.role !== 'admin') return;
     
-    const interval = setInterval(fetchOrders, 10000); // Poll every 10 seconds
-    return () => clearInterval(interval);
-  }, [user]);
+    let retryTimer = null;
+    let closed = false;
+    let source = null;
+    const reconnectLater = () => {
+      if (!closed) retryTimer = setTimeout(() => setStreamKey(k => k + 1), 5000);
+    };
+    const forgetDetails = (orderId) => setOrderDetails(prev => {
+      const { [orderId]: _, ...rest } = prev;
+      return rest;
+    });
+    
+    const connect = async () => {
+      let ticket;
+      try {
+        const res = await axios.post(`${API}/admin/orders/stream-ticket`);
+        ticket = res.data.ticket;
+      } catch (err) {
+        setLoading(false);
+        if (err.response?.status === 401) {
+          toast.error('Сессия истекла, войдите снова');
+          logout();
+        } else {
+          reconnectLater();
+        }
+        return;
+      }
+      if (closed) return;
+      
+      source = new EventSource(`${API}/admin/orders/stream?ticket=${encodeURIComponent(ticket)}`);
+      source.addEventListener('snapshot', (e) => {
+        setOrders(JSON.parse(e.data).orders);
+        setOrderDetails({});
+        setLoading(false);
+      });
+      source.addEventListener('order.created', (e) => {
+        const order = JSON.parse(e.data);
+        setOrders(prev => [order, ...prev.filter(o => o.id !== order.id)]);
+      });
+      source.addEventListener('order.updated', (e) => {
+        const order = JSON.parse(e.data);
+        setOrders(prev => prev.map(o => o.id === order.id ? order : o));
+        forgetDetails(order.id);
+      });
+      source.addEventListener('order.deleted', (e) => {
+        const order = JSON.parse(e.data);
+        setOrders(prev => prev.filter(o => o.id !== order.id));
+        forgetDetails(order.id);
+      });
+      source.onerror = () => {
+        setLoading(false);
+        source.close();
+        reconnectLater();
+      };
+    };
+    connect();
+    
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      source?.close();
+    };
+  }, [user, streamKey]);
 
-  const fetchOrders = async () => {
+  const fetchOrderDetails = useCallback(async (orderId) => {
+    if (orderDetails[orderId]) return orderDetails[orderId];
     try {
-      const res = await axios.get(`${API}/admin/orders`);
-      setOrders(res.data);
+      const res = await axios.get(`${API}/admin/orders/${orderId}`);
+      setOrderDetails(prev => ({ ...prev, [orderId]: res.data }));
+      return res.data;
     } catch (err) {
-      console.error('Failed to fetch orders', err);
-    } finally {
-      setLoading(false);
+      toast.error('Не удалось загрузить заказ');
+      return null;
     }
-  };
+  }, [orderDetails]);
 
   const formatPrice = (price) => new Intl.NumberFormat('ru-RU').format(price);
   const formatDate = (dateStr) => {
@@ -84,7 +147,6 @@ export default function AdminOrdersPage() {
   const handleStatusChange = async (orderId, newStatus) => {
     try {
       await axios.put(`${API}/admin/orders/${orderId}`, { status: newStatus });
-      setOrders(prev => prev.map(o => o.id === orderId ? { ...o, status: newStatus } : o));
       toast.success('Статус обновлён');
     } catch (err) {
       toast.error('Ошибка обновления статуса');
@@ -96,7 +158,6 @@ export default function AdminOrdersPage() {
     
     try {
       await axios.delete(`${API}/admin/orders/${orderId}`);
-      setOrders(prev => prev.filter(o => o.id !== orderId));
       toast.success('Заказ удалён');
     } catch (err) {
       toast.error('Ошибка удаления');
@@ -116,7 +177,7 @@ export default function AdminOrdersPage() {
         created_at: editingOrder.created_at,
         items: editingOrder.items
       });
-      setOrders(prev => prev.map(o => o.id === editingOrder.id ? res.data : o));
+      setOrderDetails(prev => ({ ...prev, [editingOrder.id]: res.data }));
       setEditingOrder(null);
       toast.success('Заказ обновлён');
     } catch (err) {
@@ -135,15 +196,21 @@ export default function AdminOrdersPage() {
   };
 
   const toggleExpand = (orderId) => {
+    if (!expandedOrders[orderId]) fetchOrderDetails(orderId);
     setExpandedOrders(prev => ({ ...prev, [orderId]: !prev[orderId] }));
   };
 
+  const openOrder = async (orderId, setter) => {
+    const order = await fetchOrderDetails(orderId);
+    if (order) setter({ ...order });
+  };
+
   // Filter orders
   const filteredOrders = orders.filter(order => {
     const matchesSearch = searchQuery === '' || 
       order.id?.toLowerCase().includes(searchQuery.toLowerCase()) ||
-      order.customer_name?.toLowerCase().includes(searchQuery.toLowerCase()) ||
-      order.customer_phone?.includes(searchQuery);
+      order.full_name?.toLowerCase().includes(searchQuery.toLowerCase()) ||
+      order.phone?.includes(searchQuery);
     
     const matchesStatus = statusFilter === 'all' || order.status === statusFilter;
     
@@ -175,7 +242,7 @@ export default function AdminOrdersPage() {
           <h1 className="text-2xl md:text-3xl font-bold tracking-tight uppercase text-zinc-900">
             Управление заказами
           </h1>
-          <Button variant="outline" size="sm" onClick={fetchOrders}>
+          <Button variant="outline" size="sm" onClick={() => setStreamKey(k => k + 1)}>
             <RefreshCw className="w-4 h-4 mr-2" />
             Обновить
           </Button>
@@ -276,7 +343,7 @@ export default function AdminOrdersPage() {
                           <div className="flex items-center gap-3 text-sm text-zinc-500 mt-1">
                             <span className="flex items-center gap-1">
                               <User className="w-3 h-3" />
-                              {order.customer_name}
+                              {order.full_name}
                             </span>
                             <span className="flex items-center gap-1">
                               <Calendar className="w-3 h-3" />
@@ -288,7 +355,7 @@ export default function AdminOrdersPage() {
                       <div className="flex items-center gap-4">
                         <div className="text-right">
                           <p className="font-bold text-lg">{formatPrice(order.total)} ₽</p>
-                          <p className="text-xs text-zinc-400">{order.items?.length || 0} товаров</p>
+                          <p className="text-xs text-zinc-400">{order.items_count || 0} товаров</p>
                         </div>
                         {isExpanded ? <ChevronUp className="w-5 h-5 text-zinc-400" /> : <ChevronDown className="w-5 h-5 text-zinc-400" />}
                       </div>
@@ -318,7 +385,10 @@ export default function AdminOrdersPage() {
                       <div className="p-4">
                         <p className="text-xs font-bold uppercase text-zinc-500 mb-2">Товары</p>
                         <div className="space-y-2">
-                          {order.items?.map((item, idx) => (
+                          {!orderDetails[order.id] && (
+                            <p className="text-sm text-zinc-400">Загрузка...</p>
+                          )}
+                          {orderDetails[order.id]?.items?.map((item, idx) => (
                             <div key={idx} className="flex items-center justify-between py-2 border-b border-zinc-100 last:border-0">
                               <div className="flex items-center gap-3">
                                 {item.image_url && (
@@ -356,7 +426,7 @@ export default function AdminOrdersPage() {
                           <Button 
                             variant="outline" 
                             size="sm"
-                            onClick={() => setViewingOrder(order)}
+                            onClick={() => openOrder(order.id, setViewingOrder)}
                           >
                             <Eye className="w-4 h-4 mr-1" />
                             Подробнее
@@ -364,7 +434,7 @@ export default function AdminOrdersPage() {
                           <Button 
                             variant="outline" 
                             size="sm"
-                            onClick={() => setEditingOrder({...order})}
+                            onClick={() => openOrder(order.id, setEditingOrder)}
                           >
                             <Pencil className="w-4 h-4 mr-1" />
                             Редактировать
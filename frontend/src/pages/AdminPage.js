@@ -115,6 +115,7 @@ export default function AdminPage() {
   const promoLeftFileRef = useRef(null);
   const promoRightFileRef = useRef(null);
   const importFileRef = useRef(null);
+  const importDryRunRef = useRef(false);
   const [editingCategory, setEditingCategory] = useState(null);
   const [isNewProduct, setIsNewProduct] = useState(false);
   const [isNewCategory, setIsNewCategory] = useState(false);
@@ -760,12 +761,29 @@ export default function AdminPage() {
       const formData = new FormData();
       formData.append('file', file);
       
-      const res = await axios.post(`${API}/admin/products/import`, formData, {
+      const dryRun = importDryRunRef.current;
+      const res = await axios.post(`${API}/admin/products/import${dryRun ? '?dry_run=true' : ''}`, formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
       
-      setImportResult(res.data);
-      toast.success(`Импортировано: ${res.data.imported}, Обновлено: ${res.data.updated}`);
+      // Import runs as a background job - poll its progress
+      let job = res.data;
+      setImportResult(job);
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await axios.get(`${API}/admin/import-jobs/${job.id}`)).data;
+        setImportResult(job);
+      }
+      
+      if (job.status === 'completed' && job.dry_run) {
+        toast.success(`Проверка: новых ${job.imported}, изменённых ${job.updated}, без изменений ${job.unchanged}`);
+      } else if (job.status === 'completed') {
+        toast.success(`Импортировано: ${job.imported}, Обновлено: ${job.updated}`);
+      } else if (job.status === 'cancelled') {
+        toast.info('Импорт отменён');
+      } else {
+        toast.error(job.error || 'Ошибка импорта');
+      }
       // Refresh products list to show imported items
       const productsRes = await axios.get(`${API}/products`);
       setProducts(productsRes.data);
@@ -773,10 +791,20 @@ export default function AdminPage() {
       toast.error(err.response?.data?.detail || 'Ошибка импорта');
     } finally {
       setUploading(false);
+      importDryRunRef.current = false;
       if (importFileRef.current) importFileRef.current.value = '';
     }
   };
 
+  const handleCancelImport = async () => {
+    if (!importResult?.id) return;
+    try {
+      await axios.post(`${API}/admin/import-jobs/${importResult.id}/cancel`);
+    } catch (err) {
+      toast.error('Не удалось отменить импорт');
+    }
+  };
+
   const handleExportProducts = () => {
     window.open(`${API}/admin/products/export`, '_blank');
   };
@@ -2375,7 +2403,7 @@ export default function AdminPage() {
               <div>
                 <h2 className="text-lg font-semibold mb-2">Импорт/Экспорт товаров</h2>
                 <p className="text-sm text-zinc-500">
-                  Загружайте товары из CSV файла или экспортируйте текущий каталог.
+                  Загружайте товары из CSV или Excel файла или экспортируйте текущий каталог.
                 </p>
               </div>
 
@@ -2387,29 +2415,57 @@ export default function AdminPage() {
                     Импорт товаров
                   </h3>
                   <p className="text-sm text-zinc-500 mb-4">
-                    CSV файл с разделителем ; (точка с запятой)
+                    CSV файл с разделителем ; (точка с запятой) или Excel (.xlsx)
                   </p>
                   <input
                     type="file"
                     ref={importFileRef}
                     onChange={handleImportProducts}
-                    accept=".csv"
+                    accept=".csv,.xlsx"
                     className="hidden"
                   />
                   <Button 
-                    onClick={() => importFileRef.current?.click()}
+                    onClick={() => { importDryRunRef.current = false; importFileRef.current?.click(); }}
                     disabled={uploading}
                     className="w-full"
                     variant="outline"
                   >
                     <Upload className="w-4 h-4 mr-2" />
-                    {uploading ? 'Загрузка...' : 'Выбрать CSV файл'}
+                    {uploading ? 'Загрузка...' : 'Выбрать CSV или XLSX файл'}
+                  </Button>
+                  <Button 
+                    onClick={() => { importDryRunRef.current = true; importFileRef.current?.click(); }}
+                    disabled={uploading}
+                    className="w-full mt-2"
+                    variant="ghost"
+                  >
+                    Проверить файл без записи
                   </Button>
 
                   {importResult && (
                     <div className="mt-4 p-3 bg-zinc-50 border border-zinc-200 text-sm">
-                      <p className="text-green-600">✓ Импортировано: {importResult.imported}</p>
-                      <p className="text-blue-600">↻ Обновлено: {importResult.updated}</p>
+                      {(importResult.status === 'queued' || importResult.status === 'running') && (
+                        <div className="flex items-center justify-between mb-2">
+                          <p className="text-zinc-600">
+                            Обработано строк: {importResult.rows_parsed} ({importResult.rows_per_second} строк/с)
+                          </p>
+                          <Button size="sm" variant="ghost" onClick={handleCancelImport}>
+                            Отменить
+                          </Button>
+                        </div>
+                      )}
+                      {importResult.status === 'cancelled' && (
+                        <p className="text-zinc-600 mb-2">Импорт отменён</p>
+                      )}
+                      {importResult.dry_run && (
+                        <p className="text-zinc-600 mb-2">Проверка без записи</p>
+                      )}
+                      <p className="text-green-600">✓ {importResult.dry_run ? 'Новых' : 'Импортировано'}: {importResult.imported}</p>
+                      <p className="text-blue-600">↻ {importResult.dry_run ? 'Изменённых' : 'Обновлено'}: {importResult.updated}</p>
+                      <p className="text-zinc-500">= Без изменений: {importResult.unchanged ?? 0}</p>
+                      {importResult.missing != null && (
+                        <p className="text-zinc-500">− Нет в файле: {importResult.missing}</p>
+                      )}
                       {importResult.total_errors > 0 && (
                         <>
                           <p className="text-red-600 mt-2">✕ Ошибок: {importResult.total_errors}</p>
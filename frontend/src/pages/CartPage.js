@@ -102,6 +102,12 @@ export default function CartPage() {
                 <p className="price-tag text-zinc-900 mt-1">
                   {formatPrice(item.price)} ₽
                 </p>
+                {item.availability === 'out_of_stock' && (
+                  <p className="text-xs text-red-600 mt-1">Нет в наличии</p>
+                )}
+                {item.availability === 'insufficient_stock' && (
+                  <p className="text-xs text-orange-600 mt-1">В наличии только {item.stock} шт.</p>
+                )}
               </div>
 
               {/* Quantity */}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
 import axios from 'axios';
 import { ArrowLeft, CheckCircle, Banknote, MessageSquare } from 'lucide-react';
@@ -19,6 +19,8 @@ export default function CheckoutPage() {
   const [loading, setLoading] = useState(false);
   const [success, setSuccess] = useState(false);
   const [orderId, setOrderId] = useState(null);
+  // One key per checkout attempt: a resubmit after a network error returns the same order
+  const idempotencyKeyRef = useRef(null);
   const [form, setForm] = useState({
     full_name: '',
     address: '',
@@ -47,6 +49,14 @@ export default function CheckoutPage() {
     }
   };
 
+  // crypto.randomUUID only exists in secure contexts (HTTPS or localhost)
+  const newIdempotencyKey = () => {
+    if (window.crypto?.randomUUID) {
+      return window.crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+  };
+
   const formatPrice = (price) => {
     return new Intl.NumberFormat('ru-RU').format(price);
   };
@@ -59,15 +69,25 @@ export default function CheckoutPage() {
       return;
     }
 
+    if (!idempotencyKeyRef.current) {
+      idempotencyKeyRef.current = newIdempotencyKey();
+    }
     setLoading(true);
     try {
-      const res = await axios.post(`${API}/orders`, form);
+      const res = await axios.post(`${API}/orders`, form, {
+        headers: { 'Idempotency-Key': idempotencyKeyRef.current }
+      });
       setOrderId(res.data.id);
       setSuccess(true);
       await fetchCart();
       toast.success('Заказ оформлен!');
     } catch (err) {
-      toast.error('Ошибка оформления заказа');
+      if (err.response?.status === 409) {
+        toast.error(err.response.data.detail);
+        await fetchCart();
+      } else {
+        toast.error('Ошибка оформления заказа');
+      }
     } finally {
       setLoading(false);
     }